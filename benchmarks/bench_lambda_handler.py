@@ -0,0 +1,208 @@
+"""Offline benchmark for lambda_handler against local Redshift and Secrets Manager stand-ins
+
+Reports cold start (module import plus first invocation, each in a fresh
+interpreter), warm invocation latency percentiles, throughput and memory.
+
+    python -m benchmarks.bench_lambda_handler --tables 5000 --warm-invocations 500
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, 'src'))
+
+from benchmarks import standins
+
+FUNCTIONS = ('check_table_metadata', 'check_tables_metadata', 'check_table_health')
+
+
+def make_event(function, parameters):
+    """Build a Bedrock action group event like the agent sends"""
+    return {
+        'messageVersion': '1.0',
+        'agent': {'name': 'benchmark', 'id': 'BENCH', 'alias': 'BENCH', 'version': 'DRAFT'},
+        'actionGroup': 'DEActionGroup',
+        'function': function,
+        'parameters': [{'name': name, 'type': 'string', 'value': value} for name, value in parameters.items()],
+        'sessionId': 'benchmark',
+        'sessionAttributes': {},
+        'promptSessionAttributes': {},
+        'inputText': 'benchmark'
+    }
+
+
+def build_events(cluster, functions, count, seed):
+    """Draw a reproducible mix of events over the stand-in catalog"""
+    rng = random.Random(seed)
+    tables = [f"{row[0]}.{row[1]}" for row in cluster.rows]
+    events = []
+    for _ in range(count):
+        function = rng.choice(functions)
+        if function == 'check_tables_metadata':
+            parameters = {'table_names': json.dumps(rng.sample(tables, min(10, len(tables))))}
+        else:
+            table = rng.choice(tables)
+            # Some questions use a near-miss name, which exercises fuzzy resolution
+            if rng.random() < 0.2:
+                table = table.split('.', 1)[1].replace('_', ' ')
+            parameters = {'table_name': table}
+        events.append(make_event(function, parameters))
+    return events
+
+
+def load_lambda_module(args):
+    """Import lambda_function wired to fresh stand-ins, returning the module and the cluster"""
+    os.environ.setdefault('SecretId', 'benchmark-secret')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ['MetricsMode'] = 'off'
+    # The stand-in cluster has no control table, coordinate ANALYZE in memory instead
+    os.environ.setdefault('LeaseStore', 'local')
+    os.environ.setdefault('HistoryStore', 'sqlite')
+    cluster = standins.StandInCluster(
+        table_count=args.tables,
+        connect_latency_ms=args.connect_latency_ms,
+        query_latency_ms=args.query_latency_ms,
+        analyze_latency_ms=args.analyze_latency_ms,
+        stale_fraction=args.stale_fraction
+    )
+    standins.install_redshift_connector(cluster)
+    sys.modules.pop('lambda_function', None)
+    lambda_function = importlib.import_module('lambda_function')
+    standins.install_aws_clients(
+        lambda_function,
+        standins.StandInSecretsManager(args.secret_latency_ms),
+        standins.StandInRedshiftData(args.query_latency_ms)
+    )
+    return lambda_function, cluster
+
+
+def invoke(lambda_function, event):
+    """Run one invocation with the handler's own logging silenced"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        lambda_function.lambda_handler(event, standins.StandInContext())
+        return (time.perf_counter() - started) * 1000
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+        'max': round(ordered[-1], 2)
+    }
+
+
+def run_cold_child(args):
+    """Measure one cold start in this (fresh) interpreter and print it as JSON"""
+    started = time.perf_counter()
+    lambda_function, cluster = load_lambda_module(args)
+    init_ms = (time.perf_counter() - started) * 1000
+    event = build_events(cluster, args.functions, 1, args.seed)[0]
+    first_ms = invoke(lambda_function, event)
+    print(json.dumps({'init_ms': init_ms, 'first_invocation_ms': first_ms}))
+
+
+def run_cold(args):
+    """Run cold starts in subprocesses so every one pays the full import cost"""
+    init, first = [], []
+    command = [sys.executable, '-m', 'benchmarks.bench_lambda_handler', '--cold-child'] + args.passthrough
+    for _ in range(args.cold_invocations):
+        output = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        init.append(sample['init_ms'])
+        first.append(sample['first_invocation_ms'])
+    return {'init_ms': percentiles(init), 'first_invocation_ms': percentiles(first)}
+
+
+def run_warm(args):
+    """Run the event mix against one warm module and measure latency, throughput and memory"""
+    lambda_function, cluster = load_lambda_module(args)
+    events = build_events(cluster, args.functions, args.warm_invocations, args.seed)
+    # The first call pays for the connection and the catalog load, keep it out of the warm numbers
+    invoke(lambda_function, events[0])
+    cluster.reset_counters()
+
+    tracemalloc.start()
+    latencies = []
+    started = time.perf_counter()
+    for event in events:
+        latencies.append(invoke(lambda_function, event))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'latency_ms': percentiles(latencies),
+        'throughput_per_second': round(len(events) / elapsed, 1),
+        'peak_traced_memory_mb': round(peak / 1024 / 1024, 2),
+        'cluster_calls': dict(cluster.counters)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tables', type=int, default=1000, help='rows in the fake svv_table_info')
+    parser.add_argument('--stale-fraction', type=float, default=0.1, help='share of tables over the stats_off threshold')
+    parser.add_argument('--connect-latency-ms', type=float, default=150)
+    parser.add_argument('--query-latency-ms', type=float, default=20)
+    parser.add_argument('--analyze-latency-ms', type=float, default=500)
+    parser.add_argument('--secret-latency-ms', type=float, default=30)
+    parser.add_argument('--functions', nargs='+', choices=FUNCTIONS, default=list(FUNCTIONS))
+    parser.add_argument('--cold-invocations', type=int, default=5)
+    parser.add_argument('--warm-invocations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--cold-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # Cold start subprocesses get the same stand-in settings
+    args.passthrough = [
+        '--tables', str(args.tables), '--stale-fraction', str(args.stale_fraction),
+        '--connect-latency-ms', str(args.connect_latency_ms), '--query-latency-ms', str(args.query_latency_ms),
+        '--analyze-latency-ms', str(args.analyze_latency_ms), '--secret-latency-ms', str(args.secret_latency_ms),
+        '--seed', str(args.seed), '--functions'
+    ] + list(args.functions)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cold_child:
+        run_cold_child(args)
+        return
+
+    report = {'cold': run_cold(args), 'warm': run_warm(args)}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Stand-in catalog: {args.tables} tables, functions: {', '.join(args.functions)}")
+    print(f"Cold init (ms):            {report['cold']['init_ms']}")
+    print(f"Cold first invocation (ms): {report['cold']['first_invocation_ms']}")
+    print(f"Warm invocation (ms):      {report['warm']['latency_ms']}")
+    print(f"Warm throughput:           {report['warm']['throughput_per_second']} invocations/s")
+    print(f"Peak traced memory:        {report['warm']['peak_traced_memory_mb']} MB")
+    print(f"Cluster calls while warm:  {report['warm']['cluster_calls']}")
+
+
+if __name__ == "__main__":
+    main()
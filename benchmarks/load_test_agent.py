@@ -0,0 +1,229 @@
+"""Concurrent load test for the deployed agent through invoke_agent
+
+Runs a weighted query mix across many sessions at once, consumes each full
+event stream and reports time-to-first-chunk, end-to-end latency, trace step
+counts, Lambda (action group) time, latency histograms and throughput.
+
+    python -m benchmarks.load_test_agent --sessions 20 --concurrency 10
+    python -m benchmarks.load_test_agent --offline --sessions 50 --concurrency 25
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import standins
+from benchmarks.bench_lambda_handler import REPO_ROOT, percentiles
+
+# (weight, query); weights roughly follow what on-call asks during an incident
+QUERY_MIX = [
+    (4, "Check table statistics for splittest table"),
+    (2, "What is the health of the sales.orders table? Does it need a vacuum?"),
+    (2, "Which tables in the public schema have stale statistics?"),
+    (1, "Analyze all stale tables in the analytics schema"),
+    (1, "Check the status of my last analyze"),
+]
+
+HISTOGRAM_BUCKETS_MS = [250, 500, 1000, 2000, 4000, 8000, 15000, 30000, 60000]
+
+
+def load_query_mix(path):
+    """Read a query mix from a JSON file of [weight, query] pairs or plain query strings"""
+    with open(path) as f:
+        entries = json.load(f)
+    return [tuple(entry) if isinstance(entry, list) else (1, entry) for entry in entries]
+
+
+def event_seconds(trace, arrived):
+    """Server-side event time of a trace event when present, else when it arrived here"""
+    event_time = trace.get('eventTime')
+    return event_time.timestamp() if hasattr(event_time, 'timestamp') else arrived
+
+
+def invoke_once(client, agent_id, agent_alias_id, session_id, query):
+    """Send one query and consume the whole event stream, returning its timings"""
+    result = {'query': query, 'session_id': session_id, 'chunks': 0, 'trace_steps': 0,
+              'model_calls': 0, 'action_calls': 0, 'lambda_ms': 0.0, 'first_chunk_ms': None, 'error': None}
+    started = time.perf_counter()
+    action_started = None
+    try:
+        response = client.invoke_agent(
+            inputText=query,
+            agentId=agent_id,
+            agentAliasId=agent_alias_id,
+            sessionId=session_id,
+            enableTrace=True,
+            endSession=False
+        )
+        for event in response['completion']:
+            arrived = time.perf_counter()
+            if 'chunk' in event:
+                result['chunks'] += 1
+                if result['first_chunk_ms'] is None:
+                    result['first_chunk_ms'] = (arrived - started) * 1000
+            elif 'trace' in event:
+                trace = event['trace']
+                step = trace.get('trace', {}).get('orchestrationTrace', {})
+                result['trace_steps'] += 1
+                if 'modelInvocationInput' in step:
+                    result['model_calls'] += 1
+                if 'actionGroupInvocationInput' in step.get('invocationInput', {}):
+                    result['action_calls'] += 1
+                    action_started = event_seconds(trace, arrived)
+                if 'actionGroupInvocationOutput' in step.get('observation', {}) and action_started is not None:
+                    result['lambda_ms'] += (event_seconds(trace, arrived) - action_started) * 1000
+                    action_started = None
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['total_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def run_session(client, agent_id, agent_alias_id, queries):
+    """Run several turns one after another in the same session, like a user following up"""
+    session_id = str(uuid.uuid4())
+    return [invoke_once(client, agent_id, agent_alias_id, session_id, query) for query in queries]
+
+
+def histogram(samples, buckets=HISTOGRAM_BUCKETS_MS, width=40):
+    """Render a text histogram of latencies over fixed millisecond buckets"""
+    if not samples:
+        return "  (no samples)"
+    counts = [0] * (len(buckets) + 1)
+    for sample in samples:
+        counts[next((i for i, bound in enumerate(buckets) if sample <= bound), len(buckets))] += 1
+    scale = width / max(counts)
+    lines = []
+    lower = 0
+    for i, count in enumerate(counts):
+        label = f"{lower}-{buckets[i]}" if i < len(buckets) else f">{buckets[-1]}"
+        lines.append(f"  {label:>12} ms | {'#' * round(count * scale):<{width}} {count}")
+        lower = buckets[i] if i < len(buckets) else lower
+    return "\n".join(lines)
+
+
+def summarize(results, elapsed):
+    ok = [r for r in results if not r['error']]
+    errors = {}
+    for r in results:
+        if r['error']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+    return {
+        'requests': len(results),
+        'failed': len(results) - len(ok),
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_per_second': round(len(ok) / elapsed, 2) if elapsed else None,
+        'first_chunk_ms': percentiles([r['first_chunk_ms'] for r in ok if r['first_chunk_ms'] is not None]),
+        'total_ms': percentiles([r['total_ms'] for r in ok]),
+        'lambda_ms': percentiles([r['lambda_ms'] for r in ok if r['action_calls']]),
+        'trace_steps': percentiles([r['trace_steps'] for r in ok]),
+        'action_calls': percentiles([r['action_calls'] for r in ok]),
+    }
+
+
+def make_client(args):
+    """Real bedrock-agent-runtime client sized for the concurrency, or the offline stand-in"""
+    if args.offline:
+        return standins.StandInAgentRuntime(
+            model_latency_ms=args.model_latency_ms,
+            lambda_latency_ms=args.lambda_latency_ms,
+            failure_rate=args.failure_rate,
+            seed=args.seed
+        ), 'OFFLINE', 'OFFLINE'
+
+    from botocore.config import Config
+    sys.path.append(REPO_ROOT)
+    from src.config import config
+
+    # The default pool of 10 connections would queue requests on our side and skew the numbers
+    client = config.session.client('bedrock-agent-runtime', config=Config(
+        max_pool_connections=max(10, args.concurrency),
+        read_timeout=args.read_timeout,
+        retries={'max_attempts': 1 if args.no_retries else 3, 'mode': 'standard'}
+    ))
+    return client, args.agent_id or config.agent_id, args.agent_alias_id or config.agent_alias_id
+
+
+def run_load(args):
+    client, agent_id, agent_alias_id = make_client(args)
+    mix = load_query_mix(args.queries) if args.queries else QUERY_MIX
+    rng = random.Random(args.seed)
+    weights = [weight for weight, _ in mix]
+    plans = [[query for _, query in rng.choices(mix, weights=weights, k=args.turns)] for _ in range(args.sessions)]
+
+    results = []
+    lock = threading.Lock()
+
+    def session(queries):
+        turns = run_session(client, agent_id, agent_alias_id, queries)
+        with lock:
+            results.extend(turns)
+            if not args.json:
+                print(f"  session done ({len(results)}/{args.sessions * args.turns} requests)", file=sys.stderr)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in executor.map(session, plans):
+            pass
+    return results, time.perf_counter() - started
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=10, help='number of agent sessions')
+    parser.add_argument('--turns', type=int, default=1, help='queries per session, sent one after another')
+    parser.add_argument('--concurrency', type=int, default=5, help='sessions running at the same time')
+    parser.add_argument('--queries', help='JSON file with [weight, query] pairs replacing the built-in mix')
+    parser.add_argument('--agent-id', help='defaults to the cached agent ID from src/config.py')
+    parser.add_argument('--agent-alias-id', help='defaults to the cached alias ID from src/config.py')
+    parser.add_argument('--read-timeout', type=int, default=300)
+    parser.add_argument('--no-retries', action='store_true', help='surface throttling instead of retrying')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--raw', help='write every request result as JSON lines to this file')
+    offline = parser.add_argument_group('offline stand-in')
+    offline.add_argument('--offline', action='store_true', help='use a local stand-in instead of Bedrock')
+    offline.add_argument('--model-latency-ms', type=float, default=400)
+    offline.add_argument('--lambda-latency-ms', type=float, default=250)
+    offline.add_argument('--failure-rate', type=float, default=0.0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results, elapsed = run_load(args)
+    report = summarize(results, elapsed)
+
+    if args.raw:
+        with open(args.raw, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    ok = [r for r in results if not r['error']]
+    print(f"{report['requests']} requests over {args.sessions} sessions at concurrency {args.concurrency}"
+          f"{' (offline stand-in)' if args.offline else ''}")
+    print(f"Elapsed: {report['elapsed_seconds']}s, throughput: {report['throughput_per_second']} requests/s, "
+          f"failed: {report['failed']}")
+    for error, count in report['errors'].items():
+        print(f"  {count} x {error}")
+    print(f"Time to first chunk (ms): {report['first_chunk_ms']}")
+    print(f"End-to-end latency (ms):  {report['total_ms']}")
+    print(f"Lambda time (ms):         {report['lambda_ms']}")
+    print(f"Trace steps per request:  {report['trace_steps']}")
+    print(f"Action calls per request: {report['action_calls']}")
+    print("Time to first chunk histogram:")
+    print(histogram([r['first_chunk_ms'] for r in ok if r['first_chunk_ms'] is not None]))
+    print("End-to-end latency histogram:")
+    print(histogram([r['total_ms'] for r in ok]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Local stand-ins for redshift_connector, Secrets Manager, the Redshift Data API and the agent runtime
+
+They let lambda_function run on a laptop without a cluster. The fake
+svv_table_info holds a configurable number of tables, and every call sleeps
+for a configurable latency so cold and warm paths cost roughly what they do
+against a real cluster.
+"""
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+
+SCHEMAS = ['public', 'sales', 'analytics', 'staging']
+
+
+def build_svv_table_info(table_count, stale_fraction=0.1, seed=42):
+    """Generate rows shaped like lambda_function.TABLE_HEALTH_QUERY results"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(table_count):
+        stale = rng.random() < stale_fraction
+        tbl_rows = rng.randint(1_000, 5_000_000_000)
+        rows.append((
+            SCHEMAS[i % len(SCHEMAS)],
+            f"table_{i:05d}",
+            100_000 + i,
+            round(rng.uniform(11, 90), 2) if stale else round(rng.uniform(0, 9), 2),
+            round(rng.uniform(0, 40), 2),
+            round(rng.uniform(1, 6), 2),
+            round(rng.uniform(1, 5), 2),
+            tbl_rows,
+            int(tbl_rows * rng.uniform(0.8, 1.0)),
+            max(1, tbl_rows // 1_000_000),
+            rng.choice(['Y', 'N']),
+            rng.choice(['EVEN', 'KEY(id)', 'AUTO(ALL)']),
+            rng.choice(['id', 'event_ts', None])
+        ))
+    return rows
+
+
+def build_scan_activity(rows, seed=42):
+    """Generate per-table scan counts shaped like the stl_scan aggregate, most tables rarely scanned"""
+    rng = random.Random(seed)
+    activity = []
+    for row in rows:
+        if rng.random() < 0.6:
+            scans = int(rng.paretovariate(1.2))
+            activity.append((row[2], scans, scans * rng.randint(1_000, 10_000_000)))
+    return activity
+
+
+class StandInCluster:
+    """Shared state of the fake cluster: its catalog, latencies and call counters"""
+
+    def __init__(self, table_count=1000, connect_latency_ms=150, query_latency_ms=20,
+                 analyze_latency_ms=500, stale_fraction=0.1, seed=42):
+        self.rows = build_svv_table_info(table_count, stale_fraction, seed)
+        self.scan_rows = build_scan_activity(self.rows, seed)
+        # Every third table has ANALYZE history as long as the stand-in ANALYZE takes
+        self.maintenance_rows = [('ANALYZE', row[2], 3, analyze_latency_ms / 1000, row[7]) for row in self.rows[::3]]
+        self.connect_latency_ms = connect_latency_ms
+        self.query_latency_ms = query_latency_ms
+        self.analyze_latency_ms = analyze_latency_ms
+        self.counters = {'connect': 0, 'query': 0, 'maintenance': 0}
+        # table_id -> svv_transactions rows of other sessions locking it
+        self.locks = {}
+        # Queries waiting in the user WLM queues, raise it to simulate a saturated cluster
+        self.wlm_queued = 0
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {name: 0 for name in self.counters}
+
+    def slow_query_rows(self, statement):
+        """Answer the slow query diagnosis statements with a small fixed workload"""
+        if 'PERCENTILE_CONT' in statement:
+            return [(40, 5200.0, 31000.0, 64000, 48000, 6, 9, 3, 1)]
+        if 'ELAPSED_RANK' in statement:
+            return [
+                (1000 + i, 64000 - i * 7000, 2000 * (i % 3), int(i % 4 == 0), 2, int(i % 2 == 0), int(i == 1), 0,
+                 '2026-01-01 00:00:00', 'select region, sum(amount) from sales.table_00001 ' * 6, i + 1, 12 - i, 1, i + 1)
+                for i in range(12)
+            ]
+        return [('Nested Loop Join in the query plan', 'Review the join predicates', 4),
+                ('Missing query planner statistics', 'Run the ANALYZE command', 3)]
+
+    def execute(self, sql, args=None):
+        statement = sql.strip().upper()
+        if statement.startswith(('ANALYZE', 'VACUUM')):
+            self.count('maintenance')
+            time.sleep(self.analyze_latency_ms / 1000)
+            return []
+        if statement.startswith(('SET', 'RESET')):
+            return []
+        self.count('query')
+        time.sleep(self.query_latency_ms / 1000)
+        if 'SVV_TABLE_INFO' in statement:
+            # Maintenance lowers stats_off on the real cluster; the stand-in keeps it constant
+            return list(self.rows)
+        if 'SVV_TRANSACTIONS' in statement:
+            return list(self.locks.get(args[0], []))
+        if 'PER_QUERY' in statement:
+            return self.slow_query_rows(statement)
+        if 'STV_WLM_QUERY_STATE' in statement:
+            return [(self.wlm_queued, 3, 12.5 if self.wlm_queued else 0)]
+        if 'STL_WLM_QUERY' in statement:
+            return [(1, 0.0, self.analyze_latency_ms / 1000)]
+        if 'STL_ANALYZE' in statement:
+            return list(self.maintenance_rows)
+        if 'STL_SCAN' in statement:
+            return list(self.scan_rows)
+        if statement.startswith('SELECT 1'):
+            return [(1,)]
+        return []
+
+
+class StandInCursor:
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self._rows = []
+
+    def execute(self, sql, args=None):
+        self._rows = self.cluster.execute(sql, args)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class StandInConnection:
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.autocommit = False
+
+    def cursor(self):
+        return StandInCursor(self.cluster)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StandInSecretsManager:
+    def __init__(self, latency_ms=30):
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def get_secret_value(self, SecretId):
+        self.calls += 1
+        time.sleep(self.latency_ms / 1000)
+        return {
+            'ARN': f"arn:aws:secretsmanager:us-east-1:000000000000:secret:{SecretId}",
+            'VersionId': 'standin-v1',
+            'SecretString': json.dumps({
+                'host': 'standin.local',
+                'port': 5439,
+                'username': 'standin',
+                'password': 'standin',
+                'dbClusterIdentifier': 'standin-cluster'
+            })
+        }
+
+
+class StandInRedshiftData:
+    def __init__(self, latency_ms=40):
+        self.latency_ms = latency_ms
+        self.statements = {}
+
+    def _submit(self, sql):
+        time.sleep(self.latency_ms / 1000)
+        statement_id = str(uuid.uuid4())
+        self.statements[statement_id] = sql
+        return {'Id': statement_id}
+
+    def execute_statement(self, Sql, **kwargs):
+        return self._submit(Sql)
+
+    def batch_execute_statement(self, Sqls, **kwargs):
+        return self._submit(';'.join(Sqls))
+
+    def describe_statement(self, Id):
+        time.sleep(self.latency_ms / 1000)
+        return {'Id': Id, 'Status': 'FINISHED', 'Duration': 1_000_000_000, 'QueryString': self.statements.get(Id)}
+
+
+def install_redshift_connector(cluster):
+    """Register a fake redshift_connector module whose connect() talks to the stand-in cluster"""
+    module = types.ModuleType('redshift_connector')
+
+    def connect(**kwargs):
+        cluster.count('connect')
+        time.sleep(cluster.connect_latency_ms / 1000)
+        return StandInConnection(cluster)
+
+    module.connect = connect
+    module.paramstyle = 'format'
+    module.Error = Exception
+    sys.modules['redshift_connector'] = module
+    return module
+
+
+def install_aws_clients(lambda_module, secrets_manager, redshift_data):
+    """Point an imported lambda_function at the stand-in AWS clients"""
+    lambda_module._secrets_client = secrets_manager
+    lambda_module._redshift_data_client = redshift_data
+
+
+class StandInContext:
+    """Minimal Lambda context with a fixed time budget"""
+
+    def __init__(self, timeout_ms=180_000):
+        self.deadline = time.monotonic() + timeout_ms / 1000
+        self.aws_request_id = str(uuid.uuid4())
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+class StandInAgentRuntime:
+    """Fake bedrock-agent-runtime client whose invoke_agent streams events like a real agent
+
+    Each response is a model step, an action group call that takes
+    lambda_latency_ms, a final model step and the answer split into chunks.
+    failure_rate makes that share of calls raise like a throttled API would.
+    """
+
+    def __init__(self, model_latency_ms=400, lambda_latency_ms=250, chunk_count=3,
+                 chunk_latency_ms=20, failure_rate=0.0, seed=42):
+        self.model_latency_ms = model_latency_ms
+        self.lambda_latency_ms = lambda_latency_ms
+        self.chunk_count = chunk_count
+        self.chunk_latency_ms = chunk_latency_ms
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _jitter(self, latency_ms):
+        with self._lock:
+            return latency_ms * self._rng.uniform(0.7, 1.5) / 1000
+
+    def _trace(self, session_id, step):
+        return {'trace': {
+            'sessionId': session_id,
+            'eventTime': datetime.datetime.now(datetime.timezone.utc),
+            'trace': {'orchestrationTrace': step}
+        }}
+
+    def _events(self, inputText, sessionId):
+        time.sleep(self._jitter(self.model_latency_ms))
+        yield self._trace(sessionId, {'modelInvocationInput': {'text': inputText}})
+        yield self._trace(sessionId, {'rationale': {'text': 'Look up the table statistics'}})
+        yield self._trace(sessionId, {'invocationInput': {'actionGroupInvocationInput': {
+            'actionGroupName': 'DEActionGroup', 'function': 'check_table_metadata'}}})
+        time.sleep(self._jitter(self.lambda_latency_ms))
+        yield self._trace(sessionId, {'observation': {'type': 'ACTION_GROUP', 'actionGroupInvocationOutput': {
+            'text': 'Table public.splittest has stats_off 3.2 - statistics are current.'}}})
+        time.sleep(self._jitter(self.model_latency_ms))
+        yield self._trace(sessionId, {'observation': {'type': 'FINISH', 'finalResponse': {
+            'text': 'The statistics for splittest are current.'}}})
+        for i in range(self.chunk_count):
+            time.sleep(self._jitter(self.chunk_latency_ms))
+            yield {'chunk': {'bytes': f"Part {i + 1} of the answer to: {inputText}\n".encode('utf8')}}
+
+    def invoke_agent(self, agentId, agentAliasId, sessionId, inputText, **kwargs):
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.failure_rate
+        if failed:
+            raise RuntimeError('throttlingException: Your request rate is too high')
+        return {'completion': self._events(inputText, sessionId), 'sessionId': sessionId}
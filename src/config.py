@@ -1,35 +1,449 @@
-import boto3
+import hashlib
+import json
 import logging
+import os
+import threading
 
 # Setting logger
 logging.basicConfig(format='[%(asctime)s] p%(process)s {%(filename)s:%(lineno)d} %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Getting boto3 clients for required AWS services
-sts_client = boto3.client('sts')
-iam_client = boto3.client('iam')
-lambda_client = boto3.client('lambda')
-bedrock_agent_client = boto3.client('bedrock-agent')
-bedrock_agent_runtime_client = boto3.client('bedrock-agent-runtime')
-
-# Configuration variables
-session = boto3.session.Session()
-region = session.region_name
-account_id = sts_client.get_caller_identity()["Account"]
-
 # Create inference profile for specific model
 inference_profile = "amazon.nova-lite-v1:0"
 foundation_model = inference_profile[3:]
 
 # Configuration variables
-suffix = f"{region}-{account_id}"
 agent_name = "de_oncall_agent_function_def"
-agent_bedrock_allow_policy_name = f"{agent_name}-ba-{suffix}"
 agent_role_name = f'AmazonBedrockExecutionRoleForAgents_{agent_name}'
 agent_description = "Agent for providing Date Engineer on call to help troubleshoot"
 agent_instruction = "You are an DE agent, helping DE have peace during oncall"
 agent_action_group_name = "DEActionGroup"
 agent_action_group_description = "Actions for optimisation of performance"
 agent_alias_name = f"{agent_name}-alias"
-lambda_function_role = f'{agent_name}-lambda-role-{suffix}'
-lambda_function_name = f'{agent_name}-{suffix}'
\ No newline at end of file
+
+# Account, region and agent IDs are remembered here between runs, see LazyConfig
+config_cache_path = os.environ.get(
+    'DEAI_CONFIG_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'deai', 'config.json')
+)
+
+
+class LazyConfig:
+    """AWS clients and account-dependent settings, created on first use
+
+    Nothing touches AWS at import time. The account ID and the resolved agent
+    and alias IDs are memoized in a small JSON file per profile and region, so
+    later runs skip the STS and list_agents round trips. Call refresh(), or set
+    DEAI_REFRESH_CONFIG=1, after the account or the agent changes.
+    """
+
+    def __init__(self, cache_path=config_cache_path):
+        self.cache_path = cache_path
+        self._values = {}
+        # Deployment steps run on threads and boto3 sessions are not safe for concurrent client creation
+        self._lock = threading.RLock()
+        if os.environ.get('DEAI_REFRESH_CONFIG') == '1':
+            self.refresh()
+
+    def _lazy(self, name, factory):
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = factory()
+            return self._values[name]
+
+    def _client(self, service_name):
+        return self._lazy(f'{service_name}_client', lambda: self.session.client(service_name))
+
+    @property
+    def session(self):
+        def create_session():
+            import boto3
+            return boto3.session.Session()
+        return self._lazy('session', create_session)
+
+    @property
+    def sts_client(self):
+        return self._client('sts')
+
+    @property
+    def iam_client(self):
+        return self._client('iam')
+
+    @property
+    def lambda_client(self):
+        return self._client('lambda')
+
+    @property
+    def bedrock_agent_client(self):
+        return self._client('bedrock-agent')
+
+    @property
+    def bedrock_agent_runtime_client(self):
+        return self._client('bedrock-agent-runtime')
+
+    @property
+    def region(self):
+        return self._lazy('region', lambda: self.session.region_name)
+
+    # On-disk cache, keyed by profile and region so switching either never mixes up accounts
+    def _cache_key(self):
+        return f"{self.session.profile_name}:{self.region}"
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f).get(self._cache_key(), {})
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, **values):
+        with self._lock:
+            try:
+                with open(self.cache_path) as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+            cache.setdefault(self._cache_key(), {}).update(values)
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'w') as f:
+                json.dump(cache, f, indent=2)
+
+    def _cached(self, name, resolve):
+        def load():
+            value = self._read_cache().get(name)
+            if value is None:
+                value = resolve()
+                self._write_cache(**{name: value})
+            return value
+        return self._lazy(name, load)
+
+    @property
+    def account_id(self):
+        return self._cached('account_id', lambda: self.sts_client.get_caller_identity()["Account"])
+
+    @property
+    def suffix(self):
+        return f"{self.region}-{self.account_id}"
+
+    @property
+    def agent_bedrock_allow_policy_name(self):
+        return f"{agent_name}-ba-{self.suffix}"
+
+    @property
+    def lambda_function_role(self):
+        return f'{agent_name}-lambda-role-{self.suffix}'
+
+    @property
+    def lambda_function_name(self):
+        return f'{agent_name}-{self.suffix}'
+
+    def _find_agent_id(self):
+        paginator = self.bedrock_agent_client.get_paginator('list_agents')
+        for page in paginator.paginate():
+            for agent_summary in page.get('agentSummaries', []):
+                if agent_summary['agentName'] == agent_name:
+                    return agent_summary['agentId']
+        raise Exception(f"Agent '{agent_name}' not found")
+
+    @property
+    def agent_id(self):
+        return self._cached('agent_id', self._find_agent_id)
+
+    @property
+    def agent_alias_id(self):
+        def find_alias_id():
+            aliases_response = self.bedrock_agent_client.list_agent_aliases(agentId=self.agent_id)
+            return aliases_response['agentAliasSummaries'][0]['agentAliasId']
+        return self._cached('agent_alias_id', find_alias_id)
+
+    def remember_agent(self, agent_id, agent_alias_id):
+        """Store IDs that are already known, for example right after a deployment"""
+        with self._lock:
+            self._values.update(agent_id=agent_id, agent_alias_id=agent_alias_id)
+        self._write_cache(agent_id=agent_id, agent_alias_id=agent_alias_id)
+
+    def refresh(self):
+        """Forget memoized values, in memory and on disk, so they are resolved again on next use"""
+        with self._lock:
+            self._values = {name: value for name, value in self._values.items()
+                            if name == 'session' or name.endswith('_client')}
+            try:
+                with open(self.cache_path) as f:
+                    cache = json.load(f)
+                cache.pop(self._cache_key(), None)
+                with open(self.cache_path, 'w') as f:
+                    json.dump(cache, f, indent=2)
+            except (OSError, ValueError):
+                pass
+
+
+config = LazyConfig()
+
+# Names that used to be module-level values, now resolved through config on first access
+_LAZY_NAMES = (
+    'session', 'region', 'account_id', 'suffix',
+    'sts_client', 'iam_client', 'lambda_client', 'bedrock_agent_client', 'bedrock_agent_runtime_client',
+    'agent_bedrock_allow_policy_name', 'lambda_function_role', 'lambda_function_name'
+)
+
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        return getattr(config, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Lambda packaging
+lambda_python_version = "3.12"
+lambda_platform = "manylinux2014_x86_64"
+lambda_runtime_requirements = ["redshift-connector"]
+
+# Functions exposed by the agent action group, backed by lambda_function.lambda_handler
+agent_functions = [
+    {
+        'name': 'check_table_metadata',
+        'description': 'get optimisation statistics for table',
+        'parameters': {
+            "table_name": {
+                "description": "the name of the table to get optimisation statistics",
+                "required": True,
+                "type": "string"
+            },
+            "run_async": {
+                "description": "set to true to run ANALYZE in the background for large tables and return a statement id right away",
+                "required": False,
+                "type": "boolean"
+            },
+            "analyze_mode": {
+                "description": "full to analyze every column, predicate to analyze only columns used in joins and filters (cheapest for wide tables), or columns to analyze an explicit column list",
+                "required": False,
+                "type": "string"
+            },
+            "columns": {
+                "description": "list of columns to analyze when analyze_mode is columns",
+                "required": False,
+                "type": "array"
+            },
+            "analyze_threshold_percent": {
+                "description": "skip ANALYZE when fewer than this percentage of rows changed, 0 forces it to run",
+                "required": False,
+                "type": "number"
+            }
+        }
+    },
+    {
+        'name': 'check_table_health',
+        'description': 'get the full health profile of a table (stale statistics, unsorted rows, deleted rows, skew, size, encoding, distribution style), recommend VACUUM or ANALYZE and optionally run it',
+        'parameters': {
+            "table_name": {
+                "description": "the name of the table to diagnose, optionally schema qualified",
+                "required": True,
+                "type": "string"
+            },
+            "run_maintenance": {
+                "description": "set to true to run the recommended VACUUM and ANALYZE operations",
+                "required": False,
+                "type": "boolean"
+            },
+            "vacuum_target_percent": {
+                "description": "stop VACUUM once the table is this percent sorted or reclaimed, lower values keep VACUUM shorter",
+                "required": False,
+                "type": "integer"
+            },
+            "target": {
+                "description": "registered cluster or workgroup to check, as name or name/database, or all to check every registered target at once; the default target when omitted",
+                "required": False,
+                "type": "string"
+            }
+        }
+    },
+    {
+        'name': 'check_analyze_status',
+        'description': 'get the status and duration of an ANALYZE that was started in the background',
+        'parameters': {
+            "statement_id": {
+                "description": "the statement id returned when the background ANALYZE was submitted",
+                "required": True,
+                "type": "string"
+            }
+        }
+    },
+    {
+        'name': 'check_tables_metadata',
+        'description': 'get optimisation statistics for many tables at once, by list of names, schema or LIKE pattern',
+        'parameters': {
+            "table_names": {
+                "description": "list of table names, optionally schema qualified, to get optimisation statistics",
+                "required": False,
+                "type": "array"
+            },
+            "schema_name": {
+                "description": "only check tables in this schema, or every table in it when no names or pattern are given",
+                "required": False,
+                "type": "string"
+            },
+            "table_pattern": {
+                "description": "SQL LIKE pattern matching the table names to check, for example sales_%",
+                "required": False,
+                "type": "string"
+            },
+            "target": {
+                "description": "registered cluster or workgroup to check, as name or name/database, or all to check every registered target at once; the default target when omitted",
+                "required": False,
+                "type": "string"
+            }
+        }
+    },
+    {
+        'name': 'analyze_stale_tables',
+        'description': 'run ANALYZE on every stale table in a schema, LIKE pattern or list of tables, several at a time, and report what finished and what is still pending',
+        'parameters': {
+            "schema_name": {
+                "description": "analyze the stale tables in this schema",
+                "required": False,
+                "type": "string"
+            },
+            "table_pattern": {
+                "description": "SQL LIKE pattern matching the table names to analyze, for example sales_%",
+                "required": False,
+                "type": "string"
+            },
+            "table_names": {
+                "description": "list of table names, optionally schema qualified, to analyze if stale",
+                "required": False,
+                "type": "array"
+            },
+            "max_parallel": {
+                "description": "how many ANALYZE statements to run at the same time, capped by the Lambda configuration",
+                "required": False,
+                "type": "integer"
+            },
+            "analyze_mode": {
+                "description": "full to analyze every column, or predicate to analyze only columns used in joins and filters (cheapest for wide tables)",
+                "required": False,
+                "type": "string"
+            }
+        }
+    },
+    {
+        'name': 'plan_maintenance',
+        'description': 'build a prioritized VACUUM and ANALYZE plan for a schema or the whole cluster, ranking tables by how often they are scanned and how stale or unsorted they are, with estimated cost, and optionally run the top entries',
+        'parameters': {
+            "schema_name": {
+                "description": "only plan tables in this schema, the whole cluster when omitted",
+                "required": False,
+                "type": "string"
+            },
+            "table_pattern": {
+                "description": "SQL LIKE pattern matching the table names to plan, for example sales_%",
+                "required": False,
+                "type": "string"
+            },
+            "top_k": {
+                "description": "how many of the highest ranked tables to run maintenance on, 5 by default",
+                "required": False,
+                "type": "integer"
+            },
+            "run_maintenance": {
+                "description": "set to true to run the top_k entries of the plan within the Lambda time budget",
+                "required": False,
+                "type": "boolean"
+            },
+            "lookback_hours": {
+                "description": "how many hours of recent scan activity to weigh tables by, 24 by default",
+                "required": False,
+                "type": "integer"
+            }
+        }
+    },
+    {
+        'name': 'diagnose_slow_queries',
+        'description': 'find out why queries on a table are slow: summarize its recent queries and list the worst by elapsed time, queue time, disk spill and broadcast or redistribution alerts, with findings such as stale statistics or a poor distribution key',
+        'parameters': {
+            "table_name": {
+                "description": "the name of the table whose queries are slow, optionally schema qualified",
+                "required": True,
+                "type": "string"
+            },
+            "lookback_hours": {
+                "description": "how many hours of recent queries to look at, 24 by default",
+                "required": False,
+                "type": "integer"
+            },
+            "limit": {
+                "description": "how many queries to list for each kind of problem, 5 by default",
+                "required": False,
+                "type": "integer"
+            },
+            "target": {
+                "description": "registered cluster or workgroup to check, as name or name/database, or all to check every registered target at once; the default target when omitted",
+                "required": False,
+                "type": "string"
+            }
+        }
+    },
+    {
+        'name': 'predict_stale_tables',
+        'description': 'predict which tables will have stale statistics soon, from how fast their stats_off has been growing since their last ANALYZE, so they can be analyzed before queries slow down',
+        'parameters': {
+            "horizon_hours": {
+                "description": "how many hours ahead to look, 24 by default",
+                "required": False,
+                "type": "number"
+            },
+            "schema_name": {
+                "description": "only predict tables in this schema",
+                "required": False,
+                "type": "string"
+            },
+            "table_pattern": {
+                "description": "only predict tables whose name matches this SQL LIKE pattern, e.g. fact_%",
+                "required": False,
+                "type": "string"
+            },
+            "target": {
+                "description": "registered cluster or workgroup to check, as name or name/database, or all to check every registered target at once; the default target when omitted",
+                "required": False,
+                "type": "string"
+            }
+        }
+    },
+    {
+        'name': 'continue_response',
+        'description': 'get the next page of a check_tables_metadata, plan_maintenance or predict_stale_tables response that ended with a continuation_token',
+        'parameters': {
+            "continuation_token": {
+                "description": "the continuation_token value from the previous response, copied exactly",
+                "required": True,
+                "type": "string"
+            }
+        }
+    }
+]
+
+
+def normalize_function_schema(functions):
+    """Project a function schema onto the fields we define, so it compares equal to what Bedrock returns"""
+    return sorted(
+        (
+            {
+                'name': function['name'],
+                'description': function.get('description'),
+                'parameters': {
+                    name: {key: parameter.get(key) for key in ('description', 'required', 'type')}
+                    for name, parameter in function.get('parameters', {}).items()
+                }
+            }
+            for function in functions
+        ),
+        key=lambda function: function['name']
+    )
+
+def fingerprint(value):
+    """Stable content hash of a JSON-serialisable value"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+
+# The lazy names stay out of __all__, a star import would resolve every one of them (clients, STS) up front
+__all__ = [name for name in list(globals()) if not name.startswith('_')
+           and name not in ('hashlib', 'json', 'logging', 'os', 'threading')]
@@ -1,6 +1,18 @@
+import argparse
+import base64
+import compileall
+import hashlib
 import json
+import py_compile
+import re
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
 import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from io import BytesIO
 import uuid
 from botocore.exceptions import ClientError
@@ -9,6 +21,53 @@ import os
 sys.path.append(os.path.dirname(__file__))
 from config import *
 
+def wait_until(check, description, timeout=300, initial_delay=1, max_delay=15):
+    """Poll check() with exponential backoff until it returns a truthy value"""
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        result = check()
+        if result:
+            return result
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Timed out after {timeout}s waiting for {description}")
+        print(f"Waiting {delay}s for {description}...")
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+def retry_with_backoff(action, description, is_retryable, timeout=180, initial_delay=2, max_delay=20):
+    """Call action() until it stops failing with a retryable ClientError, backing off exponentially"""
+    outcome = {}
+
+    def attempt():
+        try:
+            outcome['result'] = action()
+            return True
+        except ClientError as e:
+            if not is_retryable(e):
+                raise
+            print(f"{description} not ready yet: {e.response['Error'].get('Message')}")
+            return False
+
+    wait_until(attempt, description, timeout, initial_delay, max_delay)
+    return outcome['result']
+
+def role_not_assumable_yet(e):
+    """New IAM roles take a while to propagate, until then services reject them as invalid"""
+    error = e.response.get('Error', {})
+    return error.get('Code') in ('ValidationException', 'InvalidParameterValueException') \
+        and 'role' in error.get('Message', '').lower()
+
+def wait_for_agent_status(agent_id, statuses, timeout=300):
+    """Wait until the agent reaches one of the given statuses"""
+    def check():
+        status = config.bedrock_agent_client.get_agent(agentId=agent_id)['agent']['agentStatus']
+        if status == 'FAILED':
+            raise Exception(f"Agent {agent_id} is in FAILED status")
+        return status if status in statuses else None
+
+    return wait_until(check, f"agent {agent_id} to reach {'/'.join(statuses)}", timeout)
+
 def create_lambda_role():
     """Create IAM role for Lambda function"""
     assume_role_policy_document = {
@@ -30,7 +89,11 @@ def create_lambda_role():
             {
                 "Sid": "AmazonRedshiftDataAPIPolicy",
                 "Effect": "Allow",
-                "Action": "redshift-data:ExecuteStatement",
+                "Action": [
+                    "redshift-data:ExecuteStatement",
+                    "redshift-data:BatchExecuteStatement",
+                    "redshift-data:DescribeStatement"
+                ],
                 "Resource": "*"
             },
             {
@@ -43,77 +106,225 @@ def create_lambda_role():
     }
 
     try:
-        existing_role = iam_client.get_role(RoleName=lambda_function_role)
-        print(f"Role {lambda_function_role} already exists")
+        existing_role = config.iam_client.get_role(RoleName=config.lambda_function_role)
+        print(f"Role {config.lambda_function_role} already exists")
         lambda_iam_role = existing_role['Role']
         
     except ClientError as e:
         if e.response['Error']['Code'] == 'NoSuchEntity':
-            print(f"Creating new role: {lambda_function_role}")
-            lambda_iam_role = iam_client.create_role(
-                RoleName=lambda_function_role,
+            print(f"Creating new role: {config.lambda_function_role}")
+            lambda_iam_role = config.iam_client.create_role(
+                RoleName=config.lambda_function_role,
                 AssumeRolePolicyDocument=json.dumps(assume_role_policy_document)
             )
 
             print("Waiting for role to be created...")
-            waiter = iam_client.get_waiter('role_exists')
+            waiter = config.iam_client.get_waiter('role_exists')
             waiter.wait(
-                RoleName=lambda_function_role,
+                RoleName=config.lambda_function_role,
                 WaiterConfig={'Delay': 5, 'MaxAttempts': 10}
             )
 
-            iam_client.attach_role_policy(
-                RoleName=lambda_function_role,
+            config.iam_client.attach_role_policy(
+                RoleName=config.lambda_function_role,
                 PolicyArn='arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole'
             )
 
-            iam_client.put_role_policy(
-                RoleName=lambda_function_role,
-                PolicyName=f"{lambda_function_role}-inline-policy",
-                PolicyDocument=json.dumps(inline_policy)
-            )
-
-            print(f"Successfully created role: {lambda_function_role}")
+            print(f"Successfully created role: {config.lambda_function_role}")
         else:
             raise e
 
+    # Always (re)apply the inline policy so existing roles pick up newly required actions
+    config.iam_client.put_role_policy(
+        RoleName=config.lambda_function_role,
+        PolicyName=f"{config.lambda_function_role}-inline-policy",
+        PolicyDocument=json.dumps(inline_policy)
+    )
+
     return lambda_iam_role
 
-def create_lambda_function(lambda_iam_role):
-    """Create or update Lambda function"""
+# Packages the Lambda runtime already ships, or that redshift_connector declares but never imports
+RUNTIME_PROVIDED_PACKAGES = {'boto3', 'botocore', 's3transfer', 'jmespath', 'dateutil', 'six', 'urllib3'}
+UNUSED_PACKAGES = {'setuptools', 'pkg_resources', '_distutils_hack'}
+STRIPPED_DIRECTORIES = {'tests', 'test', '__pycache__'}
+STRIPPED_SUFFIXES = ('.dist-info', '.egg-info', '.pth', '.pyi')
+
+# Invoking the handler with an unknown function returns straight away without touching Redshift
+COLD_START_PROBE_EVENT = {
+    'messageVersion': '1.0',
+    'agent': {},
+    'actionGroup': agent_action_group_name,
+    'function': 'cold_start_probe',
+    'parameters': []
+}
+
+def prune_package_dir(build_dir):
+    """Remove runtime-provided packages, tests and packaging metadata from vendored dependencies"""
+    for entry in os.listdir(build_dir):
+        top_level = entry.split('-')[0].split('.')[0].lower()
+        if top_level in RUNTIME_PROVIDED_PACKAGES | UNUSED_PACKAGES or entry.endswith(STRIPPED_SUFFIXES) \
+                or entry.startswith('python_dateutil') or entry == 'bin':
+            path = os.path.join(build_dir, entry)
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+    for root, dirs, files in os.walk(build_dir):
+        for name in [d for d in dirs if d in STRIPPED_DIRECTORIES]:
+            shutil.rmtree(os.path.join(root, name))
+            dirs.remove(name)
+        for name in [f for f in files if f.endswith(STRIPPED_SUFFIXES)]:
+            os.remove(os.path.join(root, name))
+
+def precompile_package_dir(build_dir):
+    """Ship bytecode so cold starts skip compiling, since /var/task is read only and nothing gets cached"""
+    if sys.version_info[:2] != tuple(int(part) for part in lambda_python_version.split('.')):
+        print(f"Skipping bytecode precompilation: local Python {sys.version_info.major}.{sys.version_info.minor} "
+              f"does not match the python{lambda_python_version} runtime")
+        return
+    # Unchecked hash pycs are used without comparing them to the source mtime
+    compileall.compile_dir(
+        build_dir,
+        quiet=1,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH
+    )
+
+def zip_package_dir(build_dir):
+    """Zip a directory with fixed timestamps and ordering so identical inputs give identical bytes"""
     s = BytesIO()
-    z = zipfile.ZipFile(s, 'w')
-    
-    # Get the current directory (src) and find lambda_function.py
+    with zipfile.ZipFile(s, 'w', zipfile.ZIP_DEFLATED) as z:
+        for root, dirs, files in os.walk(build_dir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                info = zipfile.ZipInfo(os.path.relpath(path, build_dir), date_time=(1980, 1, 1, 0, 0, 0))
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, 'rb') as f:
+                    z.writestr(info, f.read())
+    return s.getvalue()
+
+def build_lambda_package():
+    """Build the Lambda zip: handler, vendored runtime dependencies and precompiled bytecode
+
+    Builds are cached under build/ by a hash of their inputs, so an unchanged
+    handler is not re-vendored on every deploy.
+    """
     current_dir = os.path.dirname(__file__)
-    lambda_file_path = os.path.join(current_dir, "lambda_function.py")
-    
-    z.write(lambda_file_path, "lambda_function.py")
-    z.close()
-    zip_content = s.getvalue()
+    with open(os.path.join(current_dir, "lambda_function.py"), 'rb') as f:
+        build_key = fingerprint({
+            'handler': hashlib.sha256(f.read()).hexdigest(),
+            'requirements': lambda_runtime_requirements,
+            'runtime': lambda_python_version,
+            'platform': lambda_platform,
+            'build_python': list(sys.version_info[:2])
+        })
+    cache_path = os.path.join(os.path.dirname(current_dir), 'build', f'lambda-{build_key[:16]}.zip')
+    if os.path.exists(cache_path):
+        print(f"Reusing cached Lambda package {cache_path}")
+        with open(cache_path, 'rb') as f:
+            return f.read()
+
+    build_dir = tempfile.mkdtemp(prefix='deai-lambda-')
+    try:
+        print(f"Vendoring {', '.join(lambda_runtime_requirements)} for python{lambda_python_version}")
+        subprocess.run([
+            sys.executable, '-m', 'pip', 'install', '--quiet', '--no-compile',
+            '--target', build_dir,
+            '--platform', lambda_platform,
+            '--implementation', 'cp',
+            '--python-version', lambda_python_version,
+            '--only-binary=:all:'
+        ] + lambda_runtime_requirements, check=True)
+        prune_package_dir(build_dir)
+        shutil.copy(os.path.join(current_dir, "lambda_function.py"), build_dir)
+        precompile_package_dir(build_dir)
+        zip_content = zip_package_dir(build_dir)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    print(f"Lambda package size: {len(zip_content) / 1024 / 1024:.1f} MB")
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, 'wb') as f:
+        f.write(zip_content)
+    return zip_content
+
+def measure_cold_start(samples=3):
+    """Force fresh execution environments and return the median Init Duration in milliseconds"""
+    try:
+        configuration = config.lambda_client.get_function_configuration(FunctionName=config.lambda_function_name)
+    except config.lambda_client.exceptions.ResourceNotFoundException:
+        return None
+    variables = configuration.get('Environment', {}).get('Variables', {})
+    waiter = config.lambda_client.get_waiter('function_updated')
+
+    init_durations = []
+    for _ in range(samples):
+        waiter.wait(FunctionName=config.lambda_function_name)
+        # Any configuration change retires the warm execution environments
+        variables['ColdStartNonce'] = str(uuid.uuid4())
+        config.lambda_client.update_function_configuration(
+            FunctionName=config.lambda_function_name,
+            Environment={'Variables': variables}
+        )
+        waiter.wait(FunctionName=config.lambda_function_name)
+        response = config.lambda_client.invoke(
+            FunctionName=config.lambda_function_name,
+            LogType='Tail',
+            Payload=json.dumps(COLD_START_PROBE_EVENT)
+        )
+        log_tail = base64.b64decode(response['LogResult']).decode('utf8')
+        match = re.search(r'Init Duration: ([\d.]+) ms', log_tail)
+        if match:
+            init_durations.append(float(match.group(1)))
+
+    if not init_durations:
+        print("No Init Duration found in the invocation logs")
+        return None
+    return statistics.median(init_durations)
+
+def code_sha256(zip_content):
+    """Hash a package the way Lambda reports CodeSha256"""
+    return base64.b64encode(hashlib.sha256(zip_content).digest()).decode('ascii')
+
+def create_lambda_function(lambda_iam_role):
+    """Create or update Lambda function"""
+    zip_content = build_lambda_package()
 
     try:
-        lambda_function = lambda_client.create_function(
-            FunctionName=lambda_function_name,
-            Runtime='python3.12',
-            Timeout=180,
-            Role=lambda_iam_role['Arn'],
-            Code={'ZipFile': zip_content},
-            Handler='lambda_function.lambda_handler'
+        lambda_function = retry_with_backoff(
+            lambda: config.lambda_client.create_function(
+                FunctionName=config.lambda_function_name,
+                Runtime=f'python{lambda_python_version}',
+                Timeout=180,
+                Role=lambda_iam_role['Arn'],
+                Code={'ZipFile': zip_content},
+                Handler='lambda_function.lambda_handler'
+            ),
+            f"Lambda role {config.lambda_function_role}",
+            role_not_assumable_yet
         )
-        print(f"Lambda function '{lambda_function_name}' created successfully.")
+        config.lambda_client.get_waiter('function_active_v2').wait(FunctionName=config.lambda_function_name)
+        print(f"Lambda function '{config.lambda_function_name}' created successfully.")
         
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceConflictException':
-            print(f"Lambda function '{lambda_function_name}' already exists. Updating code.")
-            lambda_client.update_function_code(
-                FunctionName=lambda_function_name,
+            lambda_function = config.lambda_client.get_function(
+                FunctionName=config.lambda_function_name
+            )
+            # The package is built deterministically, so an unchanged hash means unchanged code
+            if lambda_function['Configuration']['CodeSha256'] == code_sha256(zip_content):
+                print(f"Lambda function '{config.lambda_function_name}' code unchanged, skipping upload.")
+                return lambda_function
+
+            print(f"Lambda function '{config.lambda_function_name}' already exists. Updating code.")
+            config.lambda_client.update_function_code(
+                FunctionName=config.lambda_function_name,
                 ZipFile=zip_content
             )
-            lambda_function = lambda_client.get_function(
-                FunctionName=lambda_function_name
+            config.lambda_client.get_waiter('function_updated_v2').wait(FunctionName=config.lambda_function_name)
+            lambda_function = config.lambda_client.get_function(
+                FunctionName=config.lambda_function_name
             )
-            print(f"Lambda function '{lambda_function_name}' updated successfully.")
+            print(f"Lambda function '{config.lambda_function_name}' updated successfully.")
         else:
             print(f"An unexpected error occurred: {e}")
             raise e
@@ -152,17 +363,17 @@ def create_bedrock_policy():
     bedrock_policy_json = json.dumps(bedrock_agent_bedrock_allow_policy_statement)
 
     try:
-        agent_bedrock_policy = iam_client.create_policy(
-            PolicyName=agent_bedrock_allow_policy_name,
+        agent_bedrock_policy = config.iam_client.create_policy(
+            PolicyName=config.agent_bedrock_allow_policy_name,
             PolicyDocument=bedrock_policy_json
         )
-        print(f"IAM policy '{agent_bedrock_allow_policy_name}' created successfully.")
+        print(f"IAM policy '{config.agent_bedrock_allow_policy_name}' created successfully.")
     except ClientError as e:
         if e.response['Error']['Code'] == 'EntityAlreadyExists':
-            print(f"IAM policy '{agent_bedrock_allow_policy_name}' already exists. Skipping creation.")
+            print(f"IAM policy '{config.agent_bedrock_allow_policy_name}' already exists. Skipping creation.")
             agent_bedrock_policy = {
                 'Policy': {
-                    'Arn': f'arn:aws:iam::{account_id}:policy/{agent_bedrock_allow_policy_name}'
+                    'Arn': f'arn:aws:iam::{config.account_id}:policy/{config.agent_bedrock_allow_policy_name}'
                 }
             }
         else:
@@ -185,19 +396,22 @@ def create_agent_role(agent_bedrock_policy):
 
     try:
         assume_role_policy_document_json = json.dumps(assume_role_policy_document)
-        agent_role = iam_client.create_role(
+        agent_role = config.iam_client.create_role(
             RoleName=agent_role_name,
             AssumeRolePolicyDocument=assume_role_policy_document_json
         )
     except ClientError as e:
         if e.response['Error']['Code'] == 'EntityAlreadyExists':
-            agent_role = iam_client.get_role(RoleName=agent_role_name)
+            agent_role = config.iam_client.get_role(RoleName=agent_role_name)
         else:
             raise e
 
-    time.sleep(10)
+    config.iam_client.get_waiter('role_exists').wait(
+        RoleName=agent_role_name,
+        WaiterConfig={'Delay': 2, 'MaxAttempts': 30}
+    )
     
-    iam_client.attach_role_policy(
+    config.iam_client.attach_role_policy(
         RoleName=agent_role_name,
         PolicyArn=agent_bedrock_policy['Policy']['Arn']
     )
@@ -206,16 +420,19 @@ def create_agent_role(agent_bedrock_policy):
 
 def create_bedrock_agent(agent_role):
     """Create Bedrock agent"""
-    time.sleep(30)
-
     try:
-        response = bedrock_agent_client.create_agent(
-            agentName=agent_name,
-            agentResourceRoleArn=agent_role['Role']['Arn'],
-            description=agent_description,
-            idleSessionTTLInSeconds=1800,
-            foundationModel=inference_profile,
-            instruction=agent_instruction,
+        # Retried until IAM has propagated the new role to Bedrock, instead of sleeping a fixed time
+        response = retry_with_backoff(
+            lambda: config.bedrock_agent_client.create_agent(
+                agentName=agent_name,
+                agentResourceRoleArn=agent_role['Role']['Arn'],
+                description=agent_description,
+                idleSessionTTLInSeconds=1800,
+                foundationModel=inference_profile,
+                instruction=agent_instruction,
+            ),
+            f"agent role {agent_role_name}",
+            role_not_assumable_yet
         )
         agent_id = response['agent']['agentId']
         print(f"Agent '{agent_name}' created successfully with ID: {agent_id}")
@@ -224,7 +441,7 @@ def create_bedrock_agent(agent_role):
 
         agent_id = None
         try:
-            paginator = bedrock_agent_client.get_paginator('list_agents')
+            paginator = config.bedrock_agent_client.get_paginator('list_agents')
             for page in paginator.paginate():
                 for agent_summary in page.get('agentSummaries', []):
                     if agent_summary['agentName'] == agent_name:
@@ -241,28 +458,62 @@ def create_bedrock_agent(agent_role):
             print("Could not find an existing agent with that name.")
             raise e
 
+    wait_for_agent_status(agent_id, ('NOT_PREPARED', 'PREPARED'))
     return agent_id
 
+def action_group_fingerprint(functions, lambda_arn, description):
+    return fingerprint({
+        'functions': normalize_function_schema(functions),
+        'executor': lambda_arn,
+        'description': description
+    })
+
+def find_action_group(agent_id):
+    """Return the summary of this agent's action group, or None if it does not exist yet"""
+    paginator = config.bedrock_agent_client.get_paginator('list_agent_action_groups')
+    for page in paginator.paginate(agentId=agent_id, agentVersion='DRAFT'):
+        for summary in page.get('actionGroupSummaries', []):
+            if summary['actionGroupName'] == agent_action_group_name:
+                return summary
+    return None
+
 def create_action_group(agent_id, lambda_function):
-    """Create agent action group"""
-    agent_functions = [
-        {
-            'name': 'check_table_metadata',
-            'description': 'get optimisation statistics for table',
-            'parameters': {
-                "table_name": {
-                    "description": "the name of the table to get optimisation statistics",
-                    "required": True,
-                    "type": "string"
-                }
-            }
-        }
-    ]
+    """Create agent action group, or update it if its definition changed. Returns whether anything changed"""
+    lambda_arn = lambda_function['Configuration']['FunctionArn']
+    existing = find_action_group(agent_id)
+    if existing:
+        current = config.bedrock_agent_client.get_agent_action_group(
+            agentId=agent_id,
+            agentVersion='DRAFT',
+            actionGroupId=existing['actionGroupId']
+        )['agentActionGroup']
+        current_fingerprint = action_group_fingerprint(
+            current.get('functionSchema', {}).get('functions', []),
+            current.get('actionGroupExecutor', {}).get('lambda'),
+            current.get('description')
+        )
+        if current_fingerprint == action_group_fingerprint(agent_functions, lambda_arn, agent_action_group_description):
+            print("Action group unchanged, skipping update.")
+            return False
 
-    time.sleep(30)
+        config.bedrock_agent_client.update_agent_action_group(
+            agentId=agent_id,
+            agentVersion='DRAFT',
+            actionGroupId=existing['actionGroupId'],
+            actionGroupName=agent_action_group_name,
+            actionGroupExecutor={
+                'lambda': lambda_arn
+            },
+            functionSchema={
+                'functions': agent_functions
+            },
+            description=agent_action_group_description
+        )
+        print("Action group updated successfully.")
+        return True
 
     try:
-        agent_action_group_response = bedrock_agent_client.create_agent_action_group(
+        agent_action_group_response = config.bedrock_agent_client.create_agent_action_group(
             agentId=agent_id,
             agentVersion='DRAFT',
             actionGroupName=agent_action_group_name,
@@ -292,62 +543,155 @@ def create_action_group(agent_id, lambda_function):
             print(f"An unexpected AWS client error occurred: {error_code} - {error_message}")
             raise
 
+    return True
+
 def add_lambda_permission(agent_id):
     """Add permission for Bedrock to invoke Lambda"""
     try:
-        response = lambda_client.add_permission(
-            FunctionName=lambda_function_name,
+        response = config.lambda_client.add_permission(
+            FunctionName=config.lambda_function_name,
             StatementId='allow_bedrock',
             Action='lambda:InvokeFunction',
             Principal='bedrock.amazonaws.com',
-            SourceArn=f"arn:aws:bedrock:{region}:{account_id}:agent/{agent_id}"
+            SourceArn=f"arn:aws:bedrock:{config.region}:{config.account_id}:agent/{agent_id}"
         )
-    except lambda_client.exceptions.ResourceConflictException:
+    except config.lambda_client.exceptions.ResourceConflictException:
         print("Permission already exists - no need to add it again")
 
+def agent_definition_fingerprint(agent):
+    return fingerprint({
+        'instruction': agent.get('instruction'),
+        'description': agent.get('description'),
+        'foundationModel': agent.get('foundationModel'),
+        'idleSessionTTLInSeconds': agent.get('idleSessionTTLInSeconds')
+    })
+
+def sync_agent_definition(agent_id, agent_role):
+    """Update the agent's instruction, model and settings if they changed. Returns whether anything changed"""
+    desired = {
+        'agentName': agent_name,
+        'agentResourceRoleArn': agent_role['Role']['Arn'],
+        'description': agent_description,
+        'idleSessionTTLInSeconds': 1800,
+        'foundationModel': inference_profile,
+        'instruction': agent_instruction
+    }
+    current = config.bedrock_agent_client.get_agent(agentId=agent_id)['agent']
+    if agent_definition_fingerprint(current) == agent_definition_fingerprint(desired):
+        print("Agent definition unchanged, skipping update.")
+        return False
+
+    config.bedrock_agent_client.update_agent(agentId=agent_id, **desired)
+    wait_for_agent_status(agent_id, ('NOT_PREPARED', 'PREPARED'))
+    print(f"Agent '{agent_name}' definition updated.")
+    return True
+
+def prepare_agent_if_needed(agent_id, definition_changed):
+    """Prepare the agent only when its definition changed or it was never prepared"""
+    status = config.bedrock_agent_client.get_agent(agentId=agent_id)['agent']['agentStatus']
+    if not definition_changed and status == 'PREPARED':
+        print("Agent definition unchanged and already prepared, skipping prepare.")
+        return None
+    return prepare_agent(agent_id)
+
 def prepare_agent(agent_id):
     """Prepare the agent"""
-    response = bedrock_agent_client.prepare_agent(agentId=agent_id)
+    response = config.bedrock_agent_client.prepare_agent(agentId=agent_id)
     print(response)
+    wait_for_agent_status(agent_id, ('PREPARED',))
     return response
 
 def get_agent_alias(agent_id):
     """Get agent alias"""
-    aliases_response = bedrock_agent_client.list_agent_aliases(agentId=agent_id)
+    aliases_response = config.bedrock_agent_client.list_agent_aliases(agentId=agent_id)
     agent_alias_id = aliases_response['agentAliasSummaries'][0]['agentAliasId']
     print(f"Agent Alias ID: {agent_alias_id}")
     return agent_alias_id
 
+def run_pipeline(steps, max_workers=4):
+    """Run deployment steps as a dependency graph, starting each one as soon as its dependencies finish
+
+    steps maps a step name to (dependencies, function); the function receives the
+    results of all finished steps. Returns the results and per-step timings.
+    """
+    results = {}
+    timings = {}
+    lock = threading.Lock()
+    remaining = dict(steps)
+    running = {}
+
+    def run_step(name, function):
+        started = time.monotonic()
+        with lock:
+            finished = dict(results)
+        result = function(finished)
+        with lock:
+            timings[name] = time.monotonic() - started
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while remaining or running:
+            for name, (dependencies, function) in list(remaining.items()):
+                if all(dependency in results for dependency in dependencies):
+                    running[executor.submit(run_step, name, function)] = name
+                    del remaining[name]
+            if not running:
+                raise Exception(f"Unresolvable step dependencies: {', '.join(remaining)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                # Re-raises the step's exception, which stops the deployment
+                result = future.result()
+                with lock:
+                    results[name] = result
+
+    return results, timings
+
 def main():
     """Main deployment function"""
+    parser = argparse.ArgumentParser(description="Deploy the DE on-call agent")
+    parser.add_argument('--measure-cold-start', action='store_true',
+                        help="report the Lambda Init Duration before and after updating the code")
+    args = parser.parse_args()
+
     print("Starting deployment...")
+    started = time.monotonic()
+
+    # The Lambda chain and the Bedrock policy/role/agent chain are independent until the action group
+    steps = {
+        'lambda_role': ((), lambda r: create_lambda_role()),
+        'cold_start_before': ((), lambda r: measure_cold_start() if args.measure_cold_start else None),
+        'lambda_function': (('lambda_role', 'cold_start_before'), lambda r: create_lambda_function(r['lambda_role'])),
+        'bedrock_policy': ((), lambda r: create_bedrock_policy()),
+        'agent_role': (('bedrock_policy',), lambda r: create_agent_role(r['bedrock_policy'])),
+        'agent': (('agent_role',), lambda r: create_bedrock_agent(r['agent_role'])),
+        'agent_definition': (('agent',), lambda r: sync_agent_definition(r['agent'], r['agent_role'])),
+        'action_group': (('agent_definition', 'lambda_function'),
+                         lambda r: create_action_group(r['agent'], r['lambda_function'])),
+        'lambda_permission': (('agent', 'lambda_function'), lambda r: add_lambda_permission(r['agent'])),
+        # Lambda code changes take effect without a prepare, only agent definition changes need one
+        'prepare': (('action_group', 'lambda_permission'),
+                    lambda r: prepare_agent_if_needed(r['agent'], r['agent_definition'] or r['action_group'])),
+        'agent_alias': (('prepare',), lambda r: get_agent_alias(r['agent'])),
+    }
+    if args.measure_cold_start:
+        steps['cold_start_after'] = (('lambda_function',), lambda r: measure_cold_start())
+
+    results, timings = run_pipeline(steps)
+
+    print("Step timings:")
+    for name, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+        print(f"  {name:<20} {seconds:7.1f}s")
+    if args.measure_cold_start:
+        print(f"Cold start Init Duration (median): before {results['cold_start_before']} ms, "
+              f"after {results['cold_start_after']} ms")
     
-    # Create Lambda role and function
-    lambda_iam_role = create_lambda_role()
-    lambda_function = create_lambda_function(lambda_iam_role)
-    
-    # Create Bedrock policy and agent role
-    agent_bedrock_policy = create_bedrock_policy()
-    agent_role = create_agent_role(agent_bedrock_policy)
-    
-    # Create Bedrock agent
-    agent_id = create_bedrock_agent(agent_role)
-    
-    # Create action group
-    create_action_group(agent_id, lambda_function)
-    
-    # Add Lambda permission
-    add_lambda_permission(agent_id)
-    
-    # Prepare agent
-    prepare_agent(agent_id)
-    
-    # Get agent alias
-    agent_alias_id = get_agent_alias(agent_id)
-    
-    print(f"Deployment completed successfully!")
-    print(f"Agent ID: {agent_id}")
-    print(f"Agent Alias ID: {agent_alias_id}")
+    # Lets test_agent.py and update_action_group.py start without looking the agent up again
+    config.remember_agent(results['agent'], results['agent_alias'])
+
+    print(f"Deployment completed successfully in {time.monotonic() - started:.1f}s!")
+    print(f"Agent ID: {results['agent']}")
+    print(f"Agent Alias ID: {results['agent_alias']}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,92 +1,2741 @@
 import os
+import re
 import json
-import boto3
-import botocore 
-import botocore.session as bc
-from botocore.client import Config
-import redshift_connector
-
-def check_table_metadata(table_name):
-    secret_name = os.environ['SecretId']  # getting SecretId from Environment variables
-    session = boto3.session.Session()
-    region = session.region_name
-    
-    # Initializing Secret Manager's client    
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region
-    )
-    
-    get_secret_value_response = client.get_secret_value(
-        SecretId=secret_name
-    )
-    secret_arn = get_secret_value_response['ARN']
-    
-    secret = get_secret_value_response['SecretString']
-    print(secret)
-    
-    secret_json = json.loads(secret)
-    print(secret_json)
-    
-    cluster_id = secret_json['dbClusterIdentifier']
-
-    # Initializing Botocore client
-    bc_session = bc.get_session()
-    
-    session = boto3.Session(
-        botocore_session=bc_session,
-        region_name=region
+import base64
+import time
+import threading
+import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from decimal import Decimal
+
+# Warm-container settings, read once per cold start
+SECRET_TTL_SECONDS = int(os.environ.get('SecretTtlSeconds', '300'))
+CONNECTION_MAX_IDLE_SECONDS = int(os.environ.get('ConnectionMaxIdleSeconds', '300'))
+CONNECTION_POOL_SIZE = int(os.environ.get('ConnectionPoolSize', '4'))
+DEFAULT_DATABASE = os.environ.get('Database', 'dev')
+# JSON object of name -> {"secret_id", "database", "workgroup"} for every cluster or workgroup the agent may query
+TARGET_REGISTRY = os.environ.get('TargetRegistry', '')
+TARGET_TIMEOUT_SECONDS = float(os.environ.get('TargetTimeoutSeconds', '20'))
+HISTORY_STORE = os.environ.get('HistoryStore', 'redshift')  # redshift, sqlite or off
+HISTORY_TABLE = os.environ.get('HistoryTable', 'public.deai_stats_history')
+HISTORY_TABLE_NAME = 'deai_stats_history'
+HISTORY_PATH = os.environ.get('HistoryPath', '/tmp/deai_stats_history.sqlite3')
+HISTORY_INTERVAL_SECONDS = int(os.environ.get('HistoryIntervalSeconds', '3600'))
+HISTORY_RETENTION_DAYS = int(os.environ.get('HistoryRetentionDays', '30'))
+HISTORY_LOOKBACK_DAYS = 7
+HISTORY_MIN_SPAN_HOURS = 1
+HISTORY_INSERT_BATCH = 200
+STATS_OFF_THRESHOLD = float(os.environ.get('StatsOffThreshold', '10'))
+ANALYZE_MAX_PARALLELISM = int(os.environ.get('AnalyzeMaxParallelism', '4'))
+LAMBDA_TIME_MARGIN_MS = int(os.environ.get('LambdaTimeMarginMs', '10000'))
+ANALYZE_MODES = ('full', 'predicate', 'columns')
+UNSORTED_THRESHOLD = float(os.environ.get('UnsortedThreshold', '10'))
+DELETED_ROWS_THRESHOLD = float(os.environ.get('DeletedRowsThreshold', '10'))
+SKEW_ROWS_THRESHOLD = float(os.environ.get('SkewRowsThreshold', '4'))
+SKEW_SORTKEY_THRESHOLD = float(os.environ.get('SkewSortkeyThreshold', '4'))
+CATALOG_TTL_SECONDS = int(os.environ.get('CatalogTtlSeconds', '120'))
+FUZZY_MATCH_MIN_SCORE = float(os.environ.get('FuzzyMatchMinScore', '0.75'))
+FUZZY_MATCH_MARGIN = 0.1
+# Below this a name shares little more than a trigram with the question, not worth offering
+FUZZY_CANDIDATE_MIN_SCORE = 0.4
+FUZZY_CANDIDATE_LIMIT = 5
+METRICS_MODE = os.environ.get('MetricsMode', 'emf')  # emf, local or off
+METRICS_NAMESPACE = os.environ.get('MetricsNamespace', 'DEAI/Agent')
+VACUUM_OPERATIONS = ('VACUUM FULL', 'VACUUM SORT ONLY', 'VACUUM DELETE ONLY', 'VACUUM REINDEX')
+SESSION_CACHE_TTL_SECONDS = int(os.environ.get('SessionCacheTtlSeconds', '60'))
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('SessionCacheMaxEntries', '20'))
+SESSION_CACHE_ATTRIBUTE = 'deaiTableCache'
+LEASE_STORE = os.environ.get('LeaseStore', 'redshift')  # redshift, local or off
+LEASE_TABLE = os.environ.get('LeaseTable', 'public.deai_analyze_lease')
+ANALYZE_COOLDOWN_SECONDS = int(os.environ.get('AnalyzeCooldownSeconds', '300'))
+ANALYZE_LEASE_TTL_SECONDS = int(os.environ.get('AnalyzeLeaseTtlSeconds', '900'))
+ANALYZE_LEASE_POLL_SECONDS = 2
+SCAN_LOOKBACK_HOURS = int(os.environ.get('ScanLookbackHours', '24'))
+# Rough throughput used to estimate maintenance cost from table size, when there is no run history
+ESTIMATED_ANALYZE_MB_PER_SECOND = 500
+ESTIMATED_VACUUM_MB_PER_SECOND = 100
+MAINTENANCE_HISTORY_DAYS = int(os.environ.get('MaintenanceHistoryDays', '7'))
+MAINTENANCE_HISTORY_TTL_SECONDS = 600
+MAINTENANCE_MAX_SECONDS = int(os.environ.get('MaintenanceMaxSeconds', '3600'))
+ESTIMATE_MIN_CLUSTER_RUNS = 3
+MAINTENANCE_QUERY_GROUP = os.environ.get('MaintenanceQueryGroup', '')
+MAINTENANCE_SLOT_COUNT = int(os.environ.get('MaintenanceSlotCount', '1'))
+MAINTENANCE_MAX_QUEUED = int(os.environ.get('MaintenanceMaxQueued', '5'))
+# Bedrock rejects action group responses over 25 KB, leave room for the envelope
+RESPONSE_MAX_BYTES = int(os.environ.get('ResponseMaxBytes', '20000'))
+FETCH_BATCH_ROWS = 25
+# List a response pages through with continuation tokens, per function
+PAGED_LISTS = {'check_tables_metadata': 'tables', 'plan_maintenance': 'plan', 'predict_stale_tables': 'predicted'}
+# A continuation reruns the call, never its maintenance
+CONTINUATION_DROPPED_PARAMETERS = ('run_maintenance', 'run_async')
+SLOW_QUERY_MAX_LIMIT = 25
+SLOW_QUERY_TEXT_CHARS = 300
+
+# Full health profile of a table, shared by every svv_table_info lookup
+TABLE_HEALTH_QUERY = """
+select "schema", "table", table_id, stats_off, unsorted, skew_rows, skew_sortkey1,
+       tbl_rows, estimated_visible_rows, size, encoded, diststyle, sortkey1
+from svv_table_info
+"""
+
+# Scan activity per table over the lookback window, aggregated on the cluster.
+# stl_scan is not available on Redshift Serverless, which has sys_query_detail instead.
+SCAN_ACTIVITY_QUERIES = ("""
+select tbl, count(distinct query), sum(rows)
+from stl_scan
+where type = 2 and starttime >= dateadd(hour, -%s, getdate())
+group by tbl
+""", """
+select table_id, count(distinct query_id), sum(output_rows)
+from sys_query_detail
+where step_name = 'scan' and table_id > 0 and start_time >= dateadd(hour, -%s, getdate())
+group by table_id
+""")
+
+# Queries waiting and running in the user WLM queues right now: (queued, running, longest wait seconds).
+# Service classes up to 5 are system and superuser queues. Serverless has no stv tables.
+WLM_QUEUE_DEPTH_QUERIES = ("""
+select sum(case when trim(state) in ('Queued', 'QueuedWaiting') then 1 else 0 end),
+       sum(case when trim(state) = 'Running' then 1 else 0 end),
+       max(case when trim(state) in ('Queued', 'QueuedWaiting') then queue_time else 0 end) / 1000000.0
+from stv_wlm_query_state
+where service_class > 5
+""", """
+select sum(case when status = 'queued' then 1 else 0 end),
+       sum(case when status = 'running' then 1 else 0 end),
+       max(case when status = 'queued' then datediff(ms, start_time, getdate()) else 0 end) / 1000.0
+from sys_query_history
+where status in ('queued', 'running') and start_time >= dateadd(day, -1, getdate())
+""")
+
+# Time this session's statements spent queued and executing in WLM since the given number of milliseconds ago.
+# The log tables are written a few seconds after a query ends, so this can come back empty.
+WLM_TIMING_QUERIES = ("""
+select count(*), sum(w.total_queue_time) / 1000000.0, sum(w.total_exec_time) / 1000000.0
+from stl_wlm_query w
+join stl_query q on q.query = w.query
+where q.pid = pg_backend_pid() and q.starttime >= dateadd(ms, -%s, getdate())
+""", """
+select count(*), sum(queue_time) / 1000000.0, sum(execution_time) / 1000000.0
+from sys_query_history
+where session_id = pg_backend_pid() and start_time >= dateadd(ms, -%s, getdate())
+""")
+
+# Recent ANALYZE and VACUUM runs per table: (kind, table_id, runs, avg seconds, avg rows).
+# stl_vacuum logs a row per phase, so a run is the span of one transaction that finished.
+# Redshift Serverless has sys_analyze_history and sys_vacuum_history instead.
+MAINTENANCE_HISTORY_QUERIES = ("""
+select 'ANALYZE', table_id, count(*), avg(datediff(ms, starttime, endtime)) / 1000.0, avg(rows::float8)
+from stl_analyze
+where status not ilike 'skipped%%' and endtime > starttime and starttime >= dateadd(day, -%s, getdate())
+group by table_id
+union all
+select 'VACUUM', table_id, count(*), avg(ms) / 1000.0, avg(rows::float8)
+from (
+    select xid, table_id, datediff(ms, min(eventtime), max(eventtime)) as ms, max(rows) as rows
+    from stl_vacuum
+    where eventtime >= dateadd(day, -%s, getdate())
+    group by xid, table_id
+    having sum(case when status ilike 'finished%%' then 1 else 0 end) > 0
+) runs
+group by table_id
+""", """
+select 'ANALYZE', table_id, count(*), avg(datediff(ms, start_time, end_time)) / 1000.0, avg(rows::float8)
+from sys_analyze_history
+where status not ilike 'skipped%%' and end_time > start_time and start_time >= dateadd(day, -%s, getdate())
+group by table_id
+union all
+select 'VACUUM', table_id, count(*), avg(datediff(ms, start_time, end_time)) / 1000.0, avg(rows_before_vacuum::float8)
+from sys_vacuum_history
+where end_time > start_time and start_time >= dateadd(day, -%s, getdate())
+group by table_id
+""")
+
+# Per-query evidence for the queries that scanned one table, aggregated on the cluster.
+# Every source defines the same per_query columns; the first that works is used.
+SLOW_QUERY_SOURCES = (('stl', """
+with table_queries as (
+    select distinct query from stl_scan
+    where tbl = %s and starttime >= dateadd(hour, -%s, getdate())
+),
+wlm as (
+    select w.query, sum(w.total_queue_time) as queue_us
+    from stl_wlm_query w join table_queries t on t.query = w.query
+    group by w.query
+),
+alerts as (
+    select a.query,
+           count(*) as alerts,
+           sum(case when a.event ilike '%%broadcast%%' or a.event ilike '%%distribut%%' then 1 else 0 end) as redistribution_alerts,
+           sum(case when a.event ilike '%%statistics%%' then 1 else 0 end) as stats_alerts
+    from stl_alert_event_log a join table_queries t on t.query = a.query
+    group by a.query
+),
+spills as (
+    select s.query, max(case when s.is_diskbased = 't' then 1 else 0 end) as spilled
+    from svl_query_summary s join table_queries t on t.query = s.query
+    group by s.query
+),
+per_query as (
+    select q.query as query_id,
+           datediff(ms, q.starttime, q.endtime) as elapsed_ms,
+           coalesce(w.queue_us, 0) / 1000 as queue_ms,
+           coalesce(s.spilled, 0) as spilled,
+           coalesce(a.alerts, 0) as alerts,
+           coalesce(a.redistribution_alerts, 0) as redistribution_alerts,
+           coalesce(a.stats_alerts, 0) as stats_alerts,
+           q.aborted as failed,
+           q.starttime as started_at,
+           left(trim(q.querytxt), %s) as query_text
+    from stl_query q
+    join table_queries t on t.query = q.query
+    left join wlm w on w.query = q.query
+    left join alerts a on a.query = q.query
+    left join spills s on s.query = q.query
+)
+""", """
+select trim(a.event), trim(a.solution), count(distinct a.query)
+from stl_alert_event_log a join table_queries t on t.query = a.query
+group by 1, 2 order by 3 desc limit 5
+"""), ('sys', """
+with table_queries as (
+    select distinct query_id from sys_query_detail
+    where table_id = %s and start_time >= dateadd(hour, -%s, getdate())
+),
+details as (
+    select d.query_id,
+           max(case when d.spilled_block_local_disk + d.spilled_block_remote_disk > 0 then 1 else 0 end) as spilled,
+           sum(case when nvl(trim(d.alert), '') <> '' then 1 else 0 end) as alerts,
+           sum(case when d.alert ilike '%%broadcast%%' or d.alert ilike '%%distribut%%' then 1 else 0 end) as redistribution_alerts,
+           sum(case when d.alert ilike '%%statistics%%' then 1 else 0 end) as stats_alerts
+    from sys_query_detail d join table_queries t on t.query_id = d.query_id
+    group by d.query_id
+),
+per_query as (
+    select h.query_id,
+           h.elapsed_time / 1000 as elapsed_ms,
+           h.queue_time / 1000 as queue_ms,
+           coalesce(d.spilled, 0) as spilled,
+           coalesce(d.alerts, 0) as alerts,
+           coalesce(d.redistribution_alerts, 0) as redistribution_alerts,
+           coalesce(d.stats_alerts, 0) as stats_alerts,
+           case when h.status = 'failed' then 1 else 0 end as failed,
+           h.start_time as started_at,
+           left(trim(h.query_text), %s) as query_text
+    from sys_query_history h
+    join table_queries t on t.query_id = h.query_id
+    left join details d on d.query_id = h.query_id
+)
+""", """
+select trim(d.alert), null, count(distinct d.query_id)
+from sys_query_detail d join table_queries t on t.query_id = d.query_id
+where nvl(trim(d.alert), '') <> ''
+group by 1 order by 3 desc limit 5
+"""))
+
+# Other sessions holding or waiting for a lock that ANALYZE or VACUUM would queue behind.
+# Plain reads (AccessShareLock) do not block maintenance. stv_locks is not available on Serverless.
+BLOCKING_LOCK_QUERIES = ("""
+select pid, trim(txn_owner), trim(lock_mode), granted, datediff(s, txn_start, getdate())
+from svv_transactions
+where relation = %s and pid <> pg_backend_pid() and lock_mode <> 'AccessShareLock'
+order by granted desc, txn_start
+""", """
+select lock_owner_pid, '', trim(lock_status), true, datediff(s, lock_owner_start_ts, getdate())
+from stv_locks
+where table_id = %s and lock_owner_pid <> pg_backend_pid()
+order by lock_owner_start_ts
+""")
+BLOCKERS_REPORTED = 5
+
+# Per-table least squares drift of stats_off and tbl_rows per hour, fitted on the cluster.
+# Time is in hours relative to now, which keeps the sums small enough for float8.
+# A drop in stats_off means ANALYZE ran, so only points since the last drop count.
+# Plain SQL that Redshift and SQLite both run.
+DRIFT_QUERY = """
+with points as (
+    select table_name, stats_off, tbl_rows, (recorded_at - %s) / 3600.0 as t,
+           case when stats_off < lag(stats_off) over (partition by table_name order by recorded_at) - 1
+                then 1 else 0 end as reset
+    from {table}
+    where target = %s and recorded_at >= %s and stats_off is not null
+),
+segments as (
+    select table_name, stats_off, tbl_rows, t,
+           sum(reset) over (partition by table_name order by t rows unbounded preceding) as segment
+    from points
+),
+latest as (
+    select table_name, stats_off, tbl_rows, t, segment,
+           max(segment) over (partition by table_name) as last_segment
+    from segments
+)
+select table_name, count(*),
+       (count(*) * sum(t * stats_off) - sum(t) * sum(stats_off)) / nullif(count(*) * sum(t * t) - sum(t) * sum(t), 0),
+       (count(*) * sum(t * tbl_rows) - sum(t) * sum(tbl_rows)) / nullif(count(*) * sum(t * t) - sum(t) * sum(t), 0),
+       max(t) - min(t)
+from latest
+where segment = last_segment
+group by table_name
+"""
+
+SLOW_QUERY_SUMMARY_SELECT = """
+select count(*), avg(elapsed_ms), percentile_cont(0.95) within group (order by elapsed_ms), max(elapsed_ms),
+       sum(queue_ms), sum(spilled), sum(case when redistribution_alerts > 0 then 1 else 0 end),
+       sum(case when stats_alerts > 0 then 1 else 0 end), sum(failed)
+from per_query
+"""
+
+# The top queries by each kind of evidence, one row per query however many lists it is in
+SLOW_QUERY_OFFENDERS_SELECT = """
+select query_id, elapsed_ms, queue_ms, spilled, alerts, redistribution_alerts, stats_alerts, failed, started_at,
+       query_text, elapsed_rank, queue_rank, spill_rank, redistribution_rank
+from (
+    select per_query.*,
+           row_number() over (order by elapsed_ms desc) as elapsed_rank,
+           row_number() over (order by queue_ms desc) as queue_rank,
+           row_number() over (order by spilled desc, elapsed_ms desc) as spill_rank,
+           row_number() over (order by redistribution_alerts desc, elapsed_ms desc) as redistribution_rank
+    from per_query
+) ranked
+where elapsed_rank <= %s
+   or (queue_ms > 0 and queue_rank <= %s)
+   or (spilled > 0 and spill_rank <= %s)
+   or (redistribution_alerts > 0 and redistribution_rank <= %s)
+order by elapsed_rank
+"""
+
+# Module-level state survives across warm invocations of the same container
+_secrets_client = None
+_redshift_data_client = None
+_secret_cache = {}
+_secret_cache_lock = threading.Lock()
+_connection_pool = {}
+_connection_pool_lock = threading.Lock()
+_catalog_snapshots = {}
+_catalog_load_locks = {}
+_catalog_lock = threading.Lock()
+_cold_start = True
+_metrics = {'spans': [], 'properties': {}}
+_metrics_lock = threading.Lock()
+# Tables this invocation ran, submitted or attempted maintenance on, which makes session-cached reads stale
+_maintained_tables = set()
+_maintained_tables_lock = threading.Lock()
+_lease_store = None
+_targets = None
+_history_store = None
+_history_recorded = {}
+_history_lock = threading.Lock()
+_maintenance_history = {}
+_maintenance_history_lock = threading.Lock()
+_current_target = contextvars.ContextVar('current_target', default=None)
+
+
+def start_metrics(**properties):
+    """Reset the per-invocation spans and set the properties reported with them"""
+    with _metrics_lock:
+        _metrics['spans'] = []
+        _metrics['properties'] = dict(properties)
+        _metrics['started'] = time.time()
+
+
+def set_metric_property(name, value):
+    with _metrics_lock:
+        _metrics['properties'][name] = value
+
+
+def record_span(phase, duration_ms):
+    with _metrics_lock:
+        _metrics['spans'].append((phase, round(duration_ms, 3)))
+
+
+@contextmanager
+def timed(phase):
+    """Record how long a with-block took as a span of the current invocation"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(phase, (time.perf_counter() - started) * 1000)
+
+
+def flush_metrics():
+    """Print the invocation's spans as a CloudWatch EMF document, or as plain JSON in local mode"""
+    with _metrics_lock:
+        spans = list(_metrics['spans'])
+        properties = dict(_metrics['properties'])
+        started = _metrics.get('started', time.time())
+    if METRICS_MODE == 'off':
+        return
+
+    if METRICS_MODE == 'local':
+        print(json.dumps({
+            'timestamp': started,
+            'properties': properties,
+            'spans': [{'phase': phase, 'ms': ms} for phase, ms in spans]
+        }, default=str))
+        return
+
+    # A phase that ran several times (one ANALYZE per table) is reported as an array of values
+    values = {}
+    for phase, ms in spans:
+        values.setdefault(phase, []).append(ms)
+    document = {
+        '_aws': {
+            'Timestamp': int(started * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Function'], ['Function', 'ColdStart']],
+                'Metrics': [{'Name': phase, 'Unit': 'Milliseconds'} for phase in values]
+            }]
+        }
+    }
+    document.update(properties)
+    document['ColdStart'] = 'true' if properties.get('ColdStart') else 'false'
+    document.update({phase: ms[0] if len(ms) == 1 else ms for phase, ms in values.items()})
+    print(json.dumps(document, default=str))
+
+
+def get_targets():
+    """Registered Redshift targets by name, from TargetRegistry plus the SecretId/Database pair as default"""
+    global _targets
+    if _targets is None:
+        targets = {}
+        if os.environ.get('SecretId'):
+            targets['default'] = {'name': 'default', 'secret_id': os.environ['SecretId'],
+                                  'database': DEFAULT_DATABASE, 'workgroup': None}
+        for name, entry in (json.loads(TARGET_REGISTRY) if TARGET_REGISTRY else {}).items():
+            targets[name.lower()] = {
+                'name': name.lower(),
+                'secret_id': entry['secret_id'],
+                'database': entry.get('database', DEFAULT_DATABASE),
+                'workgroup': entry.get('workgroup')
+            }
+        if not targets:
+            raise Exception("No Redshift target configured, set SecretId or TargetRegistry")
+        _targets = targets
+    return _targets
+
+
+def current_target():
+    """Target that lookups in this thread go to, the default one unless use_target() picked another"""
+    targets = get_targets()
+    return _current_target.get() or targets.get('default') or next(iter(targets.values()))
+
+
+@contextmanager
+def use_target(target):
+    """Send every secret, connection and catalog lookup in this with-block to the given target"""
+    token = _current_target.set(target)
+    try:
+        yield target
+    finally:
+        _current_target.reset(token)
+
+
+def resolve_targets(target=None):
+    """Targets named by a target parameter: a registered name, name/database, all, or the current one"""
+    if not target:
+        return [current_target()]
+    name = target.strip().lower()
+    targets = get_targets()
+    if name == 'all':
+        return list(targets.values())
+    name, _, database = name.partition('/')
+    if name not in targets:
+        raise Exception(f"Unknown target {target}, registered targets are {', '.join(targets)}")
+    if database:
+        return [dict(targets[name], name=f"{name}/{database}", database=database)]
+    return [targets[name]]
+
+
+def _run_on_target(target, action):
+    with use_target(target):
+        return action()
+
+
+def run_on_targets(targets, action, context=None):
+    """Run action() against each target concurrently and return (target name, result, error) per target
+
+    Every target gets its own thread and connection, and a target that does
+    not answer within TARGET_TIMEOUT_SECONDS (or the Lambda budget) is
+    reported as timed out, so a fan-out costs about as much as the slowest
+    healthy target.
+    """
+    if len(targets) == 1:
+        return [(targets[0]['name'], _run_on_target(targets[0], action), None)]
+
+    timeout = min(TARGET_TIMEOUT_SECONDS, (remaining_time_ms(context) - LAMBDA_TIME_MARGIN_MS) / 1000)
+    executor = ThreadPoolExecutor(max_workers=len(targets))
+    futures = [
+        executor.submit(contextvars.copy_context().run, _run_on_target, target, action) for target in targets
+    ]
+    with timed('FanOut'):
+        done, _ = wait(futures, timeout=max(0, timeout))
+    # Stragglers finish in the background and return their connection to the pool
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for target, future in zip(targets, futures):
+        if future not in done:
+            results.append((target['name'], None, f"no answer within {round(timeout, 1):g}s"))
+        elif future.exception():
+            results.append((target['name'], None, str(future.exception())))
+        else:
+            results.append((target['name'], future.result(), None))
+    return results
+
+
+def merge_target_results(results):
+    """Combine per-target results of a single-table action into one answer"""
+    return {
+        'found_on': [name for name, result, error in results if not error and 'error' not in result],
+        'targets': {name: result if not error else {'error': error} for name, result, error in results}
+    }
+
+
+def get_secrets_client():
+    """Return the Secrets Manager client, creating it on first use"""
+    global _secrets_client
+    if _secrets_client is None:
+        # boto3 and redshift_connector are imported on first use to keep them out of module init
+        import boto3
+        session = boto3.session.Session()
+        _secrets_client = session.client(
+            service_name='secretsmanager',
+            region_name=session.region_name
+        )
+    return _secrets_client
+
+
+def get_redshift_data_client():
+    """Return the Redshift Data API client, creating it on first use"""
+    global _redshift_data_client
+    if _redshift_data_client is None:
+        import boto3
+        session = boto3.session.Session()
+        _redshift_data_client = session.client(
+            service_name='redshift-data',
+            region_name=session.region_name
+        )
+    return _redshift_data_client
+
+
+def get_secret(secret_id=None, force_refresh=False):
+    """Return the cached Redshift secret, refetching it once the TTL has expired"""
+    secret_id = secret_id or current_target()['secret_id']
+    now = time.monotonic()
+
+    with _secret_cache_lock:
+        entry = _secret_cache.get(secret_id)
+        if entry and not force_refresh and now - entry['fetched_at'] < SECRET_TTL_SECONDS:
+            return entry
+
+    with timed('SecretFetch'):
+        get_secret_value_response = get_secrets_client().get_secret_value(
+            SecretId=secret_id
+        )
+    new_entry = {
+        'arn': get_secret_value_response['ARN'],
+        'version_id': get_secret_value_response.get('VersionId'),
+        'secret': json.loads(get_secret_value_response['SecretString']),
+        'fetched_at': now
+    }
+
+    with _secret_cache_lock:
+        _secret_cache[secret_id] = new_entry
+
+    # A rotated secret invalidates every connection opened with the old credentials
+    if entry and entry['version_id'] != new_entry['version_id']:
+        print(f"Secret {secret_id} was rotated, dropping pooled connections")
+        close_connections(secret_id)
+
+    return new_entry
+
+
+def _connect(secret_json, database):
+    import redshift_connector
+    return redshift_connector.connect(
+        host=secret_json['host'],
+        database=database,
+        user=secret_json['username'],
+        password=secret_json['password'],
+        port=secret_json['port']
     )
-    print(session)
-    
-    if table_name:
-        # SQL query
-        sql_query = f"""
-        select stats_off from svv_table_info
-        where "table"='{table_name}'
-        """
-        
-        conn = redshift_connector.connect(
-            host=secret_json['host'],
-            database='dev',
-            user=secret_json['username'],
-            password=secret_json['password'],
-            port=secret_json['port']
+
+
+def _is_connection_alive(conn):
+    try:
+        with timed('ConnectionCheck'):
+            cursor = conn.cursor()
+            cursor.execute("select 1")
+            cursor.fetchall()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _evict_idle_connections(now):
+    """Close pooled connections that have been idle longer than the allowed window"""
+    expired = []
+    with _connection_pool_lock:
+        for key, idle in _connection_pool.items():
+            keep = []
+            for conn, last_used in idle:
+                if now - last_used > CONNECTION_MAX_IDLE_SECONDS:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, last_used))
+            _connection_pool[key] = keep
+    for conn in expired:
+        _close_quietly(conn)
+
+
+def acquire_connection(secret_id=None, database=None):
+    """Check out a live Redshift connection, reusing a pooled one when possible"""
+    secret_id = secret_id or current_target()['secret_id']
+    database = database or current_target()['database']
+    key = (secret_id, database)
+    _evict_idle_connections(time.monotonic())
+
+    while True:
+        with _connection_pool_lock:
+            idle = _connection_pool.get(key)
+            conn = idle.pop()[0] if idle else None
+        if conn is None:
+            break
+        if _is_connection_alive(conn):
+            return key, conn
+        print(f"Discarding dead pooled connection for {database}")
+        _close_quietly(conn)
+
+    secret_entry = get_secret(secret_id)
+    try:
+        with timed('Connect'):
+            conn = _connect(secret_entry['secret'], database)
+    except Exception as e:
+        # Credentials may have been rotated since they were cached, retry once with a fresh secret
+        print(f"Connection failed ({e}), refreshing secret and retrying")
+        secret_entry = get_secret(secret_id, force_refresh=True)
+        with timed('Connect'):
+            conn = _connect(secret_entry['secret'], database)
+    return key, conn
+
+
+def release_connection(key, conn, discard=False):
+    """Return a connection to the pool, or close it if it is no longer usable"""
+    if not discard:
+        try:
+            # Never park a connection with an open transaction holding catalog locks
+            conn.rollback()
+        except Exception:
+            discard = True
+
+    if not discard:
+        with _connection_pool_lock:
+            idle = _connection_pool.setdefault(key, [])
+            if len(idle) < CONNECTION_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+    _close_quietly(conn)
+
+
+def close_connections(secret_id=None):
+    """Close pooled connections, optionally only those opened with the given secret"""
+    with _connection_pool_lock:
+        keys = [key for key in _connection_pool if secret_id is None or key[0] == secret_id]
+        conns = [conn for key in keys for conn, _ in _connection_pool.pop(key)]
+    for conn in conns:
+        _close_quietly(conn)
+
+
+@contextmanager
+def redshift_connection(secret_id=None, database=None):
+    """Borrow a pooled Redshift connection for the duration of a with-block"""
+    key, conn = acquire_connection(secret_id, database)
+    try:
+        yield conn
+    finally:
+        release_connection(key, conn)
+
+
+def quote_identifier(name):
+    """Quote a single identifier such as a schema, table or column name"""
+    name = name.strip()
+    if not name:
+        raise Exception("Empty identifier")
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_table_name(table_name):
+    """Quote a table name, optionally schema qualified, for use in maintenance SQL"""
+    parts = table_name.strip().split('.')
+    if len(parts) > 2 or not all(parts):
+        raise Exception(f"Invalid table name: {table_name}")
+    return '.'.join(quote_identifier(part) for part in parts)
+
+
+def build_analyze_statements(table_name, mode=None, columns=None, threshold_percent=None):
+    """Return the ANALYZE mode that will run and the statements that implement it
+
+    full analyzes every column, predicate only the columns used in joins, filters
+    and group by, and columns an explicit column list.
+    """
+    columns = columns or []
+    mode = (mode or ('columns' if columns else 'full')).strip().lower()
+    if mode not in ANALYZE_MODES:
+        raise Exception(f"Unknown analyze_mode {mode}, expected one of {', '.join(ANALYZE_MODES)}")
+    if mode == 'columns' and not columns:
+        raise Exception("analyze_mode columns needs a list of columns")
+
+    target = quote_table_name(table_name)
+    if mode == 'predicate':
+        analyze_query = f"ANALYZE {target} PREDICATE COLUMNS;"
+    elif mode == 'columns':
+        analyze_query = f"ANALYZE {target} ({', '.join(quote_identifier(c) for c in columns)});"
+    else:
+        analyze_query = f"ANALYZE {target};"
+
+    statements = []
+    if threshold_percent is not None:
+        threshold_percent = float(threshold_percent)
+        if not 0 <= threshold_percent <= 100:
+            raise Exception("analyze_threshold_percent must be between 0 and 100")
+        # 0 forces ANALYZE even when few rows changed, higher values let Redshift skip it
+        statements.append(f"SET analyze_threshold_percent TO {threshold_percent:g};")
+    statements.append(analyze_query)
+    return mode, statements
+
+
+def note_maintenance(table_name):
+    """Remember that this invocation changed, or tried to change, a table's statistics or layout"""
+    with _maintained_tables_lock:
+        _maintained_tables.add(table_name)
+
+
+def take_maintained_tables():
+    """Return and clear the tables maintained during this invocation"""
+    with _maintained_tables_lock:
+        tables = set(_maintained_tables)
+        _maintained_tables.clear()
+    return tables
+
+
+def submit_statement(sql, statement_name, secret_id=None, database=None):
+    """Submit SQL through the Redshift Data API and return its statement id without waiting
+
+    A list of statements is submitted as one batch, which runs them in order in a single transaction.
+    """
+    secret_entry = get_secret(secret_id)
+    request = {
+        'Database': database or current_target()['database'],
+        'SecretArn': secret_entry['arn'],
+        'StatementName': statement_name
+    }
+    # Provisioned clusters are addressed by identifier, Serverless by workgroup
+    if secret_entry['secret'].get('dbClusterIdentifier'):
+        request['ClusterIdentifier'] = secret_entry['secret']['dbClusterIdentifier']
+    else:
+        request['WorkgroupName'] = current_target().get('workgroup') or secret_entry['secret']['workgroupName']
+    client = get_redshift_data_client()
+    with timed('DataApiSubmit'):
+        if isinstance(sql, list):
+            response = client.batch_execute_statement(Sqls=sql, **request)
+        else:
+            response = client.execute_statement(Sql=sql, **request)
+    return response['Id']
+
+
+def submit_analyze(table_name, mode=None, columns=None, threshold_percent=None):
+    """Start ANALYZE in the background through the Data API"""
+    mode, statements = build_analyze_statements(table_name, mode, columns, threshold_percent)
+    with redshift_connection() as conn:
+        check_wlm_capacity(conn)
+    # A batch runs in one session, so the settings apply to the ANALYZE that follows them
+    statements = maintenance_settings() + statements
+    print(f"Submitting {' '.join(statements)} through the Data API")
+    note_maintenance(table_name)
+    sql = statements[0] if len(statements) == 1 else statements
+    return submit_statement(sql, f"deai-analyze-{table_name}"[:500]), mode
+
+
+def check_analyze_status(statement_id):
+    """Poll a statement submitted through the Data API"""
+    with timed('DataApiDescribe'):
+        response = get_redshift_data_client().describe_statement(Id=statement_id)
+    status = response['Status']
+    result = {
+        'statement_id': statement_id,
+        'status': status,
+        'sql': response.get('QueryString')
+    }
+    # Duration is reported in nanoseconds and is -1 until the statement completes
+    if response.get('Duration', -1) >= 0:
+        result['duration_seconds'] = round(response['Duration'] / 1e9, 3)
+    if response.get('CreatedAt'):
+        result['submitted_at'] = response['CreatedAt'].isoformat()
+    if status in ('FAILED', 'ABORTED'):
+        result['error'] = response.get('Error')
+    if status == 'FINISHED':
+        invalidate_catalog()
+        note_maintenance(f"statement {statement_id}")
+    if status in ('FINISHED', 'FAILED', 'ABORTED') and get_lease_store():
+        # Let the next request for this table start its cooldown, or retry after a failure
+        try:
+            get_lease_store().release_statement(
+                statement_id, 'done' if status == 'FINISHED' else 'failed',
+                result.get('duration_seconds'), result.get('error')
+            )
+        except Exception as e:
+            print(f"Could not release the ANALYZE lease for {statement_id}: {e}")
+    return result
+
+
+class MaintenanceBlocked(Exception):
+    """Maintenance was skipped or cancelled because other sessions hold conflicting locks on the table"""
+
+    def __init__(self, table_name, blockers, waited_seconds=None):
+        self.table_name = table_name
+        self.blockers = blockers
+        detail = "; ".join(
+            f"PID {b['pid']} ({b['user'] or 'unknown user'}, {b['lock_mode']}, "
+            f"{'held' if b['granted'] else 'waiting'} for {b['seconds']}s)"
+            for b in blockers
         )
+        message = f"{table_name} is blocked by {detail}"
+        if waited_seconds is not None:
+            message += f", cancelled after waiting {waited_seconds}s"
+        super().__init__(message)
 
+
+class ClusterSaturated(Exception):
+    """Maintenance was deferred because the WLM queues are already backed up"""
+
+    def __init__(self, queued, running, longest_wait_seconds):
+        self.queued = queued
+        self.running = running
+        self.longest_wait_seconds = longest_wait_seconds
+        super().__init__(
+            f"the cluster is saturated: {queued} queries queued in WLM (longest waiting {longest_wait_seconds}s) "
+            f"and {running} running, limit is {MAINTENANCE_MAX_QUEUED} queued"
+        )
+
+
+def maintenance_settings():
+    """SET statements that route this session's maintenance to its own WLM queue and slot count"""
+    settings = []
+    if MAINTENANCE_QUERY_GROUP:
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', MAINTENANCE_QUERY_GROUP):
+            raise Exception(f"Invalid MaintenanceQueryGroup {MAINTENANCE_QUERY_GROUP}")
+        settings.append(f"SET query_group TO '{MAINTENANCE_QUERY_GROUP}'")
+    if MAINTENANCE_SLOT_COUNT > 1:
+        settings.append(f"SET wlm_query_slot_count TO {MAINTENANCE_SLOT_COUNT}")
+    return settings
+
+
+def reset_maintenance_settings(cursor):
+    if MAINTENANCE_QUERY_GROUP:
+        cursor.execute("RESET query_group")
+    if MAINTENANCE_SLOT_COUNT > 1:
+        cursor.execute("RESET wlm_query_slot_count")
+
+
+def check_wlm_capacity(conn):
+    """Raise ClusterSaturated instead of adding maintenance to WLM queues that are already backed up"""
+    if MAINTENANCE_MAX_QUEUED <= 0:
+        return
+    cursor = conn.cursor()
+    for query in WLM_QUEUE_DEPTH_QUERIES:
+        try:
+            with timed('QueueCheck'):
+                cursor.execute(query)
+                queued, running, longest_wait = cursor.fetchone() or (0, 0, 0)
+            break
+        except Exception as e:
+            print(f"Queue depth query failed ({e}), trying the next source")
+            conn.rollback()
+    else:
+        return
+    if int(queued or 0) >= MAINTENANCE_MAX_QUEUED:
+        raise ClusterSaturated(int(queued), int(running or 0), round(float(longest_wait or 0)))
+
+
+def wlm_timing(conn, started):
+    """Seconds the session's maintenance spent queued and executing in WLM, None for each when not logged yet"""
+    window_ms = int((time.monotonic() - started) * 1000) + 1000
+    cursor = conn.cursor()
+    for query in WLM_TIMING_QUERIES:
+        try:
+            cursor.execute(query, (window_ms,))
+            count, queued, executing = cursor.fetchone() or (0, None, None)
+            if not count:
+                return {'queued_seconds': None, 'executing_seconds': None}
+            record_span('MaintenanceQueued', float(queued or 0) * 1000)
+            return {'queued_seconds': round(float(queued or 0), 3), 'executing_seconds': round(float(executing or 0), 3)}
+        except Exception as e:
+            print(f"WLM timing query failed ({e}), trying the next source")
+            conn.rollback()
+    return {'queued_seconds': None, 'executing_seconds': None}
+
+
+def describe_wlm_timing(outcome):
+    if outcome.get('queued_seconds') is None:
+        return ""
+    return f", {outcome['queued_seconds']}s queued in WLM and {outcome['executing_seconds']}s executing"
+
+
+def find_blockers(conn, table_name):
+    """List the sessions ANALYZE or VACUUM on a table would wait behind"""
+    rows = find_tables(get_catalog(), table_name)
+    if not rows:
+        return []
+    cursor = conn.cursor()
+    for query in BLOCKING_LOCK_QUERIES:
+        try:
+            with timed('LockCheck'):
+                cursor.execute(query, (rows[0][2],))
+                locks, _ = fetch_bounded(cursor, BLOCKERS_REPORTED, RESPONSE_MAX_BYTES // 4)
+            return [
+                {'pid': int(pid), 'user': user, 'lock_mode': lock_mode, 'granted': bool(granted),
+                 'seconds': int(seconds or 0)}
+                for pid, user, lock_mode, granted, seconds in locks
+            ]
+        except Exception as e:
+            print(f"Lock check query failed ({e}), trying the next source")
+            conn.rollback()
+    return []
+
+
+def check_not_blocked(conn, table_name):
+    """Raise MaintenanceBlocked instead of letting maintenance queue behind another session's lock"""
+    blockers = find_blockers(conn, table_name)
+    if blockers:
+        raise MaintenanceBlocked(table_name, blockers)
+
+
+def raise_if_blocked(conn, table_name, error, started):
+    """After a statement timeout, report the sessions the statement was waiting behind"""
+    if 'statement timeout' not in str(error).lower():
+        return
+    conn.rollback()
+    blockers = find_blockers(conn, table_name)
+    if blockers:
+        raise MaintenanceBlocked(table_name, blockers, round(time.monotonic() - started)) from error
+
+
+def run_analyze(conn, table_name, timeout_ms=None, mode=None, columns=None, threshold_percent=None):
+    """Run ANALYZE on a borrowed connection and report the mode that ran and how long it took"""
+    mode, statements = build_analyze_statements(table_name, mode, columns, threshold_percent)
+    check_not_blocked(conn, table_name)
+    check_wlm_capacity(conn)
+    settings = maintenance_settings()
+    cursor = conn.cursor()
+    print(f"Running ANALYZE ({mode}) on {table_name}")
+    note_maintenance(table_name)
+    if timeout_ms:
+        cursor.execute(f"SET statement_timeout TO {int(timeout_ms)}")
+    for setting in settings:
+        cursor.execute(setting)
+    started = time.monotonic()
+    try:
+        with timed('Analyze'):
+            for statement in statements:
+                cursor.execute(statement)
+            conn.commit()
+    except Exception as e:
+        raise_if_blocked(conn, table_name, e, started)
+        raise
+    finally:
+        if timeout_ms or threshold_percent is not None or settings:
+            # The connection goes back to the pool, so leave no session settings behind
+            conn.rollback()
+            cursor.execute("RESET statement_timeout")
+            cursor.execute("RESET analyze_threshold_percent")
+            reset_maintenance_settings(cursor)
+            conn.commit()
+    seconds = round(time.monotonic() - started, 3)
+    return dict(wlm_timing(conn, started), mode=mode, seconds=seconds)
+
+
+def run_vacuum(conn, table_name, operation, target_percent=None, timeout_ms=None):
+    """Run a VACUUM variant on a borrowed connection and report how long it took, queued and executing"""
+    if operation not in VACUUM_OPERATIONS:
+        raise Exception(f"Unknown maintenance operation {operation}")
+    vacuum_query = f"{operation} {quote_table_name(table_name)}"
+    # A lower target lets VACUUM stop early, which bounds its run time; REINDEX takes no target
+    if target_percent is not None and operation != 'VACUUM REINDEX':
+        target_percent = int(float(target_percent))
+        if not 0 <= target_percent <= 100:
+            raise Exception("vacuum_target_percent must be between 0 and 100")
+        vacuum_query += f" TO {target_percent} PERCENT"
+    vacuum_query += ";"
+
+    check_not_blocked(conn, table_name)
+    check_wlm_capacity(conn)
+    settings = maintenance_settings()
+    # VACUUM cannot run inside a transaction block
+    conn.rollback()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    print(f"Running {vacuum_query}")
+    note_maintenance(table_name)
+    started = time.monotonic()
+    try:
+        if timeout_ms:
+            cursor.execute(f"SET statement_timeout TO {int(timeout_ms)}")
+        for setting in settings:
+            cursor.execute(setting)
+        with timed('Vacuum'):
+            cursor.execute(vacuum_query)
+        seconds = round(time.monotonic() - started, 3)
+    except Exception as e:
+        raise_if_blocked(conn, table_name, e, started)
+        raise
+    finally:
+        if timeout_ms:
+            cursor.execute("RESET statement_timeout")
+        reset_maintenance_settings(cursor)
+        conn.autocommit = False
+    return dict(wlm_timing(conn, started), seconds=seconds)
+
+
+def lease_key(table_name):
+    table_key = '.'.join(part.strip().strip('"').lower() for part in table_name.split('.'))
+    return f"{current_target()['name']}:{table_key}"
+
+
+def lease_state(lease):
+    """Classify a lease row: free to take, an ANALYZE still running, or inside the cooldown"""
+    if lease is None:
+        return 'free'
+    if lease['status'] == 'running' and lease['age_seconds'] < ANALYZE_LEASE_TTL_SECONDS:
+        return 'running'
+    if (lease['status'] == 'done' and lease['finished_seconds_ago'] is not None
+            and lease['finished_seconds_ago'] < ANALYZE_COOLDOWN_SECONDS):
+        return 'cooldown'
+    # Failed, finished before the cooldown or abandoned by a Lambda that timed out
+    return 'free'
+
+
+class LocalLeaseStore:
+    """In-memory lease store, coordinates ANALYZE between threads of one container and stands in for tests"""
+
+    def __init__(self):
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def _view(self, lease):
+        if lease is None:
+            return None
+        now = time.time()
+        view = dict(lease)
+        view['age_seconds'] = now - lease['started_at']
+        view['finished_seconds_ago'] = None if lease['finished_at'] is None else now - lease['finished_at']
+        return view
+
+    def acquire(self, table_name, owner):
+        with self._lock:
+            lease = self._view(self._leases.get(table_name))
+            state = lease_state(lease)
+            if state != 'free':
+                return state, lease
+            self._leases[table_name] = {
+                'owner': owner, 'status': 'running', 'started_at': time.time(), 'finished_at': None,
+                'mode': None, 'seconds': None, 'statement_id': None, 'error': None
+            }
+            return 'acquired', None
+
+    def get(self, table_name):
+        with self._lock:
+            return self._view(self._leases.get(table_name))
+
+    def attach_statement(self, table_name, owner, statement_id):
+        with self._lock:
+            lease = self._leases.get(table_name)
+            if lease and lease['owner'] == owner:
+                lease['statement_id'] = statement_id
+
+    def release(self, table_name, owner, status, mode=None, seconds=None, error=None):
+        with self._lock:
+            lease = self._leases.get(table_name)
+            if lease and lease['owner'] == owner:
+                lease.update(status=status, finished_at=time.time(), mode=mode or lease['mode'],
+                             seconds=seconds, error=error)
+
+    def release_statement(self, statement_id, status, seconds=None, error=None):
+        with self._lock:
+            for lease in self._leases.values():
+                if lease['statement_id'] == statement_id and lease['status'] == 'running':
+                    lease.update(status=status, finished_at=time.time(), seconds=seconds, error=error)
+
+
+class RedshiftLeaseStore:
+    """Lease store in a small control table, so concurrent Lambda containers see each other's ANALYZE
+
+    Acquiring takes an exclusive LOCK on the control table for one short
+    transaction, which serializes competing requests without row locks.
+    """
+
+    COLUMNS = ("owner, status, datediff(ms, started_at, getdate()) / 1000.0, "
+               "datediff(ms, finished_at, getdate()) / 1000.0, mode, seconds, statement_id, error")
+
+    def __init__(self, table):
+        self.table = quote_table_name(table)
+        self._created = set()
+
+    def _ensure_table(self, conn):
+        # Every target keeps its own control table
+        target = (current_target()['secret_id'], current_target()['database'])
+        if target in self._created:
+            return
         cursor = conn.cursor()
-        print(sql_query)
-        cursor.execute(sql_query)
-        response = cursor.fetchall()
-
-        if response:
-            table_metadata = response[0][0]  # Unpack the tuple and get the value
-            
-            # If stats_off > 10, run ANALYZE
-            if table_metadata > 10:
-                analyze_query = f"ANALYZE {table_name};"
-                print(f"Running ANALYZE on {table_name}")
-                cursor.execute(analyze_query)
+        cursor.execute(
+            f"create table if not exists {self.table} ("
+            "table_name varchar(256) not null, owner varchar(64) not null, status varchar(16) not null, "
+            "started_at timestamp not null, finished_at timestamp, mode varchar(16), seconds float8, "
+            "statement_id varchar(64), error varchar(1024))"
+        )
+        conn.commit()
+        self._created.add(target)
+
+    def _read(self, cursor, where, value):
+        cursor.execute(f"select {self.COLUMNS} from {self.table} where {where} = %s", (value,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        owner, status, age, finished_ago, mode, seconds, statement_id, error = row
+        return {
+            'owner': owner, 'status': status, 'age_seconds': float(age),
+            'finished_seconds_ago': None if finished_ago is None else float(finished_ago),
+            'mode': mode, 'seconds': None if seconds is None else float(seconds),
+            'statement_id': statement_id, 'error': error
+        }
+
+    def acquire(self, table_name, owner):
+        with redshift_connection() as conn:
+            self._ensure_table(conn)
+            cursor = conn.cursor()
+            with timed('LeaseAcquire'):
+                cursor.execute(f"lock {self.table}")
+                lease = self._read(cursor, 'table_name', table_name)
+                state = lease_state(lease)
+                if state != 'free':
+                    conn.rollback()
+                    return state, lease
+                cursor.execute(f"delete from {self.table} where table_name = %s", (table_name,))
+                cursor.execute(
+                    f"insert into {self.table} (table_name, owner, status, started_at) values (%s, %s, 'running', getdate())",
+                    (table_name, owner)
+                )
                 conn.commit()
-                result_msg = f"Table {table_name} had stats_off={table_metadata}. ANALYZE completed."
+            return 'acquired', None
+
+    def get(self, table_name):
+        with redshift_connection() as conn:
+            self._ensure_table(conn)
+            return self._read(conn.cursor(), 'table_name', table_name)
+
+    def _update(self, sql, args):
+        with redshift_connection() as conn:
+            self._ensure_table(conn)
+            conn.cursor().execute(sql, args)
+            conn.commit()
+
+    def attach_statement(self, table_name, owner, statement_id):
+        self._update(f"update {self.table} set statement_id = %s where table_name = %s and owner = %s",
+                     (statement_id, table_name, owner))
+
+    def release(self, table_name, owner, status, mode=None, seconds=None, error=None):
+        self._update(
+            f"update {self.table} set status = %s, finished_at = getdate(), mode = coalesce(%s, mode), "
+            "seconds = %s, error = %s where table_name = %s and owner = %s",
+            (status, mode, seconds, (error or '')[:1024] or None, table_name, owner)
+        )
+
+    def release_statement(self, statement_id, status, seconds=None, error=None):
+        self._update(
+            f"update {self.table} set status = %s, finished_at = getdate(), seconds = %s, error = %s "
+            "where statement_id = %s and status = 'running'",
+            (status, seconds, (error or '')[:1024] or None, statement_id)
+        )
+
+
+def get_lease_store():
+    """Lease store selected by the LeaseStore setting, or None when coordination is off"""
+    global _lease_store
+    if _lease_store is None and LEASE_STORE != 'off':
+        _lease_store = LocalLeaseStore() if LEASE_STORE == 'local' else RedshiftLeaseStore(LEASE_TABLE)
+    return _lease_store
+
+
+def wait_for_lease(store, table_name, lease, wait_ms=None):
+    """Poll a lease held by someone else until its ANALYZE finishes or the wait budget runs out"""
+    deadline = None if not wait_ms or wait_ms == float('inf') else time.monotonic() + wait_ms / 1000
+    with timed('LeaseWait'):
+        while lease and lease['status'] == 'running' and lease_state(lease) == 'running':
+            if deadline is not None and time.monotonic() + ANALYZE_LEASE_POLL_SECONDS > deadline:
+                break
+            time.sleep(ANALYZE_LEASE_POLL_SECONDS)
+            current = store.get(table_name)
+            if current is None or current['owner'] != lease['owner']:
+                break
+            lease = current
+    return lease
+
+
+def refresh_statement_lease(store, lease):
+    """Settle a background ANALYZE lease whose Data API statement already ended"""
+    response = get_redshift_data_client().describe_statement(Id=lease['statement_id'])
+    if response['Status'] in ('FINISHED', 'FAILED', 'ABORTED'):
+        seconds = round(response['Duration'] / 1e9, 3) if response.get('Duration', -1) >= 0 else None
+        status = 'done' if response['Status'] == 'FINISHED' else 'failed'
+        store.release_statement(lease['statement_id'], status, seconds, response.get('Error'))
+        return True
+    return False
+
+
+def coordinated_analyze(table_name, analyze, wait_ms=None, background=False):
+    """Run analyze() under the table's lease unless an ANALYZE is already in flight or just finished
+
+    analyze() returns the outcome dict of the ANALYZE it ran, or a statement id
+    when background is set. The result carries a coordination key: ran,
+    joined (the in-flight ANALYZE's outcome), running (still in flight when
+    the wait ran out) or cooldown (analyzed within ANALYZE_COOLDOWN_SECONDS).
+    """
+    store = get_lease_store()
+    key = lease_key(table_name)
+    owner = uuid.uuid4().hex
+    try:
+        state, lease = store.acquire(key, owner) if store else ('acquired', None)
+        if state == 'running' and lease['statement_id'] and refresh_statement_lease(store, lease):
+            state, lease = store.acquire(key, owner)
+    except Exception as e:
+        # Coordination is best effort, an unavailable control table must not block ANALYZE
+        print(f"Lease store unavailable ({e}), running ANALYZE on {table_name} uncoordinated")
+        store, state, lease = None, 'acquired', None
+
+    if state == 'cooldown':
+        print(f"ANALYZE on {table_name} finished {lease['finished_seconds_ago']:.0f}s ago, within the cooldown")
+        return {'coordination': 'cooldown', 'mode': lease['mode'], 'seconds': lease['seconds'],
+                'finished_seconds_ago': round(lease['finished_seconds_ago'])}
+    if state == 'running':
+        print(f"ANALYZE on {table_name} already in flight, joining it")
+        if not lease['statement_id'] and not background:
+            lease = wait_for_lease(store, key, lease, wait_ms)
+        if lease['status'] == 'running':
+            return {'coordination': 'running', 'statement_id': lease['statement_id'],
+                    'running_seconds': round(lease['age_seconds'])}
+        if lease['status'] == 'failed':
+            raise Exception(f"ANALYZE joined from another request failed: {lease['error']}")
+        note_maintenance(table_name)
+        return {'coordination': 'joined', 'mode': lease['mode'], 'seconds': lease['seconds']}
+
+    try:
+        outcome = analyze()
+    except Exception as e:
+        release_lease(store, key, owner, 'failed', error=str(e))
+        raise
+    note_maintenance(table_name)
+    if store and background:
+        try:
+            store.attach_statement(key, owner, outcome['statement_id'])
+        except Exception as e:
+            print(f"Could not attach {outcome['statement_id']} to the ANALYZE lease on {table_name}: {e}")
+    else:
+        release_lease(store, key, owner, 'done', outcome['mode'], outcome['seconds'])
+    return dict(outcome, coordination='ran')
+
+
+def release_lease(store, key, owner, status, mode=None, seconds=None, error=None):
+    """Release a lease, logging rather than raising so the ANALYZE outcome or error reaches the caller"""
+    if not store:
+        return
+    try:
+        store.release(key, owner, status, mode, seconds, error)
+    except Exception as e:
+        print(f"Could not release the ANALYZE lease {key}: {e}")
+
+
+class SqliteHistoryStore:
+    """stats_off history in a local SQLite file, for tests and single-container setups"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._created = False
+
+    def _connect(self):
+        import sqlite3
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._created:
+            conn.execute(
+                f"create table if not exists {HISTORY_TABLE_NAME} (target text not null, table_name text not null, "
+                "stats_off real, tbl_rows integer, recorded_at real not null)"
+            )
+            conn.execute(f"create index if not exists {HISTORY_TABLE_NAME}_idx on {HISTORY_TABLE_NAME} (target, recorded_at)")
+            self._created = True
+        return conn
+
+    def record(self, target, points):
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.executemany(
+                    f"insert into {HISTORY_TABLE_NAME} (target, table_name, stats_off, tbl_rows, recorded_at) "
+                    "values (?, ?, ?, ?, ?)",
+                    [(target,) + point for point in points]
+                )
+                conn.execute(f"delete from {HISTORY_TABLE_NAME} where recorded_at < ?",
+                             (time.time() - HISTORY_RETENTION_DAYS * 86400,))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def drift_rates(self, target, lookback_hours):
+        with self._lock:
+            conn = self._connect()
+            try:
+                now = time.time()
+                return conn.execute(
+                    DRIFT_QUERY.format(table=HISTORY_TABLE_NAME).replace('%s', '?'),
+                    (now, target, now - lookback_hours * 3600)
+                ).fetchall()
+            finally:
+                conn.close()
+
+
+class RedshiftHistoryStore:
+    """stats_off history in a small control table on each target, shared by every Lambda container"""
+
+    def __init__(self, table):
+        self.table = quote_table_name(table)
+        self._created = set()
+
+    def _ensure_table(self, conn):
+        target = (current_target()['secret_id'], current_target()['database'])
+        if target in self._created:
+            return
+        cursor = conn.cursor()
+        cursor.execute(
+            f"create table if not exists {self.table} ("
+            "target varchar(64) not null, table_name varchar(256) not null, stats_off float8, tbl_rows bigint, "
+            "recorded_at float8 not null) diststyle even sortkey (recorded_at)"
+        )
+        # Retention runs once per container, history is only read over the last few days
+        cursor.execute(f"delete from {self.table} where recorded_at < %s",
+                       (time.time() - HISTORY_RETENTION_DAYS * 86400,))
+        conn.commit()
+        self._created.add(target)
+
+    def record(self, target, points):
+        with redshift_connection() as conn:
+            self._ensure_table(conn)
+            cursor = conn.cursor()
+            # One multi-row insert per batch, single-row inserts are slow on Redshift
+            for start in range(0, len(points), HISTORY_INSERT_BATCH):
+                batch = points[start:start + HISTORY_INSERT_BATCH]
+                cursor.execute(
+                    f"insert into {self.table} (target, table_name, stats_off, tbl_rows, recorded_at) values "
+                    + ", ".join(["(%s, %s, %s, %s, %s)"] * len(batch)),
+                    tuple(value for point in batch for value in (target,) + point)
+                )
+            conn.commit()
+
+    def drift_rates(self, target, lookback_hours):
+        with redshift_connection() as conn:
+            self._ensure_table(conn)
+            cursor = conn.cursor()
+            now = time.time()
+            with timed('HistoryQuery'):
+                cursor.execute(DRIFT_QUERY.format(table=self.table), (now, target, now - lookback_hours * 3600))
+                rows = []
+                while True:
+                    batch = cursor.fetchmany(1000)
+                    if not batch:
+                        return rows
+                    rows.extend(batch)
+
+
+def get_history_store():
+    """History store selected by the HistoryStore setting, or None when history is off"""
+    global _history_store
+    if _history_store is None and HISTORY_STORE != 'off':
+        if HISTORY_STORE == 'sqlite':
+            _history_store = SqliteHistoryStore(HISTORY_PATH)
+        else:
+            _history_store = RedshiftHistoryStore(HISTORY_TABLE)
+    return _history_store
+
+
+def record_history(rows):
+    """Record stats_off and row counts of checked tables, at most once per table per HistoryIntervalSeconds
+
+    History is best effort: a failing store is logged and never fails the check.
+    """
+    store = get_history_store()
+    if not store or not rows:
+        return
+    target = current_target()['name']
+    now = time.time()
+    points = []
+    with _history_lock:
+        for row in rows:
+            key = (target, f"{row[0]}.{row[1]}".lower())
+            if now - _history_recorded.get(key, 0) < HISTORY_INTERVAL_SECONDS:
+                continue
+            _history_recorded[key] = now
+            points.append((key[1], None if row[3] is None else float(row[3]), int(row[7] or 0), now))
+    if not points:
+        return
+    try:
+        with timed('HistoryRecord'):
+            store.record(target, points)
+    except Exception as e:
+        print(f"Could not record stats history ({e})")
+
+
+def predict_stale_tables(schema_name=None, table_pattern=None, horizon_hours=None, target=None, context=None):
+    """List tables whose stats_off is predicted to cross the threshold within the horizon
+
+    Each table's drift is a least squares fit of stats_off over time since its
+    last ANALYZE (a drop in stats_off starts a new segment).
+    """
+    horizon_hours = float(horizon_hours or 24)
+    if target:
+        results = run_on_targets(
+            resolve_targets(target), lambda: predict_stale_tables(schema_name, table_pattern, horizon_hours), context
+        )
+        if len(results) == 1:
+            return dict(results[0][1], target=results[0][0])
+        merged = {'horizon_hours': horizon_hours, 'threshold': STATS_OFF_THRESHOLD, 'predicted': [], 'targets': {}}
+        for name, result, error in results:
+            merged['targets'][name] = {'error': error} if error else {
+                k: result[k] for k in ('already_stale', 'tables_with_history', 'insufficient_history')
+            }
+            merged['predicted'].extend(dict(entry, target=name) for entry in (result or {}).get('predicted', []))
+        merged['predicted'].sort(key=lambda entry: entry['hours_to_threshold'])
+        return merged
+
+    store = get_history_store()
+    if not store:
+        raise Exception("Stats history is off, set HistoryStore to record it")
+    snapshot = get_catalog()
+    lookback_hours = HISTORY_LOOKBACK_DAYS * 24
+    pattern = like_to_regex(table_pattern) if table_pattern else None
+
+    predicted = []
+    already_stale = 0
+    insufficient = 0
+    drift = store.drift_rates(current_target()['name'], lookback_hours)
+    for table_key, points, stats_drift, rows_drift, span_hours in drift:
+        row = snapshot['tables'].get(table_key)
+        if row is None:
+            continue
+        if schema_name and row[0].lower() != schema_name.lower():
+            continue
+        if pattern is not None and not pattern.fullmatch(row[1]):
+            continue
+        stats_off = float(row[3] or 0)
+        if stats_off > STATS_OFF_THRESHOLD:
+            already_stale += 1
+            continue
+        if stats_drift is None or float(span_hours or 0) < HISTORY_MIN_SPAN_HOURS:
+            insufficient += 1
+            continue
+        stats_drift = float(stats_drift)
+        if stats_drift <= 0:
+            continue
+        hours_to_threshold = (STATS_OFF_THRESHOLD - stats_off) / stats_drift
+        if hours_to_threshold <= horizon_hours:
+            predicted.append({
+                'table': f"{row[0]}.{row[1]}",
+                'stats_off': stats_off,
+                'drift_per_hour': round(stats_drift, 3),
+                'hours_to_threshold': round(hours_to_threshold, 1),
+                'predicted_stats_off': round(stats_off + stats_drift * horizon_hours, 2),
+                'rows_per_hour': round(float(rows_drift or 0)),
+                'history_points': int(points),
+                'history_hours': round(float(span_hours), 1)
+            })
+
+    predicted.sort(key=lambda entry: entry['hours_to_threshold'])
+    return {
+        'horizon_hours': horizon_hours,
+        'threshold': STATS_OFF_THRESHOLD,
+        'predicted': predicted,
+        'already_stale': already_stale,
+        'tables_with_history': len(drift),
+        'insufficient_history': insufficient,
+        'catalog_age_seconds': catalog_age_seconds(snapshot)
+    }
+
+
+def describe_coordination(outcome):
+    """Explain an ANALYZE this request did not run itself"""
+    if outcome['coordination'] == 'joined':
+        return (f"ANALYZE ({outcome['mode']}) was already running from another request and completed "
+                f"in {outcome['seconds']}s.")
+    if outcome['coordination'] == 'cooldown':
+        return (f"ANALYZE ({outcome['mode']}) already ran {outcome['finished_seconds_ago']}s ago, not running it "
+                f"again within the {ANALYZE_COOLDOWN_SECONDS}s cooldown.")
+    if outcome.get('statement_id'):
+        return (f"ANALYZE is already running from another request with statement_id {outcome['statement_id']}, "
+                f"use check_analyze_status to follow it.")
+    return f"ANALYZE is already running from another request for {outcome['running_seconds']}s and has not finished yet."
+
+
+def health_from_row(row):
+    """Turn a TABLE_HEALTH_QUERY row into a dict with plain numeric fields"""
+    (schema, table, table_id, stats_off, unsorted, skew_rows, skew_sortkey1,
+     tbl_rows, visible_rows, size, encoded, diststyle, sortkey1) = row
+
+    def number(value):
+        return float(value) if value is not None else None
+
+    tbl_rows = int(tbl_rows or 0)
+    visible_rows = int(visible_rows) if visible_rows is not None else tbl_rows
+    return {
+        'table': f"{schema}.{table}",
+        'table_id': table_id,
+        'stats_off': number(stats_off),
+        'unsorted': number(unsorted),
+        'skew_rows': number(skew_rows),
+        'skew_sortkey1': number(skew_sortkey1),
+        'tbl_rows': tbl_rows,
+        # tbl_rows still counts rows that are marked for deletion but not vacuumed yet
+        'deleted_pct': round(100.0 * (tbl_rows - visible_rows) / tbl_rows, 2) if tbl_rows else 0.0,
+        'size_mb': int(size or 0),
+        'encoded': encoded.strip() if encoded else None,
+        'diststyle': diststyle.strip() if diststyle else None,
+        'sortkey1': sortkey1.strip() if sortkey1 else None
+    }
+
+
+def recommend_maintenance(health):
+    """Recommend maintenance for a table from its health profile
+
+    Runnable operations come first in the order they should run (VACUUM before
+    ANALYZE). Design problems that only a DDL change fixes are returned as advice.
+    """
+    operations = []
+    advice = []
+    interleaved = (health['sortkey1'] or '').upper() == 'INTERLEAVED'
+    needs_sort = health['unsorted'] is not None and health['unsorted'] > UNSORTED_THRESHOLD
+    needs_delete = health['deleted_pct'] > DELETED_ROWS_THRESHOLD
+
+    if needs_sort and interleaved:
+        operations.append({'operation': 'VACUUM REINDEX', 'reason': f"interleaved sort key, unsorted={health['unsorted']}%"})
+    elif needs_sort and needs_delete:
+        operations.append({
+            'operation': 'VACUUM FULL',
+            'reason': f"unsorted={health['unsorted']}% and deleted rows={health['deleted_pct']}%"
+        })
+    elif needs_sort:
+        operations.append({'operation': 'VACUUM SORT ONLY', 'reason': f"unsorted={health['unsorted']}%"})
+    # VACUUM FULL and VACUUM REINDEX both reclaim deleted rows as well
+    if needs_delete and not needs_sort:
+        operations.append({'operation': 'VACUUM DELETE ONLY', 'reason': f"deleted rows={health['deleted_pct']}%"})
+    if health['stats_off'] is not None and health['stats_off'] > STATS_OFF_THRESHOLD:
+        operations.append({'operation': 'ANALYZE', 'reason': f"stats_off={health['stats_off']}"})
+
+    if health['sortkey1'] is None and health['tbl_rows'] > 0:
+        advice.append("no sort key, range filters have to scan every block")
+    if health['skew_rows'] is not None and health['skew_rows'] > SKEW_ROWS_THRESHOLD:
+        advice.append(f"skew_rows={health['skew_rows']}, review the distribution key ({health['diststyle']})")
+    if health['skew_sortkey1'] is not None and health['skew_sortkey1'] > SKEW_SORTKEY_THRESHOLD:
+        advice.append(f"skew_sortkey1={health['skew_sortkey1']}, consider RAW encoding on the first sort key column")
+    if health['encoded'] == 'N':
+        advice.append("no column compression encoding, run ANALYZE COMPRESSION")
+
+    return operations, advice
+
+
+def get_catalog(secret_id=None, database=None, force_refresh=False):
+    """Return the in-memory svv_table_info snapshot, reloading it once it is older than the TTL"""
+    secret_id = secret_id or current_target()['secret_id']
+    database = database or current_target()['database']
+    key = (secret_id, database)
+    with _catalog_lock:
+        load_lock = _catalog_load_locks.setdefault(key, threading.Lock())
+
+    # Concurrent callers for the same database share one reload
+    with load_lock:
+        snapshot = _catalog_snapshots.get(key)
+        if snapshot and not force_refresh and time.monotonic() - snapshot['loaded_at'] < CATALOG_TTL_SECONDS:
+            return snapshot
+
+        with redshift_connection(secret_id, database) as conn:
+            with timed('CatalogLoad'):
+                cursor = conn.cursor()
+                cursor.execute(TABLE_HEALTH_QUERY)
+                rows = cursor.fetchall()
+        set_metric_property('CatalogRows', len(rows))
+
+        # Rows stay as tuples to keep the snapshot small, health_from_row expands them on demand
+        tables = {}
+        by_name = {}
+        for row in rows:
+            table_key = f"{row[0]}.{row[1]}".lower()
+            tables[table_key] = row
+            by_name.setdefault(row[1].lower(), []).append(table_key)
+        snapshot = {'loaded_at': time.monotonic(), 'tables': tables, 'by_name': by_name}
+        _catalog_snapshots[key] = snapshot
+        print(f"Loaded svv_table_info snapshot of {len(tables)} tables from {database}")
+        return snapshot
+
+
+def invalidate_catalog(secret_id=None, database=None):
+    """Drop a snapshot after this Lambda changed table statistics, so the next lookup reloads it"""
+    key = (secret_id or current_target()['secret_id'], database or current_target()['database'])
+    with _catalog_lock:
+        _catalog_snapshots.pop(key, None)
+
+
+def catalog_age_seconds(snapshot):
+    return round(time.monotonic() - snapshot['loaded_at'], 1)
+
+
+def find_tables(snapshot, table_name):
+    """Return the snapshot rows for a table name, optionally schema qualified"""
+    table_name = table_name.strip().lower()
+    if '.' in table_name:
+        row = snapshot['tables'].get(table_name)
+        return [row] if row else []
+    return [snapshot['tables'][key] for key in sorted(snapshot['by_name'].get(table_name, []))]
+
+
+def name_tokens(name):
+    """Split a name into lowercase word tokens, so sales fact, SalesFact and sales_fact compare equal"""
+    name = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', name)
+    return [token for token in re.split(r'[^a-z0-9]+', name.lower()) if token]
+
+
+def name_trigrams(tokens):
+    compact = '^' + ''.join(tokens) + '$'
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+def get_name_index(snapshot):
+    """Return the fuzzy name index of a snapshot, building it on first use"""
+    index = snapshot.get('name_index')
+    if index is None:
+        names = {}
+        by_trigram = {}
+        for key, row in snapshot['tables'].items():
+            schema_tokens, table_tokens = name_tokens(row[0]), name_tokens(row[1])
+            table_trigrams = name_trigrams(table_tokens)
+            names[key] = (schema_tokens, table_tokens, name_trigrams(schema_tokens), table_trigrams)
+            for trigram in table_trigrams:
+                by_trigram.setdefault(trigram, set()).add(key)
+        index = {'names': names, 'by_trigram': by_trigram}
+        snapshot['name_index'] = index
+    return index
+
+
+def _similarity(query_tokens, query_trigrams, tokens, trigrams):
+    if ''.join(query_tokens) == ''.join(tokens):
+        return 1.0
+    # Dice coefficient over character trigrams, nudged up by whole-word overlap.
+    # Words also match their plural or a short suffix (order / orders)
+    dice = 2.0 * len(query_trigrams & trigrams) / (len(query_trigrams) + len(trigrams))
+    matched = [
+        query_token for query_token in set(query_tokens)
+        if any(token.startswith(query_token) and len(token) - len(query_token) <= 2 for token in tokens)
+    ]
+    token_overlap = len(matched) / len(set(query_tokens))
+    return 0.7 * dice + 0.3 * token_overlap
+
+
+def fuzzy_find_tables(snapshot, table_name, limit=FUZZY_CANDIDATE_LIMIT):
+    """Rank snapshot tables by similarity to a near-miss name, best first"""
+    schema_part, _, table_part = table_name.strip().rpartition('.')
+    query_tokens = name_tokens(table_part)
+    if not query_tokens:
+        return []
+    query_trigrams = name_trigrams(query_tokens)
+    schema_tokens = name_tokens(schema_part)
+    schema_trigrams = name_trigrams(schema_tokens)
+
+    index = get_name_index(snapshot)
+    candidates = set()
+    for trigram in query_trigrams:
+        candidates |= index['by_trigram'].get(trigram, set())
+
+    scored = []
+    for key in candidates:
+        row_schema_tokens, row_table_tokens, row_schema_trigrams, row_table_trigrams = index['names'][key]
+        score = _similarity(query_tokens, query_trigrams, row_table_tokens, row_table_trigrams)
+        if schema_tokens:
+            schema_score = _similarity(schema_tokens, schema_trigrams, row_schema_tokens, row_schema_trigrams)
+            score = 0.8 * score + 0.2 * schema_score
+        if score >= FUZZY_CANDIDATE_MIN_SCORE:
+            scored.append((round(score, 3), key))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [{'table': f"{snapshot['tables'][key][0]}.{snapshot['tables'][key][1]}", 'score': score}
+            for score, key in scored[:limit]]
+
+
+def resolve_table(snapshot, table_name):
+    """Find the snapshot rows for a table name, falling back to fuzzy matching
+
+    Returns the matching rows and the candidate list. A fuzzy match is only
+    accepted when it scores well and clearly beats the runner up; otherwise no
+    rows are returned and the caller can offer the candidates instead.
+    """
+    rows = find_tables(snapshot, table_name)
+    if rows:
+        return rows, []
+    candidates = fuzzy_find_tables(snapshot, table_name)
+    if candidates and candidates[0]['score'] >= FUZZY_MATCH_MIN_SCORE and (
+            len(candidates) == 1 or candidates[0]['score'] - candidates[1]['score'] >= FUZZY_MATCH_MARGIN):
+        print(f"Resolved {table_name} to {candidates[0]['table']} (score {candidates[0]['score']})")
+        return find_tables(snapshot, candidates[0]['table']), candidates[:1]
+    return [], candidates
+
+
+def like_to_regex(pattern):
+    """Translate a SQL LIKE pattern into a compiled regular expression"""
+    translated = ''.join(
+        '.*' if char == '%' else '.' if char == '_' else re.escape(char)
+        for char in pattern
+    )
+    return re.compile(translated, re.DOTALL)
+
+
+def remaining_time_ms(context):
+    """Milliseconds left in this invocation, or an effectively unlimited budget when run locally"""
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return float('inf')
+    return context.get_remaining_time_in_millis()
+
+
+def analyze_stale_tables(context, schema_name=None, table_pattern=None, table_names=None, max_parallel=None,
+                         analyze_mode=None):
+    """ANALYZE every stale table in the selection with bounded parallelism, stopping before the Lambda times out"""
+    # Column lists differ per table, so this action has no way to take one
+    if analyze_mode and analyze_mode.strip().lower() == 'columns':
+        raise Exception("analyze_mode columns is not supported for analyze_stale_tables, use full or predicate")
+    started = time.monotonic()
+    max_parallel = max(1, min(int(max_parallel or ANALYZE_MAX_PARALLELISM), ANALYZE_MAX_PARALLELISM))
+
+    selection = check_tables_metadata(table_names, schema_name, table_pattern)
+    # Worst tables first, so an early stop still fixes the ones that hurt most
+    queue = sorted(
+        (t for t in selection['tables'] if t['needs_analyze']),
+        key=lambda t: t['stats_off'],
+        reverse=True
+    )
+    print(f"{len(queue)} stale tables to analyze with parallelism {max_parallel}")
+
+    def analyze_one(table, timeout_ms):
+        def analyze():
+            with redshift_connection() as conn:
+                return run_analyze(conn, table['table'], timeout_ms, mode=analyze_mode)
+        return coordinated_analyze(table['table'], analyze, timeout_ms)
+
+    analyzed = []
+    skipped = []
+    blocked = []
+    failed = []
+    pending = []
+    saturated = None
+    in_flight = {}
+    stopped_early = False
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        while queue or in_flight:
+            while queue and len(in_flight) < max_parallel:
+                budget_ms = remaining_time_ms(context) - LAMBDA_TIME_MARGIN_MS
+                if budget_ms <= 0:
+                    stopped_early = True
+                    pending.extend(t['table'] for t in queue)
+                    queue = []
+                    break
+                table = queue.pop(0)
+                table['health'] = health_from_row(find_tables(get_catalog(), table['table'])[0])
+                table['estimate'] = estimate_operation_seconds(table['health'], 'ANALYZE', analyze_mode)
+                if table['estimate'][0] * 1000 > budget_ms:
+                    # Would be cancelled by the timeout anyway, smaller tables further down may still fit
+                    print(f"ANALYZE of {table['table']} estimated at {table['estimate'][0]}s does not fit, deferring it")
+                    pending.append(table['table'])
+                    continue
+                timeout_ms = None if budget_ms == float('inf') else budget_ms
+                # Worker threads keep the target this request runs against
+                in_flight[executor.submit(contextvars.copy_context().run, analyze_one, table, timeout_ms)] = table
+
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                table = in_flight.pop(future)
+                try:
+                    outcome = future.result()
+                    if outcome['coordination'] in ('ran', 'joined'):
+                        # Runs of some columns would drag down the full-table history
+                        if outcome['coordination'] == 'ran' and outcome['mode'] == 'full':
+                            record_estimate_error(table['health'], 'ANALYZE', *table['estimate'], outcome['seconds'])
+                        analyzed.append({
+                            'table': table['table'],
+                            'stats_off': table['stats_off'],
+                            'mode': outcome['mode'],
+                            'seconds': outcome['seconds'],
+                            'queued_seconds': outcome.get('queued_seconds'),
+                            'executing_seconds': outcome.get('executing_seconds'),
+                            'estimated_seconds': table['estimate'][0],
+                            'coordination': outcome['coordination']
+                        })
+                    elif outcome['coordination'] == 'running':
+                        # Another request's ANALYZE outlived our budget, it will finish on its own
+                        pending.append(table['table'])
+                    else:
+                        skipped.append({'table': table['table'], 'reason': 'cooldown',
+                                        'analyzed_seconds_ago': outcome['finished_seconds_ago']})
+                except MaintenanceBlocked as e:
+                    print(f"ANALYZE skipped on {table['table']}: {e}")
+                    blocked.append({'table': table['table'], 'blocked_by': e.blockers})
+                except ClusterSaturated as e:
+                    # Starting more ANALYZE would only lengthen the queues, leave the rest for later
+                    print(f"ANALYZE deferred on {table['table']}: {e}")
+                    saturated = str(e)
+                    pending.append(table['table'])
+                    pending.extend(t['table'] for t in queue)
+                    queue = []
+                except Exception as e:
+                    print(f"ANALYZE failed on {table['table']}: {e}")
+                    if 'statement timeout' in str(e).lower():
+                        # Cancelled to protect the time budget, the table still needs ANALYZE
+                        stopped_early = True
+                        pending.append(table['table'])
+                    else:
+                        failed.append({'table': table['table'], 'error': str(e)})
+
+    if analyzed:
+        invalidate_catalog()
+
+    return {
+        'analyzed': analyzed,
+        'skipped': skipped,
+        'blocked': blocked,
+        'failed': failed,
+        'pending': pending,
+        'deferred_reason': saturated,
+        'not_found': selection['not_found'],
+        'stopped_early': stopped_early,
+        'elapsed_seconds': round(time.monotonic() - started, 3)
+    }
+
+
+def check_table_metadata(table_name, run_async=False, analyze_mode=None, columns=None, analyze_threshold_percent=None,
+                         context=None):
+    """Report a table's stats_off, running ANALYZE when it is stale
+
+    ANALYZE runs inline when it is predicted to fit in the time left, in the
+    background when not, and not at all when it would take too long. The
+    result's message sums the outcome up in one sentence.
+    """
+    if not table_name:
+        raise Exception(f"No table_name provided")
+
+    snapshot = get_catalog()
+    response, candidates = resolve_table(snapshot, table_name)
+    if not response:
+        result = {'table': table_name, 'error': f"No metadata found for table_name {table_name}"}
+        # A table that only lives on another target beats a near miss on this one
+        found = find_on_other_targets(table_name, context)
+        if found:
+            result['found_on'] = dict(found)
+            result['message'] = (
+                f"Not in target {current_target()['name']}, use check_table_health or check_tables_metadata "
+                f"with target {' or '.join(name for name, _ in found)}."
+            )
+        elif candidates:
+            result['candidates'] = candidates
+        print(result['error'])
+        return result
+
+    record_history(response)
+    health = health_from_row(response[0])
+    stats_off = health['stats_off']
+    result = {
+        'table': health['table'],
+        'resolved_from': table_name if candidates else None,
+        'stats_off': stats_off,
+        'threshold': STATS_OFF_THRESHOLD
+    }
+
+    execution = None
+    if stats_off is not None and stats_off > STATS_OFF_THRESHOLD:
+        mode, _ = build_analyze_statements(health['table'], analyze_mode, columns)
+        estimate, basis = estimate_operation_seconds(health, 'ANALYZE', mode)
+        budget_ms = remaining_time_ms(context) - LAMBDA_TIME_MARGIN_MS
+        estimate_msg = f"estimated at {describe_duration(estimate)} from {basis}"
+        # Only a full ANALYZE is known to take that long, a cheaper mode gets the benefit of the doubt
+        if estimate > MAINTENANCE_MAX_SECONDS and mode == 'full':
+            execution = 'refused'
+        elif run_async or estimate * 1000 > budget_ms:
+            execution = 'background'
+        else:
+            execution = 'inline'
+
+    if execution == 'refused':
+        outcome = {'coordination': 'refused'}
+        message = (
+            f"ANALYZE not started: it is {estimate_msg}, longer than the {describe_duration(MAINTENANCE_MAX_SECONDS)} "
+            f"allowed, so run it in a maintenance window."
+        )
+    elif execution == 'background':
+        def analyze():
+            statement_id, mode = submit_analyze(health['table'], analyze_mode, columns, analyze_threshold_percent)
+            return {'statement_id': statement_id, 'mode': mode}
+        try:
+            outcome = coordinated_analyze(health['table'], analyze, background=True)
+        except ClusterSaturated as e:
+            outcome = {'coordination': 'saturated', 'error': str(e)}
+        if outcome['coordination'] == 'saturated':
+            message = f"ANALYZE deferred: {outcome['error']}. Retry once the queues drain."
+        elif outcome['coordination'] == 'ran':
+            reason = "" if run_async else (
+                f" because it does not fit in the {describe_duration(max(0, budget_ms) / 1000)} left in this request"
+            )
+            if estimate > MAINTENANCE_MAX_SECONDS:
+                reason += (f", not refused although the full-table estimate is over the "
+                           f"{describe_duration(MAINTENANCE_MAX_SECONDS)} allowed")
+            message = (
+                f"ANALYZE ({outcome['mode']}, {estimate_msg}) submitted in the background{reason}, "
+                f"use check_analyze_status to follow it."
+            )
+        else:
+            message = describe_coordination(outcome)
+    elif execution == 'inline':
+        # Bounded by the Lambda budget, so a lock wait is cancelled on the cluster rather than left running
+        timeout_ms = None if budget_ms == float('inf') else max(1000, budget_ms)
+
+        def analyze():
+            with redshift_connection() as conn:
+                return run_analyze(
+                    conn, health['table'], timeout_ms,
+                    mode=analyze_mode, columns=columns, threshold_percent=analyze_threshold_percent
+                )
+        try:
+            outcome = coordinated_analyze(health['table'], analyze, timeout_ms)
+        except MaintenanceBlocked as e:
+            outcome = {'coordination': 'blocked', 'error': str(e)}
+        except ClusterSaturated as e:
+            outcome = {'coordination': 'saturated', 'error': str(e)}
+        # Blocked, deferred, cooldown and still running outcomes changed nothing, keep the snapshot
+        if outcome['coordination'] in ('ran', 'joined'):
+            invalidate_catalog()
+        if outcome['coordination'] == 'blocked':
+            message = (
+                f"ANALYZE skipped: {outcome['error']}. Retry once the lock is released, "
+                f"or use run_async=true to queue it on the cluster."
+            )
+        elif outcome['coordination'] == 'saturated':
+            message = f"ANALYZE deferred so it does not add to the load: {outcome['error']}. Retry once the queues drain."
+        elif outcome['coordination'] == 'ran':
+            if outcome['mode'] == 'full':
+                record_estimate_error(health, 'ANALYZE', estimate, basis, outcome['seconds'])
+            message = (
+                f"ANALYZE ({outcome['mode']}) completed in {outcome['seconds']}s"
+                f"{describe_wlm_timing(outcome)} ({estimate_msg})."
+            )
+        else:
+            message = describe_coordination(outcome)
+    elif stats_off is None:
+        message = "No stats_off in svv_table_info yet. No ANALYZE run."
+    else:
+        message = "No ANALYZE needed."
+
+    if execution:
+        result['analyze'] = dict(outcome, execution=execution, estimated_seconds=estimate, estimate_basis=basis)
+    operations, _ = recommend_maintenance(health)
+    vacuums = [op for op in operations if op['operation'] != 'ANALYZE']
+    if vacuums:
+        result['recommended'] = vacuums
+        message += " VACUUM is recommended as well, use check_table_health to run it."
+    result['message'] = message
+    result['catalog_age_seconds'] = catalog_age_seconds(snapshot)
+    return result
+
+
+def find_on_other_targets(table_name, context=None):
+    """Look a table up concurrently on every other registered target, returning (target, tables) where it exists"""
+    others = [t for t in get_targets().values() if t['name'] != current_target()['name']]
+    if not others:
+        return []
+
+    def lookup():
+        return [f"{row[0]}.{row[1]}" for row in resolve_table(get_catalog(), table_name)[0]]
+
+    return [(name, tables) for name, tables, error in run_on_targets(others, lookup, context) if tables]
+
+
+def check_table_health(context, table_name, run_maintenance=False, vacuum_target_percent=None, target=None):
+    """Report the full health profile of a table, recommend maintenance and optionally run it"""
+    if not table_name:
+        raise Exception("No table_name provided")
+
+    if target:
+        targets = resolve_targets(target)
+        if run_maintenance and len(targets) > 1:
+            raise Exception("run_maintenance needs a single target, not all")
+        results = run_on_targets(
+            targets, lambda: check_table_health(context, table_name, run_maintenance, vacuum_target_percent), context
+        )
+        if len(results) == 1:
+            return dict(results[0][1], target=results[0][0])
+        return dict(merge_target_results(results), table=table_name)
+
+    snapshot = get_catalog()
+    response, candidates = resolve_table(snapshot, table_name)
+    if not response:
+        return {
+            'table': table_name,
+            'error': f"No metadata found for table_name {table_name}",
+            'candidates': candidates
+        }
+
+    record_history(response)
+    health = health_from_row(response[0])
+    operations, advice = recommend_maintenance(health)
+    for op in operations:
+        op['estimated_seconds'], op['estimate_basis'] = estimate_operation_seconds(health, op['operation'])
+    result = {
+        'resolved_from': table_name if candidates else None,
+        'health': health,
+        'recommended': operations,
+        'advice': advice,
+        'catalog_age_seconds': catalog_age_seconds(snapshot)
+    }
+    if not run_maintenance or not operations:
+        return result
+
+    with redshift_connection() as conn:
+        result['executed'] = run_operations(context, conn, health['table'], operations, vacuum_target_percent)
+    if any(op['status'] in ('completed', 'joined') for op in result['executed']):
+        invalidate_catalog()
+    return result
+
+
+def run_operations(context, conn, table_name, operations, vacuum_target_percent=None):
+    """Run recommended maintenance operations on one table in order, within the Lambda time budget
+
+    An operation predicted to take longer than the time left is deferred
+    with its estimate instead of being started and cancelled.
+    """
+    health = health_from_row(find_tables(get_catalog(), table_name)[0])
+    executed = []
+    for op in operations:
+        budget_ms = remaining_time_ms(context) - LAMBDA_TIME_MARGIN_MS
+        if budget_ms <= 0:
+            executed.append({'operation': op['operation'], 'status': 'skipped', 'error': 'Lambda time budget exhausted'})
+            continue
+        estimate, basis = estimate_operation_seconds(health, op['operation'])
+        if estimate * 1000 > budget_ms:
+            executed.append({
+                'operation': op['operation'], 'status': 'deferred', 'estimated_seconds': estimate, 'estimate_basis': basis,
+                'error': f"estimated at {describe_duration(estimate)}, more than the "
+                         f"{describe_duration(budget_ms / 1000)} left in this request"
+            })
+            continue
+        timeout_ms = None if budget_ms == float('inf') else budget_ms
+        try:
+            if op['operation'] == 'ANALYZE':
+                outcome = coordinated_analyze(table_name, lambda: run_analyze(conn, table_name, timeout_ms), timeout_ms)
+                if outcome['coordination'] != 'ran':
+                    executed.append({'operation': op['operation'], 'status': outcome['coordination'],
+                                     'note': describe_coordination(outcome)})
+                    continue
             else:
-                result_msg = f"Table {table_name} stats_off={table_metadata}. No ANALYZE needed."
-            
-            conn.close()
-            return result_msg
+                outcome = run_vacuum(conn, table_name, op['operation'], vacuum_target_percent, timeout_ms)
+            record_estimate_error(health, op['operation'], estimate, basis, outcome['seconds'])
+            executed.append({'operation': op['operation'], 'status': 'completed', 'seconds': outcome['seconds'],
+                             'queued_seconds': outcome['queued_seconds'],
+                             'executing_seconds': outcome['executing_seconds'], 'estimated_seconds': estimate})
+        except MaintenanceBlocked as e:
+            print(f"{op['operation']} skipped on {table_name}: {e}")
+            conn.rollback()
+            executed.append({'operation': op['operation'], 'status': 'blocked', 'error': str(e),
+                             'blocked_by': e.blockers})
+        except ClusterSaturated as e:
+            print(f"{op['operation']} deferred on {table_name}: {e}")
+            conn.rollback()
+            executed.append({'operation': op['operation'], 'status': 'deferred', 'error': str(e)})
+        except Exception as e:
+            print(f"{op['operation']} failed on {table_name}: {e}")
+            conn.rollback()
+            executed.append({'operation': op['operation'], 'status': 'failed', 'error': str(e)})
+    return executed
+
+
+def load_scan_activity(lookback_hours=None):
+    """Map table_id to (queries that scanned it, rows scanned) over the lookback window"""
+    lookback_hours = int(lookback_hours or SCAN_LOOKBACK_HOURS)
+    with redshift_connection() as conn:
+        cursor = conn.cursor()
+        for query in SCAN_ACTIVITY_QUERIES:
+            try:
+                with timed('ScanActivity'):
+                    cursor.execute(query, (lookback_hours,))
+                    rows = cursor.fetchall()
+                return {int(tbl): (int(scans or 0), int(scanned or 0)) for tbl, scans, scanned in rows}
+            except Exception as e:
+                print(f"Scan activity query failed ({e}), trying the next source")
+                conn.rollback()
+    return {}
+
+
+def load_maintenance_history(force_refresh=False):
+    """Past ANALYZE and VACUUM runs of the current target, cached per target for MaintenanceHistoryTtlSeconds
+
+    Returns {'tables': {(kind, table_id): [runs, avg seconds, avg rows]}, 'rates': {kind: seconds per row}}.
+    """
+    key = (current_target()['secret_id'], current_target()['database'])
+    with _maintenance_history_lock:
+        history = _maintenance_history.get(key)
+        if history and not force_refresh and time.monotonic() - history['loaded_at'] < MAINTENANCE_HISTORY_TTL_SECONDS:
+            return history
+
+        rows = []
+        try:
+            with redshift_connection() as conn:
+                cursor = conn.cursor()
+                for query in MAINTENANCE_HISTORY_QUERIES:
+                    try:
+                        with timed('MaintenanceHistory'):
+                            cursor.execute(query, (MAINTENANCE_HISTORY_DAYS, MAINTENANCE_HISTORY_DAYS))
+                            rows = cursor.fetchall()
+                        break
+                    except Exception as e:
+                        print(f"Maintenance history query failed ({e}), trying the next source")
+                        conn.rollback()
+        except Exception as e:
+            # Estimates fall back to table size, which is better than failing the request
+            print(f"Could not load maintenance history ({e})")
+
+        tables = {}
+        totals = {}
+        for kind, table_id, runs, avg_seconds, avg_rows in rows:
+            runs, avg_seconds, avg_rows = int(runs), float(avg_seconds or 0), float(avg_rows or 0)
+            tables[(kind, int(table_id))] = [runs, avg_seconds, avg_rows]
+            if avg_rows > 0:
+                total = totals.setdefault(kind, [0, 0.0, 0.0])
+                total[0] += runs
+                total[1] += runs * avg_seconds
+                total[2] += runs * avg_rows
+        history = {
+            'loaded_at': time.monotonic(),
+            'tables': tables,
+            'rates': {kind: seconds / rows for kind, (runs, seconds, rows) in totals.items()
+                      if runs >= ESTIMATE_MIN_CLUSTER_RUNS}
+        }
+        _maintenance_history[key] = history
+        return history
+
+
+def estimate_operation_seconds(health, operation, analyze_mode=None):
+    """Predict how long one maintenance operation takes on a table, and say what the prediction is based on
+
+    A table's own past runs are scaled by how much it has grown since, then
+    the cluster's seconds per row over all recent runs, then table size.
+    History does not say how many columns a run analyzed, so for a predicate
+    or column list ANALYZE the full-table estimate is an upper bound.
+    """
+    kind = 'ANALYZE' if operation == 'ANALYZE' else 'VACUUM'
+    history = load_maintenance_history()
+    past = history['tables'].get((kind, int(health['table_id'])))
+    if past:
+        runs, avg_seconds, avg_rows = past
+        growth = health['tbl_rows'] / avg_rows if avg_rows > 0 and health['tbl_rows'] else 1.0
+        seconds, basis = avg_seconds * growth, f"{runs} past {kind} runs of this table"
+    elif kind in history['rates'] and health['tbl_rows']:
+        seconds, basis = history['rates'][kind] * health['tbl_rows'], f"recent {kind} runs on the cluster"
+    else:
+        rate = ESTIMATED_ANALYZE_MB_PER_SECOND if kind == 'ANALYZE' else ESTIMATED_VACUUM_MB_PER_SECOND
+        seconds, basis = health['size_mb'] / rate, "table size"
+    if kind == 'ANALYZE' and analyze_mode not in (None, 'full'):
+        basis += f", an upper bound for ANALYZE of {analyze_mode} columns"
+    return round(max(1.0, seconds), 1), basis
+
+
+def estimate_maintenance_seconds(health, operations):
+    """Predicted cost of a table's maintenance, the sum of its operations"""
+    return round(sum(estimate_operation_seconds(health, op['operation'])[0] for op in operations), 1)
+
+
+def record_estimate_error(health, operation, estimated_seconds, basis, actual_seconds):
+    """Log how far an estimate was off, and fold the actual run into the cached history"""
+    error_percent = round(100.0 * (actual_seconds - estimated_seconds) / estimated_seconds, 1)
+    # One JSON line per run, so CloudWatch Logs Insights can chart the error by basis over time
+    print(json.dumps({'MaintenanceEstimate': {
+        'table': health['table'], 'operation': operation, 'basis': basis,
+        'estimated_seconds': estimated_seconds, 'actual_seconds': actual_seconds, 'error_percent': error_percent
+    }}))
+    kind = 'ANALYZE' if operation == 'ANALYZE' else 'VACUUM'
+    key = (current_target()['secret_id'], current_target()['database'])
+    with _maintenance_history_lock:
+        history = _maintenance_history.get(key)
+        if history:
+            runs, avg_seconds, avg_rows = history['tables'].get((kind, int(health['table_id'])), [0, 0.0, 0.0])
+            history['tables'][(kind, int(health['table_id']))] = [
+                runs + 1,
+                (avg_seconds * runs + actual_seconds) / (runs + 1),
+                (avg_rows * runs + health['tbl_rows']) / (runs + 1)
+            ]
+
+
+def describe_duration(seconds):
+    if seconds < 120:
+        return f"{round(seconds)}s"
+    if seconds < 7200:
+        return f"{round(seconds / 60)} min"
+    return f"{round(seconds / 3600, 1):g} h"
+
+
+def maintenance_impact(health, operations, scans):
+    """How much query work a table's maintenance would help: scans times how far off the table is"""
+    severity = 0.0
+    for op in operations:
+        if op['operation'] == 'ANALYZE':
+            severity += (health['stats_off'] or 0) / 100
+        elif op['operation'] == 'VACUUM DELETE ONLY':
+            severity += health['deleted_pct'] / 100
         else:
-            return_msg = f"No metadata found for table_name {table_name}"
-            print(return_msg)
-            conn.close()
-            return return_msg
+            severity += max(health['unsorted'] or 0, health['deleted_pct']) / 100
+    return round(scans * severity, 3), severity
+
+
+def plan_maintenance(context, schema_name=None, table_pattern=None, top_k=None, run_maintenance=False,
+                     lookback_hours=None):
+    """Rank tables needing maintenance by how much recent query activity they would speed up
+
+    Tables scanned often and far off their statistics or sort order come
+    first. With run_maintenance the top_k entries run in plan order, skipping
+    any whose estimated cost no longer fits in the Lambda time budget.
+    """
+    snapshot = get_catalog()
+    scan_activity = load_scan_activity(lookback_hours)
+    pattern = like_to_regex(table_pattern) if table_pattern else None
+
+    plan = []
+    for row in snapshot['tables'].values():
+        if schema_name and row[0].lower() != schema_name.lower():
+            continue
+        if pattern is not None and not pattern.fullmatch(row[1]):
+            continue
+        health = health_from_row(row)
+        operations, _ = recommend_maintenance(health)
+        if not operations:
+            continue
+        scans, rows_scanned = scan_activity.get(health['table_id'], (0, 0))
+        impact, severity = maintenance_impact(health, operations, scans)
+        plan.append({
+            'table': health['table'],
+            'operations': [op['operation'] for op in operations],
+            'reasons': [op['reason'] for op in operations],
+            'scans': scans,
+            'rows_scanned': rows_scanned,
+            'size_mb': health['size_mb'],
+            'impact': impact,
+            'estimated_seconds': estimate_maintenance_seconds(health, operations),
+            '_severity': severity,
+            '_operations': operations
+        })
+
+    # Tables nobody scanned in the window still rank by how far off they are, after everything that is used
+    plan.sort(key=lambda entry: (-entry['impact'], -entry['_severity'], entry['estimated_seconds']))
+    for rank, entry in enumerate(plan, 1):
+        entry['rank'] = rank
+
+    executed = []
+    if run_maintenance:
+        top_k = max(1, int(top_k or 5))
+        with redshift_connection() as conn:
+            for entry in plan[:top_k]:
+                budget_ms = remaining_time_ms(context) - LAMBDA_TIME_MARGIN_MS
+                if entry['estimated_seconds'] * 1000 > budget_ms:
+                    executed.append({'table': entry['table'], 'status': 'deferred',
+                                     'error': 'estimated cost exceeds the remaining Lambda time budget'})
+                    continue
+                executed.append({
+                    'table': entry['table'],
+                    'operations': run_operations(context, conn, entry['table'], entry['_operations'])
+                })
+        if any(op['status'] in ('completed', 'joined') for entry in executed for op in entry.get('operations', [])):
+            invalidate_catalog()
+
+    return {
+        'plan': [{k: v for k, v in entry.items() if not k.startswith('_')} for entry in plan],
+        'tables_needing_maintenance': len(plan),
+        'scan_lookback_hours': int(lookback_hours or SCAN_LOOKBACK_HOURS),
+        'scan_activity_available': bool(scan_activity),
+        'executed': executed,
+        'catalog_age_seconds': catalog_age_seconds(snapshot)
+    }
+
+
+def check_tables_metadata(table_names=None, schema_name=None, table_pattern=None, target=None, context=None):
+    """Report stats_off for many tables from one svv_table_info snapshot per target"""
+    table_names = table_names or []
+    if not (table_names or schema_name or table_pattern):
+        raise Exception("Provide table_names, schema_name or table_pattern")
+
+    if target:
+        results = run_on_targets(
+            resolve_targets(target), lambda: check_tables_metadata(table_names, schema_name, table_pattern), context
+        )
+        if len(results) == 1:
+            return dict(results[0][1], target=results[0][0])
+        merged = {'tables': [], 'stale_count': 0, 'not_found': None, 'suggestions': {}, 'targets': {}}
+        for name, result, error in results:
+            if error:
+                merged['targets'][name] = {'error': error}
+                continue
+            merged['targets'][name] = {'tables': len(result['tables']), 'catalog_age_seconds': result['catalog_age_seconds']}
+            merged['tables'].extend(dict(table, target=name) for table in result['tables'])
+            merged['stale_count'] += result['stale_count']
+            # A name is only missing if no target has it
+            missing = set(result['not_found'])
+            merged['not_found'] = missing if merged['not_found'] is None else merged['not_found'] & missing
+            for missing_name, candidates in result['suggestions'].items():
+                merged['suggestions'].setdefault(missing_name, []).extend(f"{name}:{c}" for c in candidates)
+        merged['not_found'] = sorted(merged['not_found'] or [])
+        merged['suggestions'] = {k: v for k, v in merged['suggestions'].items() if k in merged['not_found']}
+        return merged
+
+    snapshot = get_catalog()
+
+    # Tables are selected by explicit name and/or LIKE pattern, optionally narrowed to one schema
+    selected = {}
+    not_found = []
+    suggestions = {}
+    for name in table_names:
+        rows, candidates = resolve_table(snapshot, name)
+        if not rows:
+            not_found.append(name)
+            if candidates:
+                suggestions[name] = [c['table'] for c in candidates]
+        for row in rows:
+            selected[f"{row[0]}.{row[1]}"] = row
+    if table_pattern or not table_names:
+        pattern = like_to_regex(table_pattern) if table_pattern else None
+        for key, row in snapshot['tables'].items():
+            if pattern is None or pattern.fullmatch(row[1]):
+                selected[key] = row
+    if schema_name:
+        selected = {key: row for key, row in selected.items() if row[0].lower() == schema_name.lower()}
+
+    # Checked tables double as stats_off samples for predict_stale_tables
+    record_history(list(selected.values()))
+    tables = []
+    for key in sorted(selected):
+        health = health_from_row(selected[key])
+        stats_off = health['stats_off']
+        operations, _ = recommend_maintenance(health)
+        tables.append({
+            'table': health['table'],
+            'stats_off': stats_off,
+            'needs_analyze': stats_off is not None and stats_off > STATS_OFF_THRESHOLD,
+            'recommended': [op['operation'] for op in operations]
+        })
+
+    return {
+        'tables': tables,
+        'stale_count': sum(1 for t in tables if t['needs_analyze']),
+        'not_found': not_found,
+        'suggestions': suggestions,
+        'catalog_age_seconds': catalog_age_seconds(snapshot)
+    }
+
+
+def fetch_bounded(cursor, max_rows, max_bytes, batch_rows=FETCH_BATCH_ROWS):
+    """Fetch at most max_rows rows, or about max_bytes of them, in small batches
+
+    Returns the rows and whether more were left unread.
+    """
+    rows = []
+    size = 0
+    while len(rows) < max_rows:
+        batch = cursor.fetchmany(min(batch_rows, max_rows - len(rows)))
+        if not batch:
+            return rows, False
+        for row in batch:
+            size += len(json.dumps(row, default=str))
+            if size > max_bytes:
+                return rows, True
+            rows.append(row)
+    return rows, bool(cursor.fetchmany(1))
+
+
+def fit_to_budget(result, list_key, max_bytes=None):
+    """Drop entries from the end of result[list_key] until the JSON response fits in max_bytes"""
+    max_bytes = max_bytes or RESPONSE_MAX_BYTES
+    omitted = 0
+    while result[list_key] and len(json.dumps(result, default=str)) > max_bytes:
+        result[list_key].pop()
+        omitted += 1
+    if omitted:
+        result['truncated'] = True
+        result[f"omitted_{list_key}"] = omitted
+    return result
+
+
+def diagnose_slow_queries(table_name, lookback_hours=None, limit=None, target=None, context=None, max_bytes=None):
+    """Summarize recent queries on a table and list the worst by elapsed time, queueing, disk spill and data redistribution"""
+    if not table_name:
+        raise Exception("No table_name provided")
+
+    if target:
+        targets = resolve_targets(target)
+        # Each target gets an equal share of the response size budget
+        share = RESPONSE_MAX_BYTES // len(targets)
+        results = run_on_targets(
+            targets, lambda: diagnose_slow_queries(table_name, lookback_hours, limit, max_bytes=share), context
+        )
+        if len(results) == 1:
+            return dict(results[0][1], target=results[0][0])
+        return dict(merge_target_results(results), table=table_name)
+
+    snapshot = get_catalog()
+    response, candidates = resolve_table(snapshot, table_name)
+    if not response:
+        return {
+            'table': table_name,
+            'error': f"No metadata found for table_name {table_name}",
+            'candidates': candidates
+        }
+    health = health_from_row(response[0])
+    lookback_hours = int(lookback_hours or SCAN_LOOKBACK_HOURS)
+    limit = max(1, min(int(limit or 5), SLOW_QUERY_MAX_LIMIT))
+    base_args = (health['table_id'], lookback_hours, SLOW_QUERY_TEXT_CHARS)
+
+    with redshift_connection() as conn:
+        cursor = conn.cursor()
+        for source, base_query, alerts_query in SLOW_QUERY_SOURCES:
+            try:
+                with timed('SlowQueryDiagnosis'):
+                    cursor.execute(base_query + SLOW_QUERY_SUMMARY_SELECT, base_args)
+                    summary_row = cursor.fetchone()
+                    cursor.execute(base_query + SLOW_QUERY_OFFENDERS_SELECT, base_args + (limit,) * 4)
+                    offender_rows, more = fetch_bounded(cursor, 4 * limit, max_bytes or RESPONSE_MAX_BYTES)
+                    cursor.execute(base_query + alerts_query, base_args)
+                    alert_rows, _ = fetch_bounded(cursor, 5, RESPONSE_MAX_BYTES // 4)
+                break
+            except Exception as e:
+                print(f"Slow query diagnosis from {source} tables failed ({e}), trying the next source")
+                conn.rollback()
+        else:
+            raise Exception("No query history is readable, the database user needs access to the system tables")
+
+    (count, avg_ms, p95_ms, max_ms, queue_ms, spilled, redistributed, missing_stats, failed) = summary_row or (0,) * 9
+    summary = {
+        'queries': int(count or 0),
+        'avg_elapsed_ms': round(float(avg_ms or 0)),
+        'p95_elapsed_ms': round(float(p95_ms or 0)),
+        'max_elapsed_ms': int(max_ms or 0),
+        'total_queue_ms': int(queue_ms or 0),
+        'spilled_queries': int(spilled or 0),
+        'redistribution_alert_queries': int(redistributed or 0),
+        'missing_stats_alert_queries': int(missing_stats or 0),
+        'failed_queries': int(failed or 0)
+    }
+
+    offenders = []
+    for (query_id, elapsed, queued, spill, alerts, redistribution, stats_alerts, aborted, started_at, query_text,
+         elapsed_rank, queue_rank, spill_rank, redistribution_rank) in offender_rows:
+        top_for = [name for name, listed in (
+            ('elapsed', elapsed_rank <= limit),
+            ('queue', queued and queue_rank <= limit),
+            ('spill', spill and spill_rank <= limit),
+            ('redistribution', redistribution and redistribution_rank <= limit)
+        ) if listed]
+        offenders.append({
+            'query_id': int(query_id),
+            'top_for': top_for,
+            'elapsed_ms': int(elapsed or 0),
+            'queue_ms': int(queued or 0),
+            'spilled_to_disk': bool(spill),
+            'alerts': int(alerts or 0),
+            'redistribution_alerts': int(redistribution or 0),
+            'missing_stats_alerts': int(stats_alerts or 0),
+            'failed': bool(aborted),
+            'started_at': str(started_at),
+            'query_text': (query_text or '').strip()
+        })
+
+    findings = []
+    if summary['missing_stats_alert_queries'] or (health['stats_off'] or 0) > STATS_OFF_THRESHOLD:
+        findings.append(f"stale or missing statistics (stats_off={health['stats_off']}), run ANALYZE")
+    if summary['redistribution_alert_queries']:
+        findings.append(f"{summary['redistribution_alert_queries']} queries broadcast or redistributed rows, "
+                        f"review the distribution key ({health['diststyle']})")
+    if summary['spilled_queries']:
+        findings.append(f"{summary['spilled_queries']} queries spilled to disk, they need more WLM memory "
+                        f"or less intermediate data")
+    if summary['queries'] and summary['total_queue_ms'] > 0.2 * summary['avg_elapsed_ms'] * summary['queries']:
+        findings.append("queries spend a large share of their time queued, review WLM concurrency")
+    if (health['unsorted'] or 0) > UNSORTED_THRESHOLD:
+        findings.append(f"unsorted={health['unsorted']}%, range filters scan extra blocks until VACUUM SORT")
+
+    result = {
+        'table': health['table'],
+        'resolved_from': table_name if candidates else None,
+        'lookback_hours': lookback_hours,
+        'source': source,
+        'summary': summary,
+        'findings': findings,
+        'top_alerts': [
+            {'event': event, 'solution': solution, 'queries': int(queries)}
+            for event, solution, queries in alert_rows
+        ],
+        'offenders': offenders
+    }
+    if more:
+        result['truncated'] = True
+    return fit_to_budget(result, 'offenders', max_bytes)
+
+
+def get_parameters(parameters):
+    """Flatten the Bedrock parameter list into a name -> value dict"""
+    return {param["name"]: param["value"] for param in parameters}
+
+
+def parse_bool_parameter(value):
+    """Parse a boolean parameter, which Bedrock passes as a string"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', 'yes', '1')
+
+
+def parse_list_parameter(value):
+    """Parse an array parameter, which Bedrock passes as a JSON or bracketed comma separated string"""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    try:
+        parsed = json.loads(value)
+        if isinstance(parsed, list):
+            return [str(item).strip() for item in parsed if str(item).strip()]
+    except ValueError:
+        pass
+    return [item.strip(" '\"") for item in value.strip("[]").split(",") if item.strip(" '\"")]
+
+
+def load_session_cache(session_attributes):
+    """Read the per-table result cache kept in the Bedrock sessionAttributes"""
+    try:
+        cache = json.loads((session_attributes or {}).get(SESSION_CACHE_ATTRIBUTE) or '{}')
+    except ValueError:
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def session_cache_key(function, table_name, target=None):
+    key = f"{function}:{' '.join(table_name.lower().split())}"
+    return f"{target.strip().lower()}/{key}" if target else key
+
+
+def get_session_cached(cache, key, now=None):
+    """Cached result for a key if it is inside the freshness window, else None"""
+    entry = cache.get(key)
+    now = time.time() if now is None else now
+    if isinstance(entry, dict) and 0 <= now - entry.get('at', 0) <= SESSION_CACHE_TTL_SECONDS:
+        return entry
+    return None
+
+
+def store_session_cached(cache, key, result, now=None):
+    """Cache a result, dropping expired entries and the oldest ones over SESSION_CACHE_MAX_ENTRIES"""
+    now = time.time() if now is None else now
+    cache[key] = {'at': now, 'result': result}
+    for stale_key in [k for k, entry in cache.items() if now - entry.get('at', 0) > SESSION_CACHE_TTL_SECONDS]:
+        del cache[stale_key]
+    # sessionAttributes travel with every agent turn, so keep the cache small
+    for old_key in sorted(cache, key=lambda k: cache[k].get('at', 0))[:max(0, len(cache) - SESSION_CACHE_MAX_ENTRIES)]:
+        del cache[old_key]
+
+
+def to_columns(value):
+    """Compact a result for the model: lists of objects become column names plus row arrays, numbers plain JSON numbers"""
+    if isinstance(value, list) and value and all(isinstance(entry, dict) for entry in value):
+        columns = []
+        for entry in value:
+            columns.extend(key for key in entry if key not in columns)
+        return {'columns': columns, 'rows': [[to_columns(entry.get(column)) for column in columns] for entry in value]}
+    if isinstance(value, dict):
+        return {key: to_columns(entry) for key, entry in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_columns(entry) for entry in value]
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+
+def rows_returned(encoded):
+    """Records in an encoded response: the rows of its longest top-level list, 1 for a single record, 0 for an error"""
+    if 'error' in encoded:
+        return 0
+    counts = [len(value['rows']) if isinstance(value, dict) else len(value) for value in encoded.values()
+              if isinstance(value, list) or (isinstance(value, dict) and 'rows' in value)]
+    return max(counts, default=1)
+
+
+def dump_compact(value):
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+def continuation_token(function, params, offset):
+    """Opaque token that makes continue_response rerun the call and return the rows from offset on"""
+    params = {k: v for k, v in params.items() if k not in CONTINUATION_DROPPED_PARAMETERS}
+    return base64.urlsafe_b64encode(dump_compact([function, params, offset]).encode('utf8')).decode('ascii').rstrip('=')
+
+
+def decode_continuation(token):
+    """Return (function, params, offset) from a continuation token"""
+    try:
+        function, params, offset = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        offset = max(0, int(offset))
+        if not isinstance(params, dict):
+            raise ValueError(params)
+    except Exception:
+        raise Exception("Invalid continuation_token, repeat the original request instead")
+    if function not in PAGED_LISTS:
+        raise Exception(f"continuation_token is not for a paged function: {function}")
+    # Tokens come back through the model, so an edited one must not be able to start maintenance either
+    params = {k: v for k, v in params.items() if k not in CONTINUATION_DROPPED_PARAMETERS}
+    return function, params, offset
+
+
+def _trimmable(value, path=()):
+    """Yield (container, path) for every list and object in an encoded result, columnar tables by their rows"""
+    if isinstance(value, dict):
+        if 'columns' in value and 'rows' in value:
+            yield value['rows'], path
+            for row in value['rows']:
+                for cell in row:
+                    yield from _trimmable(cell, path)
+            return
+        yield value, path
+        for key, entry in value.items():
+            yield from _trimmable(entry, path + (str(key),))
+    elif isinstance(value, list):
+        yield value, path
+        for entry in value:
+            yield from _trimmable(entry, path)
+
+
+def trim_to_size(encoded, max_bytes, keep=None):
+    """Drop entries from the end of the largest list or object until encoded fits, recording what went where
+
+    keep is a list that is never trimmed, the page of a paged response.
+    """
+    size = len(dump_compact(encoded))
+    while size > max_bytes:
+        containers = [(container, path) for container, path in _trimmable(encoded)
+                      if container and container is not keep and container is not encoded
+                      and path[:1] != ('omitted',)]
+        if not containers:
+            break
+        container, path = max(containers, key=lambda item: len(item[0]))
+        # Drop a share of the container proportional to the overshoot, so huge results converge in a few passes
+        count = max(1, int(len(container) * min(0.5, (size - max_bytes) / size)))
+        if isinstance(container, dict):
+            for key in list(container)[-count:]:
+                del container[key]
+        else:
+            del container[-count:]
+        omitted = encoded.setdefault('omitted', {})
+        label = '.'.join(path) or 'result'
+        omitted[label] = omitted.get(label, 0) + count
+        encoded['truncated'] = True
+        size = len(dump_compact(encoded))
+    return size
+
+
+def encode_response(function, params, result, offset=0, max_bytes=None):
+    """Encode a result as compact columnar JSON that fits in max_bytes
+
+    Results of PAGED_LISTS functions that do not fit are cut at a row
+    boundary and carry a continuation_token for the next page. Anything else
+    that does not fit loses entries from the end of its largest lists, and
+    the response says how many under omitted.
+    """
+    max_bytes = max_bytes or RESPONSE_MAX_BYTES
+    page_key = PAGED_LISTS.get(function)
+    if page_key and isinstance(result.get(page_key), list):
+        total = len(result[page_key])
+        result = dict(result, **{page_key: result[page_key][offset:]})
+        if offset:
+            result['offset'] = offset
+    encoded = to_columns(result)
+    body = dump_compact(encoded)
+    if len(body) <= max_bytes:
+        return body
+
+    table = encoded.get(page_key) if page_key else None
+    # The token carries the call's parameters, a request naming thousands of tables is trimmed instead
+    token = continuation_token(function, params, offset + len(table['rows'])) if isinstance(table, dict) else None
+    if isinstance(table, dict) and table.get('rows') and len(token) <= max_bytes // 4:
+        rows = table['rows']
+        # Size the envelope with the longest token this page can need, then fill it with whole rows
+        table['rows'] = []
+        encoded[f"total_{page_key}"] = total
+        encoded['continuation_token'] = token
+        # The rest of the result gets at most half the budget and must leave room for at least one row,
+        # otherwise the page would never advance
+        envelope_bytes = min(max_bytes // 2, max_bytes - len(dump_compact(rows[0])) - 1)
+        budget = max_bytes - trim_to_size(encoded, envelope_bytes, keep=table['rows'])
+        kept = 0
+        for row in rows:
+            budget -= len(dump_compact(row)) + 1
+            if budget < 0:
+                break
+            kept += 1
+        table['rows'] = rows[:max(1, kept)]
+        if len(table['rows']) < len(rows):
+            encoded['continuation_token'] = continuation_token(function, params, offset + len(table['rows']))
+        else:
+            del encoded['continuation_token'], encoded[f"total_{page_key}"]
     else:
-        raise Exception(f"No table_name provided")
-    
-    # Close the database connection
-    conn.close()
+        table = None
+    trim_to_size(encoded, max_bytes, keep=table['rows'] if isinstance(table, dict) else None)
+
+    body = dump_compact(encoded)
+    if len(body) > max_bytes:
+        # Nothing left to drop, Bedrock would reject the response outright
+        body = dump_compact({'error': f"The {function} result does not fit in {max_bytes} bytes, narrow the request",
+                             'truncated': True})
+    return body
 
 
 def lambda_handler(event, context):
+    global _cold_start
+    start_metrics(Function=event.get('function'), ColdStart=_cold_start)
+    _cold_start = False
+    take_maintained_tables()
+    try:
+        with timed('Handler'):
+            return handle_action(event, context)
+    except Exception as e:
+        set_metric_property('Error', str(e))
+        raise
+    finally:
+        flush_metrics()
+
+
+def handle_action(event, context):
     agent = event['agent']
     actionGroup = event['actionGroup']
     function = event['function']
@@ -97,32 +2746,183 @@ def lambda_handler(event, context):
         }
     }
 
+    print(f"Received parameters: {parameters}")
+    params = get_parameters(parameters)
+    # Bedrock hands these back on the next turn of the same session
+    session_attributes = dict(event.get('sessionAttributes') or {})
+    session_cache = load_session_cache(session_attributes)
+    cache_key = None
+    result = None
+    offset = 0
+    if function == 'continue_response':
+        if not params.get("continuation_token"):
+            raise Exception("Missing mandatory parameter: continuation_token")
+        function, params, offset = decode_continuation(params["continuation_token"])
+        print(f"Continuing {function} from row {offset}")
+
     if function == 'check_table_metadata':
-        print(f"Received parameters: {parameters}")
-        table_name = None
-        for param in parameters:
-            if param["name"] == "table_name":
-                table_name = param["value"]
-        
+        table_name = params.get("table_name")
+
         print(f"Extracted table_name: {table_name}")
+        set_metric_property('TableName', table_name)
+        if not table_name:
+            raise Exception("Missing mandatory parameter: table_name")
+        cached = None
+        # Any ANALYZE option asks for a run, which an earlier answer with other options cannot stand in for
+        if not any(params.get(name) for name in ('run_async', 'analyze_mode', 'columns', 'analyze_threshold_percent')):
+            cache_key = session_cache_key(function, table_name)
+            cached = get_session_cached(session_cache, cache_key)
+        if cached:
+            result = dict(cached['result'], session_cache_age_seconds=round(time.time() - cached['at']))
+            cache_key = None
+        else:
+            result = check_table_metadata(
+                table_name,
+                run_async=parse_bool_parameter(params.get("run_async", False)),
+                analyze_mode=params.get("analyze_mode"),
+                columns=parse_list_parameter(params.get("columns")),
+                analyze_threshold_percent=params.get("analyze_threshold_percent"),
+                context=context
+            )
+        set_metric_property('SessionCache', 'hit' if cached else 'miss')
+        responseBody = {
+            'TEXT': {
+                "body": encode_response(function, params, result, offset)
+            }
+        }
+    elif function == 'check_table_health':
+        table_name = params.get("table_name")
+        if not table_name:
+            raise Exception("Missing mandatory parameter: table_name")
+        run_maintenance = parse_bool_parameter(params.get("run_maintenance", False))
+        cached = None
+        if not run_maintenance:
+            cache_key = session_cache_key(function, table_name, params.get("target"))
+            cached = get_session_cached(session_cache, cache_key)
+        if cached:
+            result = dict(cached['result'], session_cache_age_seconds=round(time.time() - cached['at']))
+            cache_key = None
+        else:
+            result = check_table_health(
+                context,
+                table_name,
+                run_maintenance=run_maintenance,
+                vacuum_target_percent=params.get("vacuum_target_percent"),
+                target=params.get("target")
+            )
+        set_metric_property('SessionCache', 'hit' if cached else 'miss')
+        responseBody = {
+            'TEXT': {
+                "body": encode_response(function, params, result, offset)
+            }
+        }
+    elif function == 'check_analyze_status':
+        statement_id = params.get("statement_id")
+        if not statement_id:
+            raise Exception("Missing mandatory parameter: statement_id")
+        result = check_analyze_status(statement_id)
+        responseBody = {
+            'TEXT': {
+                "body": encode_response(function, params, result, offset)
+            }
+        }
+    elif function == 'analyze_stale_tables':
+        result = analyze_stale_tables(
+            context,
+            schema_name=params.get("schema_name"),
+            table_pattern=params.get("table_pattern"),
+            table_names=parse_list_parameter(params.get("table_names")),
+            max_parallel=params.get("max_parallel"),
+            analyze_mode=params.get("analyze_mode")
+        )
+        responseBody = {
+            'TEXT': {
+                "body": encode_response(function, params, result, offset)
+            }
+        }
+    elif function == 'plan_maintenance':
+        result = plan_maintenance(
+            context,
+            schema_name=params.get("schema_name"),
+            table_pattern=params.get("table_pattern"),
+            top_k=params.get("top_k"),
+            run_maintenance=parse_bool_parameter(params.get("run_maintenance", False)),
+            lookback_hours=params.get("lookback_hours")
+        )
+        responseBody = {
+            'TEXT': {
+                "body": encode_response(function, params, result, offset)
+            }
+        }
+    elif function == 'diagnose_slow_queries':
+        table_name = params.get("table_name")
         if not table_name:
             raise Exception("Missing mandatory parameter: table_name")
-        table_metadata = check_table_metadata(table_name)
+        set_metric_property('TableName', table_name)
+        result = diagnose_slow_queries(
+            table_name,
+            lookback_hours=params.get("lookback_hours"),
+            limit=params.get("limit"),
+            target=params.get("target"),
+            context=context
+        )
         responseBody = {
             'TEXT': {
-                "body": f"table design metadata for table {table_name}: {table_metadata}"
+                "body": encode_response(function, params, result, offset)
             }
         }
-           
+    elif function == 'check_tables_metadata':
+        result = check_tables_metadata(
+            table_names=parse_list_parameter(params.get("table_names")),
+            schema_name=params.get("schema_name"),
+            table_pattern=params.get("table_pattern"),
+            target=params.get("target"),
+            context=context
+        )
+        responseBody = {
+            'TEXT': {
+                "body": encode_response(function, params, result, offset)
+            }
+        }
+    elif function == 'predict_stale_tables':
+        result = predict_stale_tables(
+            schema_name=params.get("schema_name"),
+            table_pattern=params.get("table_pattern"),
+            horizon_hours=params.get("horizon_hours"),
+            target=params.get("target"),
+            context=context
+        )
+        responseBody = {
+            'TEXT': {
+                "body": encode_response(function, params, result, offset)
+            }
+        }
+
+    if result is not None:
+        set_metric_property('RowsReturned', rows_returned(json.loads(responseBody['TEXT']['body'])))
+    maintained = take_maintained_tables()
+    if maintained:
+        # Anything cached before maintenance ran in this session no longer reflects the table
+        print(f"Maintenance ran on {', '.join(sorted(maintained))}, clearing the session cache")
+        session_cache.clear()
+    elif cache_key:
+        store_session_cached(session_cache, cache_key, result)
+    session_attributes[SESSION_CACHE_ATTRIBUTE] = json.dumps(session_cache, separators=(',', ':'), default=str)
+
     action_response = {
         'actionGroup': actionGroup,
-        'function': function,
+        'function': event['function'],
         'functionResponse': {
             'responseBody': responseBody
         }
     }
 
-    function_response = {'response': action_response, 'messageVersion': event['messageVersion']}
+    function_response = {
+        'response': action_response,
+        'messageVersion': event['messageVersion'],
+        'sessionAttributes': session_attributes,
+        'promptSessionAttributes': event.get('promptSessionAttributes') or {}
+    }
     print("Response: {}".format(function_response))
 
-    return function_response
\ No newline at end of file
+    return function_response
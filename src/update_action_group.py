@@ -1,19 +1,14 @@
-from src.config import bedrock_agent_client, agent_name
+from src.config import (config, agent_name, agent_functions, agent_action_group_name,
+                        agent_action_group_description, normalize_function_schema, fingerprint)
 
 def update_action_group():
     """Update existing action group with correct parameter type"""
-    # Find agent by name
-    paginator = bedrock_agent_client.get_paginator('list_agents')
-    agent_id = None
-    for page in paginator.paginate():
-        for agent_summary in page.get('agentSummaries', []):
-            if agent_summary['agentName'] == agent_name:
-                agent_id = agent_summary['agentId']
-                break
-        if agent_id:
-            break
-    
-    if not agent_id:
+    bedrock_agent_client = config.bedrock_agent_client
+
+    # Agent ID comes from the local config cache, or is looked up by name once
+    try:
+        agent_id = config.agent_id
+    except Exception:
         print(f"Agent '{agent_name}' not found")
         return
     
@@ -25,7 +20,7 @@ def update_action_group():
     
     action_group_id = None
     for ag in action_groups['actionGroupSummaries']:
-        if ag['actionGroupName'] == 'DEActionGroup':
+        if ag['actionGroupName'] == agent_action_group_name:
             action_group_id = ag['actionGroupId']
             break
     
@@ -33,33 +28,38 @@ def update_action_group():
         print("Action group not found")
         return
     
-    # Update action group with correct parameter type
-    agent_functions = [
-        {
-            'name': 'check_table_metadata',
-            'description': 'get optimisation statistics for table',
-            'parameters': {
-                "table_name": {
-                    "description": "the name of the table to get optimisation statistics",
-                    "required": True,
-                    "type": "string"
-                }
-            }
-        }
-    ]
-    
-    response = bedrock_agent_client.update_agent_action_group(
+    # Skip the update and the prepare when the deployed schema already matches
+    current = bedrock_agent_client.get_agent_action_group(
         agentId=agent_id,
         agentVersion='DRAFT',
-        actionGroupId=action_group_id,
-        actionGroupName='DEActionGroup',
-        functionSchema={
-            'functions': agent_functions
-        },
-        description='Actions for optimisation of performance'
-    )
-    
-    print("Action group updated successfully")
+        actionGroupId=action_group_id
+    )['agentActionGroup']
+    current_schema = fingerprint({
+        'functions': normalize_function_schema(current.get('functionSchema', {}).get('functions', [])),
+        'description': current.get('description')
+    })
+    desired_schema = fingerprint({
+        'functions': normalize_function_schema(agent_functions),
+        'description': agent_action_group_description
+    })
+    agent_status = bedrock_agent_client.get_agent(agentId=agent_id)['agent']['agentStatus']
+    if current_schema == desired_schema and agent_status == 'PREPARED':
+        print("Action group unchanged and agent already prepared, nothing to do")
+        return
+
+    if current_schema != desired_schema:
+        response = bedrock_agent_client.update_agent_action_group(
+            agentId=agent_id,
+            agentVersion='DRAFT',
+            actionGroupId=action_group_id,
+            actionGroupName=agent_action_group_name,
+            actionGroupExecutor=current['actionGroupExecutor'],
+            functionSchema={
+                'functions': agent_functions
+            },
+            description=agent_action_group_description
+        )
+        print("Action group updated successfully")
     
     # Prepare agent
     bedrock_agent_client.prepare_agent(agentId=agent_id)
@@ -1,29 +1,16 @@
 import uuid
 import json
-from src.config import bedrock_agent_runtime_client, bedrock_agent_client, agent_name, logger
+from src.config import config, logger
 
 def get_agent_info():
-    """Get agent ID and alias ID from existing deployment"""
-    # Find agent by name
-    paginator = bedrock_agent_client.get_paginator('list_agents')
-    for page in paginator.paginate():
-        for agent_summary in page.get('agentSummaries', []):
-            if agent_summary['agentName'] == agent_name:
-                agent_id = agent_summary['agentId']
-                
-                # Get agent alias
-                aliases_response = bedrock_agent_client.list_agent_aliases(agentId=agent_id)
-                agent_alias_id = aliases_response['agentAliasSummaries'][0]['agentAliasId']
-                
-                return agent_id, agent_alias_id
-    
-    raise Exception(f"Agent '{agent_name}' not found")
+    """Get agent ID and alias ID from existing deployment, memoized in the local config cache"""
+    return config.agent_id, config.agent_alias_id
 
 def test_agent(agent_id, agent_alias_id, query="Check table statistics for splittest table"):
     """Test the deployed agent"""
     session_id = str(uuid.uuid1())
     
-    agentResponse = bedrock_agent_runtime_client.invoke_agent(
+    agentResponse = config.bedrock_agent_runtime_client.invoke_agent(
         inputText=query,
         agentId=agent_id,
         agentAliasId=agent_alias_id, 
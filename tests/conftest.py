@@ -0,0 +1,28 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import bench_lambda_handler, standins  # noqa: E402
+
+
+@pytest.fixture
+def stand_in(monkeypatch, tmp_path):
+    """lambda_function imported fresh against a 200 table stand-in cluster, returns (module, cluster)"""
+    monkeypatch.setenv('MetricsMode', 'off')
+    monkeypatch.setenv('LeaseStore', 'local')
+    monkeypatch.setenv('HistoryStore', 'sqlite')
+    monkeypatch.setenv('HistoryPath', str(tmp_path / 'history.sqlite3'))
+    args = SimpleNamespace(tables=200, connect_latency_ms=0, query_latency_ms=0, analyze_latency_ms=0,
+                           stale_fraction=0.3, secret_latency_ms=0)
+    lambda_function, cluster = bench_lambda_handler.load_lambda_module(args)
+    return lambda_function, cluster
+
+
+@pytest.fixture
+def context():
+    return standins.StandInContext()
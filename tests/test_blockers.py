@@ -0,0 +1,39 @@
+import pytest
+
+
+def stale_row(cluster):
+    return next(row for row in cluster.rows if row[3] > 10)
+
+
+def test_blocking_sessions_are_reported(stand_in):
+    lambda_function, cluster = stand_in
+    row = stale_row(cluster)
+    cluster.locks[row[2]] = [(4242, 'etl', 'AccessExclusiveLock', True, 95)]
+
+    with lambda_function.redshift_connection() as conn:
+        with pytest.raises(lambda_function.MaintenanceBlocked) as blocked:
+            lambda_function.check_not_blocked(conn, f"{row[0]}.{row[1]}")
+
+    assert blocked.value.blockers == [
+        {'pid': 4242, 'user': 'etl', 'lock_mode': 'AccessExclusiveLock', 'granted': True, 'seconds': 95}
+    ]
+    assert 'PID 4242' in str(blocked.value)
+
+
+def test_blocked_analyze_is_skipped_and_can_be_retried(stand_in, context):
+    lambda_function, cluster = stand_in
+    row = stale_row(cluster)
+    table = f"{row[0]}.{row[1]}"
+    cluster.locks[row[2]] = [(4242, 'etl', 'AccessExclusiveLock', True, 95)]
+
+    blocked = lambda_function.check_table_metadata(table, context=context)
+
+    assert blocked['analyze']['coordination'] == 'blocked'
+    assert 'PID 4242' in blocked['message']
+    assert cluster.counters['maintenance'] == 0
+
+    cluster.locks.clear()
+    retried = lambda_function.check_table_metadata(table, context=context)
+
+    assert retried['analyze']['coordination'] == 'ran'
+    assert cluster.counters['maintenance'] == 1
@@ -0,0 +1,51 @@
+import pytest
+
+from benchmarks import standins
+
+
+def stale_table(cluster, with_history):
+    return next(f"{row[0]}.{row[1]}" for i, row in enumerate(cluster.rows) if row[3] > 10 and (i % 3 == 0) == with_history)
+
+
+def test_estimate_uses_the_tables_own_runs_first(stand_in):
+    lambda_function, cluster = stand_in
+    snapshot = lambda_function.get_catalog()
+    with_history = lambda_function.health_from_row(lambda_function.find_tables(snapshot, stale_table(cluster, True))[0])
+    without = lambda_function.health_from_row(lambda_function.find_tables(snapshot, stale_table(cluster, False))[0])
+
+    assert lambda_function.estimate_operation_seconds(with_history, 'ANALYZE')[1] == "3 past ANALYZE runs of this table"
+    assert lambda_function.estimate_operation_seconds(without, 'ANALYZE')[1] == "recent ANALYZE runs on the cluster"
+    assert 'upper bound' in lambda_function.estimate_operation_seconds(without, 'ANALYZE', 'predicate')[1]
+
+
+def test_analyze_that_fits_runs_inline(stand_in, context):
+    lambda_function, cluster = stand_in
+
+    result = lambda_function.check_table_metadata(stale_table(cluster, True), context=context)
+
+    assert result['analyze']['execution'] == 'inline'
+    assert result['analyze']['coordination'] == 'ran'
+    assert cluster.counters['maintenance'] == 1
+
+
+def test_analyze_that_does_not_fit_goes_to_the_background(stand_in):
+    lambda_function, cluster = stand_in
+    context = standins.StandInContext(timeout_ms=lambda_function.LAMBDA_TIME_MARGIN_MS + 500)
+
+    result = lambda_function.check_table_metadata(stale_table(cluster, True), context=context)
+
+    assert result['analyze']['execution'] == 'background'
+    assert result['analyze']['statement_id']
+    assert cluster.counters['maintenance'] == 0
+
+
+@pytest.mark.parametrize('analyze_mode, execution, runs', [(None, 'refused', 0), ('predicate', 'inline', 1)])
+def test_only_a_full_analyze_over_the_limit_is_refused(stand_in, context, monkeypatch, analyze_mode, execution, runs):
+    lambda_function, cluster = stand_in
+    monkeypatch.setattr(lambda_function, 'MAINTENANCE_MAX_SECONDS', 0.5)
+
+    result = lambda_function.check_table_metadata(stale_table(cluster, True), analyze_mode=analyze_mode,
+                                                  context=context)
+
+    assert result['analyze']['execution'] == execution
+    assert cluster.counters['maintenance'] == runs
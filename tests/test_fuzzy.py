@@ -0,0 +1,34 @@
+def test_exact_name_needs_no_fuzzy_match(stand_in):
+    lambda_function, _ = stand_in
+    rows, candidates = lambda_function.resolve_table(lambda_function.get_catalog(), 'analytics.table_00010')
+
+    assert [row[1] for row in rows] == ['table_00010']
+    assert candidates == []
+
+
+def test_clear_near_miss_is_resolved(stand_in):
+    lambda_function, _ = stand_in
+    rows, candidates = lambda_function.resolve_table(lambda_function.get_catalog(), 'table 00010')
+
+    assert [(row[0], row[1]) for row in rows] == [('analytics', 'table_00010')]
+    assert candidates[0]['score'] >= lambda_function.FUZZY_MATCH_MIN_SCORE
+
+
+def test_ambiguous_name_is_not_accepted(stand_in):
+    lambda_function, _ = stand_in
+    rows, candidates = lambda_function.resolve_table(lambda_function.get_catalog(), 'table_0001')
+
+    assert rows == []
+    assert len(candidates) > 1
+    assert candidates[0]['score'] - candidates[1]['score'] < lambda_function.FUZZY_MATCH_MARGIN
+
+
+def test_weak_candidates_are_not_offered(stand_in):
+    lambda_function, _ = stand_in
+    snapshot = lambda_function.get_catalog()
+
+    for name in ('nosuchtable', 'customers'):
+        assert lambda_function.resolve_table(snapshot, name) == ([], [])
+    candidates = lambda_function.fuzzy_find_tables(snapshot, 'table_0001')
+    assert all(c['score'] >= lambda_function.FUZZY_CANDIDATE_MIN_SCORE for c in candidates)
+    assert len(candidates) <= lambda_function.FUZZY_CANDIDATE_LIMIT
@@ -0,0 +1,44 @@
+import pytest
+
+
+def health(lambda_function, stats_off=2.0, unsorted=1.0, skew_rows=1.0, visible_rows=1000, sortkey1='id', encoded='Y'):
+    return lambda_function.health_from_row(
+        ('public', 'events', 100, stats_off, unsorted, skew_rows, 1.0, 1000, visible_rows, 50, encoded, 'EVEN', sortkey1)
+    )
+
+
+def operations(lambda_function, **profile):
+    return [op['operation'] for op in lambda_function.recommend_maintenance(health(lambda_function, **profile))[0]]
+
+
+def test_healthy_table_needs_nothing(stand_in):
+    lambda_function, _ = stand_in
+
+    assert lambda_function.recommend_maintenance(health(lambda_function)) == ([], [])
+
+
+@pytest.mark.parametrize('profile, expected', [
+    ({'stats_off': 25.0}, ['ANALYZE']),
+    ({'stats_off': None}, []),
+    ({'unsorted': 30.0}, ['VACUUM SORT ONLY']),
+    ({'visible_rows': 800}, ['VACUUM DELETE ONLY']),
+    ({'unsorted': 30.0, 'visible_rows': 800}, ['VACUUM FULL']),
+    ({'unsorted': 30.0, 'sortkey1': 'INTERLEAVED'}, ['VACUUM REINDEX']),
+    ({'unsorted': 30.0, 'visible_rows': 800, 'stats_off': 25.0}, ['VACUUM FULL', 'ANALYZE']),
+])
+def test_vacuum_is_chosen_by_unsorted_and_deleted_rows_and_runs_before_analyze(stand_in, profile, expected):
+    lambda_function, _ = stand_in
+
+    assert operations(lambda_function, **profile) == expected
+
+
+def test_design_problems_are_advice_not_operations(stand_in):
+    lambda_function, _ = stand_in
+
+    recommended, advice = lambda_function.recommend_maintenance(
+        health(lambda_function, skew_rows=9.0, sortkey1=None, encoded='N')
+    )
+
+    assert recommended == []
+    assert len(advice) == 3
+    assert any('distribution key' in line for line in advice)
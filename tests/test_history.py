@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+
+def test_drift_fits_points_since_the_last_analyze(stand_in, tmp_path):
+    lambda_function, _ = stand_in
+    store = lambda_function.SqliteHistoryStore(str(tmp_path / 'drift.sqlite3'))
+    now = time.time()
+    # stats_off climbed to 40, ANALYZE reset it, then it grew by 1 point and 1000 rows an hour
+    points = [('public.t', 40.0, 5000, now - 10 * 3600)]
+    points += [('public.t', float(hour), 1000 * hour, now - (5 - hour) * 3600) for hour in range(6)]
+    points.append(('public.other', 5.0, 10, now - 3600))
+    store.record('default', points)
+    store.record('elsewhere', [('public.t', 90.0, 0, now)])
+
+    drift = {row[0]: row[1:] for row in store.drift_rates('default', 24)}
+
+    count, stats_drift, rows_drift, span_hours = drift['public.t']
+    assert count == 6
+    assert stats_drift == pytest.approx(1.0)
+    assert rows_drift == pytest.approx(1000.0)
+    assert span_hours == pytest.approx(5.0)
+    # A single point has no slope
+    assert drift['public.other'][0] == 1
+    assert drift['public.other'][1] is None
+
+
+def test_drift_ignores_points_outside_the_lookback(stand_in, tmp_path):
+    lambda_function, _ = stand_in
+    store = lambda_function.SqliteHistoryStore(str(tmp_path / 'drift.sqlite3'))
+    now = time.time()
+    store.record('default', [('public.t', 1.0, 0, now - 48 * 3600), ('public.t', 2.0, 0, now - 3600)])
+
+    assert [row[1] for row in store.drift_rates('default', 24)] == [1]
+
+
+def test_predict_stale_tables_uses_recorded_drift(stand_in):
+    lambda_function, cluster = stand_in
+    schema, table, stats_off = next((row[0], row[1], row[3]) for row in cluster.rows if row[3] < 5)
+    now = time.time()
+    lambda_function.get_history_store().record(
+        lambda_function.current_target()['name'],
+        [(f"{schema}.{table}", stats_off - 4 + hour, 0, now - (4 - hour) * 3600) for hour in range(5)]
+    )
+
+    result = lambda_function.predict_stale_tables(schema_name=schema, horizon_hours=24)
+
+    assert result['tables_with_history'] == 1
+    assert [entry['table'] for entry in result['predicted']] == [f"{schema}.{table}"]
+    assert result['predicted'][0]['drift_per_hour'] == pytest.approx(1.0)
+    expected = (lambda_function.STATS_OFF_THRESHOLD - stats_off) / 1.0
+    assert result['predicted'][0]['hours_to_threshold'] == pytest.approx(expected, abs=0.1)
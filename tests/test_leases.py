@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+
+def analyze_outcome(calls):
+    def analyze():
+        calls.append(1)
+        return {'mode': 'full', 'seconds': 0.5}
+    return analyze
+
+
+def test_first_analyze_runs_and_second_hits_cooldown(stand_in):
+    lambda_function, _ = stand_in
+    calls = []
+
+    first = lambda_function.coordinated_analyze('public.table_00000', analyze_outcome(calls))
+    second = lambda_function.coordinated_analyze('PUBLIC.table_00000', analyze_outcome(calls))
+
+    assert first['coordination'] == 'ran'
+    assert second['coordination'] == 'cooldown'
+    assert second['mode'] == 'full'
+    assert len(calls) == 1
+
+
+def test_waiter_joins_the_in_flight_analyze(stand_in, monkeypatch):
+    lambda_function, _ = stand_in
+    monkeypatch.setattr(lambda_function, 'ANALYZE_LEASE_POLL_SECONDS', 0.01)
+    store = lambda_function.get_lease_store()
+    key = lambda_function.lease_key('public.table_00000')
+    assert store.acquire(key, 'other')[0] == 'acquired'
+    finisher = threading.Timer(0.05, store.release, (key, 'other', 'done', 'predicate', 1.5))
+    finisher.start()
+    calls = []
+
+    outcome = lambda_function.coordinated_analyze('public.table_00000', analyze_outcome(calls), wait_ms=5000)
+    finisher.join()
+
+    assert outcome == {'coordination': 'joined', 'mode': 'predicate', 'seconds': 1.5}
+    assert calls == []
+
+
+def test_waiter_reports_running_when_the_wait_runs_out(stand_in, monkeypatch):
+    lambda_function, _ = stand_in
+    monkeypatch.setattr(lambda_function, 'ANALYZE_LEASE_POLL_SECONDS', 0.01)
+    store = lambda_function.get_lease_store()
+    store.acquire(lambda_function.lease_key('public.table_00000'), 'other')
+
+    outcome = lambda_function.coordinated_analyze('public.table_00000', analyze_outcome([]), wait_ms=30)
+
+    assert outcome['coordination'] == 'running'
+
+
+def test_failed_analyze_frees_the_lease(stand_in):
+    lambda_function, _ = stand_in
+
+    def failing():
+        raise Exception('permission denied')
+
+    with pytest.raises(Exception, match='permission denied'):
+        lambda_function.coordinated_analyze('public.table_00000', failing)
+    calls = []
+    retry = lambda_function.coordinated_analyze('public.table_00000', analyze_outcome(calls))
+
+    assert retry['coordination'] == 'ran'
+    assert len(calls) == 1
+
+
+def test_joiner_sees_the_failure_of_the_in_flight_analyze(stand_in, monkeypatch):
+    lambda_function, _ = stand_in
+    monkeypatch.setattr(lambda_function, 'ANALYZE_LEASE_POLL_SECONDS', 0.01)
+    store = lambda_function.get_lease_store()
+    key = lambda_function.lease_key('public.table_00000')
+    store.acquire(key, 'other')
+    failer = threading.Timer(0.05, store.release, (key, 'other', 'failed'), {'error': 'disk full'})
+    failer.start()
+
+    with pytest.raises(Exception, match='joined from another request failed: disk full'):
+        lambda_function.coordinated_analyze('public.table_00000', analyze_outcome([]), wait_ms=5000)
+    failer.join()
+
+
+def test_lease_release_failures_do_not_mask_the_analyze(stand_in, monkeypatch):
+    lambda_function, _ = stand_in
+    store = lambda_function.get_lease_store()
+
+    def broken_release(*args, **kwargs):
+        raise RuntimeError('control table unavailable')
+    monkeypatch.setattr(store, 'release', broken_release)
+
+    outcome = lambda_function.coordinated_analyze('public.table_00000', analyze_outcome([]))
+    assert outcome['coordination'] == 'ran'
+
+    def failing():
+        raise Exception('permission denied')
+    with pytest.raises(Exception, match='permission denied'):
+        lambda_function.coordinated_analyze('public.table_00001', failing)
+
+
+def test_only_analyze_that_ran_counts_as_maintenance(stand_in):
+    lambda_function, _ = stand_in
+    lambda_function.take_maintained_tables()
+
+    lambda_function.coordinated_analyze('public.table_00000', analyze_outcome([]))
+    assert lambda_function.take_maintained_tables() == {'public.table_00000'}
+
+    assert lambda_function.coordinated_analyze('public.table_00000', analyze_outcome([]))['coordination'] == 'cooldown'
+    assert lambda_function.take_maintained_tables() == set()
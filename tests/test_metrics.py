@@ -0,0 +1,28 @@
+import json
+
+from benchmarks.bench_lambda_handler import make_event
+
+
+def invoke(lambda_function, context, function, parameters):
+    response = lambda_function.lambda_handler(make_event(function, parameters), context)
+    body = json.loads(response['response']['functionResponse']['responseBody']['TEXT']['body'])
+    return body, dict(lambda_function._metrics['properties'])
+
+
+def test_rows_returned_counts_the_response_on_warm_invocations(stand_in, context):
+    lambda_function, cluster = stand_in
+    _, cold = invoke(lambda_function, context, 'check_tables_metadata', {'schema_name': 'sales'})
+
+    body, warm = invoke(lambda_function, context, 'check_tables_metadata', {'schema_name': 'sales'})
+
+    assert cold['CatalogRows'] == len(cluster.rows)
+    assert 'CatalogRows' not in warm
+    assert warm['RowsReturned'] == len(body['tables']['rows']) == sum(row[0] == 'sales' for row in cluster.rows)
+
+
+def test_rows_returned_for_single_table_and_missing_table(stand_in, context):
+    lambda_function, cluster = stand_in
+    table = next(f"{row[0]}.{row[1]}" for row in cluster.rows if row[3] < 10)
+
+    assert invoke(lambda_function, context, 'check_table_metadata', {'table_name': table})[1]['RowsReturned'] == 1
+    assert invoke(lambda_function, context, 'check_table_metadata', {'table_name': 'nosuchtable'})[1]['RowsReturned'] == 0
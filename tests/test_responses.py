@@ -0,0 +1,80 @@
+import base64
+import json
+
+from benchmarks.bench_lambda_handler import make_event
+
+
+def response_body(response):
+    return response['response']['functionResponse']['responseBody']['TEXT']['body']
+
+
+def test_continuation_pages_cover_every_table_once(stand_in, context, monkeypatch):
+    lambda_function, cluster = stand_in
+    monkeypatch.setattr(lambda_function, 'RESPONSE_MAX_BYTES', 2000)
+    event = make_event('check_tables_metadata', {'table_pattern': 'table_%'})
+    seen = []
+    pages = 0
+
+    while True:
+        body = response_body(lambda_function.lambda_handler(event, context))
+        assert len(body) <= 2000
+        result = json.loads(body)
+        name_column = result['tables']['columns'].index('table')
+        seen.extend(row[name_column] for row in result['tables']['rows'])
+        pages += 1
+        if 'continuation_token' not in result:
+            break
+        assert result['total_tables'] == len(cluster.rows)
+        event = make_event('continue_response', {'continuation_token': result['continuation_token']})
+
+    assert pages > 1
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == sorted(f"{row[0]}.{row[1]}" for row in cluster.rows)
+
+
+def test_result_that_fits_has_no_continuation(stand_in):
+    lambda_function, _ = stand_in
+    result = {'tables': [{'table': 'public.t', 'stats_off': 1.0}]}
+
+    body = json.loads(lambda_function.encode_response('check_tables_metadata', {}, result))
+
+    assert 'continuation_token' not in body
+    assert body['tables']['rows'] == [['public.t', 1.0]]
+
+
+def test_unpaged_lists_are_trimmed_to_the_budget(stand_in):
+    lambda_function, _ = stand_in
+    result = {'analyzed': [f"public.table_{i:05d}" for i in range(500)],
+              'targets': {'default': {'pending': [f"sales.table_{i:05d}" for i in range(500)]}}}
+
+    body = lambda_function.encode_response('analyze_stale_tables', {}, result, max_bytes=2000)
+
+    assert len(body) <= 2000
+    encoded = json.loads(body)
+    assert encoded['truncated'] is True
+    assert encoded['omitted']['analyzed'] + len(encoded['analyzed']) == 500
+    assert encoded['omitted']['targets.default.pending'] + len(encoded['targets']['default']['pending']) == 500
+
+
+def test_continuation_drops_maintenance_parameters(stand_in):
+    lambda_function, _ = stand_in
+    forged = base64.urlsafe_b64encode(json.dumps(
+        ['check_tables_metadata', {'schema_name': 'sales', 'run_maintenance': 'true', 'run_async': 'true'}, 10]
+    ).encode()).decode()
+
+    assert lambda_function.decode_continuation(forged) == ('check_tables_metadata', {'schema_name': 'sales'}, 10)
+    token = lambda_function.continuation_token('plan_maintenance', {'run_maintenance': 'true'}, 5)
+    assert lambda_function.decode_continuation(token) == ('plan_maintenance', {}, 5)
+
+
+def test_check_table_metadata_answers_in_json(stand_in, context):
+    lambda_function, cluster = stand_in
+    schema, table, stats_off = next((row[0], row[1], row[3]) for row in cluster.rows if row[3] < 10)
+    event = make_event('check_table_metadata', {'table_name': f"{schema}.{table}"})
+
+    result = json.loads(response_body(lambda_function.lambda_handler(event, context)))
+
+    assert result['table'] == f"{schema}.{table}"
+    assert result['stats_off'] == stats_off
+    assert result['message'] == "No ANALYZE needed."
+    assert 'analyze' not in result
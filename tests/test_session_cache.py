@@ -0,0 +1,53 @@
+import json
+
+from benchmarks.bench_lambda_handler import make_event
+
+
+def invoke(lambda_function, context, function, parameters, session_attributes):
+    event = make_event(function, parameters)
+    event['sessionAttributes'] = session_attributes
+    response = lambda_function.lambda_handler(event, context)
+    return json.loads(response['response']['functionResponse']['responseBody']['TEXT']['body']), \
+        response['sessionAttributes']
+
+
+def table_with(cluster, stale):
+    return next(f"{row[0]}.{row[1]}" for row in cluster.rows if (row[3] > 10) == stale)
+
+
+def test_repeated_question_is_answered_from_the_session(stand_in, context):
+    lambda_function, cluster = stand_in
+    table = table_with(cluster, stale=False)
+    first, attributes = invoke(lambda_function, context, 'check_table_metadata', {'table_name': table}, {})
+    cluster.reset_counters()
+
+    second, attributes = invoke(lambda_function, context, 'check_table_metadata', {'table_name': table.upper()},
+                                attributes)
+
+    assert 'session_cache_age_seconds' not in first
+    assert second['session_cache_age_seconds'] >= 0
+    assert second['stats_off'] == first['stats_off']
+    assert cluster.counters == {'connect': 0, 'query': 0, 'maintenance': 0}
+
+
+def test_analyze_options_bypass_the_session_cache(stand_in, context):
+    lambda_function, cluster = stand_in
+    table = table_with(cluster, stale=False)
+    _, attributes = invoke(lambda_function, context, 'check_table_metadata', {'table_name': table}, {})
+
+    result, _ = invoke(lambda_function, context, 'check_table_metadata',
+                       {'table_name': table, 'analyze_mode': 'predicate'}, attributes)
+
+    assert 'session_cache_age_seconds' not in result
+
+
+def test_maintenance_clears_the_session_cache(stand_in, context):
+    lambda_function, cluster = stand_in
+    fresh, stale = table_with(cluster, stale=False), table_with(cluster, stale=True)
+    _, attributes = invoke(lambda_function, context, 'check_table_metadata', {'table_name': fresh}, {})
+    assert json.loads(attributes[lambda_function.SESSION_CACHE_ATTRIBUTE])
+
+    result, attributes = invoke(lambda_function, context, 'check_table_metadata', {'table_name': stale}, attributes)
+
+    assert result['analyze']['coordination'] == 'ran'
+    assert json.loads(attributes[lambda_function.SESSION_CACHE_ATTRIBUTE]) == {}
@@ -0,0 +1,33 @@
+import pytest
+
+
+def stale_table(cluster):
+    return next(f"{row[0]}.{row[1]}" for row in cluster.rows if row[3] > 10)
+
+
+def test_saturated_queues_raise_cluster_saturated(stand_in):
+    lambda_function, cluster = stand_in
+    cluster.wlm_queued = lambda_function.MAINTENANCE_MAX_QUEUED
+
+    with lambda_function.redshift_connection() as conn:
+        with pytest.raises(lambda_function.ClusterSaturated):
+            lambda_function.check_wlm_capacity(conn)
+        cluster.wlm_queued = lambda_function.MAINTENANCE_MAX_QUEUED - 1
+        lambda_function.check_wlm_capacity(conn)
+
+
+@pytest.mark.parametrize('run_async', [False, True])
+def test_analyze_is_deferred_while_queues_are_backed_up(stand_in, context, run_async):
+    lambda_function, cluster = stand_in
+    cluster.wlm_queued = lambda_function.MAINTENANCE_MAX_QUEUED + 3
+    table = stale_table(cluster)
+
+    deferred = lambda_function.check_table_metadata(table, run_async=run_async, context=context)
+
+    assert deferred['analyze']['coordination'] == 'saturated'
+    assert 'Retry once the queues drain' in deferred['message']
+    assert cluster.counters['maintenance'] == 0
+    assert not lambda_function.take_maintained_tables()
+
+    cluster.wlm_queued = 0
+    assert lambda_function.check_table_metadata(table, run_async=run_async, context=context)['analyze']['coordination'] == 'ran'